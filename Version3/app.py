@@ -1,42 +1,50 @@
 import os
-import sqlite3
+import time
+import queue
+import threading
 from datetime import datetime
 from io import BytesIO
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from openai import OpenAI
-import gradio as gr
-import tempfile
-import PyPDF2
-
-# Ensure OpenAI API key is set
-# api_key = os.getenv("OPENAI_API_KEY")
-api_key = ''
-if not api_key:
-    raise ValueError("请设置环境变量 OPENAI_API_KEY 以使用本应用。")
-# Initialize OpenAI client
-client = OpenAI(api_key=api_key)
+from functools import lru_cache
+from db import HistoryDB
+from llm_cache import LLMCache, cache_key
+from summarizer import condense_transcript
+from report_renderer import ReportRenderer, build_report
+from pdf_extractor import PdfExtractor
+from rate_limiter import RateLimitedOpenAI
+from metrics import PIPELINE_SECONDS, serve_metrics, timed
+from transcription import transcribe_recording
+from stage_graph import StageGraph, critical_path
+
+# Importing this module (as ingest.py does) loads no numpy, scipy, tiktoken, gradio, ReportLab, PyPDF2,
+# pydub or OpenAI client and writes nothing to disk: caches, workers and indexes are created on first
+# use, and the history database is opened by its first query
+
+def require_api_key():
+    """
+    Ensure the OpenAI API key is set before anything is started
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("请设置环境变量 OPENAI_API_KEY 以使用本应用。")
+
+# OpenAI client, created on first call; every call goes through the shared rate limits and retries
+client = RateLimitedOpenAI()
 
 # Database setup
 DB_PATH = "assistant.db"
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-c = conn.cursor()
-# History table
-c.execute('''CREATE TABLE IF NOT EXISTS history (
-    id INTEGER PRIMARY KEY,
-    doctor TEXT,
-    patient TEXT,
-    date TEXT,
-    transcript TEXT,
-    summary TEXT,
-    diseases TEXT
-)''')
-conn.commit()
+db = HistoryDB(DB_PATH)
+
+SUMMARY_MODEL = "gpt-4o"
+SUMMARY_PROMPT_VERSION = "summarize-v1"  # bump when the prompt below changes
+
+# Summary embeddings of past sessions, for finding similar ones
+SESSION_INDEX_DIR = os.getenv("SESSION_INDEX_DIR", "session_index")
+EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_SIMILAR_K = 5
 
 # Internationalization
 i18n = {
     '中文': {
-        'new': '新对话', 'history': '历史记录',
+        'new': '新对话', 'history': '历史记录', 'session_id': '会话编号', 'similar': '相似会话',
         'doctor': '医生姓名', 'patient': '病人姓名', 'date': '日期',
         'audio': '录制/上传音频', 'file': '上传文件', 'submit': '提交',
         'transcript': '转录文本', 'summary': '医用总结', 'download': '下载文档',
@@ -46,7 +54,7 @@ i18n = {
         
     },
     'English': {
-        'new': 'New Conversation', 'history': 'History',
+        'new': 'New Conversation', 'history': 'History', 'session_id': 'Session ID', 'similar': 'Similar Sessions',
         'doctor': 'Doctor Name', 'patient': 'Patient Name', 'date': 'Date',
         'audio': 'Record/Upload Audio', 'file': 'Upload File', 'submit': 'Submit',
         'transcript': 'Transcript', 'summary': 'Medical Summary', 'download': 'Download PDF',
@@ -60,31 +68,80 @@ i18n = {
 # Audio transcription (Whisper)
 def transcribe_audio(audio_path, file_obj):
     if audio_path:
-        f = open(audio_path, 'rb')
+        path = audio_path
     elif file_obj:
-        f = open(file_obj.name, 'rb')
+        path = file_obj.name
     else:
         return ""
-    resp = client.audio.transcriptions.create(
-        file=f,
-        model="whisper-1"
-    )
-    f.close()
-    return resp.text
+    # Downsampled to 16 kHz with long pauses cut, and sent as MP3 chunks under Whisper's 25 MB limit
+    segments = transcribe_recording(path, whisper)
+    return " ".join(text for _, _, text in segments if text)
+
+def whisper(file):
+    return client.transcribe(file, model="whisper-1", response_format="verbose_json")
 
 # Summarize and extract possible diagnoses
-def summarize_and_extract(text, info):
-    prompt = (
+def summary_prompt(text, info):
+    return (
         f"Patient Info: {info}\n"
         f"Transcript: {text}\n"
         "Please summarize the above dialogue in a medical report style and list possible diagnoses."
     )
-    resp = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}]
+
+# One model call for the map-reduce steps of long transcripts
+def complete_notes(system_prompt, text):
+    resp = client.chat(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ]
     )
     return resp.choices[0].message.content
 
+def summarize_and_extract(text, info, bypass_cache=False):
+    prompt = summary_prompt(text, info)
+    key = cache_key(SUMMARY_MODEL, SUMMARY_PROMPT_VERSION, prompt)
+    if not bypass_cache:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            return cached
+    # Transcripts too long for one prompt are condensed chunk by chunk first
+    with timed("condense"):
+        prompt = summary_prompt(condense_transcript(text, complete_notes), info)
+    with timed("summarize"):
+        resp = client.chat(
+            model=SUMMARY_MODEL,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    summary = resp.choices[0].message.content
+    get_llm_cache().set(key, summary)
+    return summary
+
+# Streaming variant: yields the summary accumulated so far as tokens arrive
+def summarize_and_extract_stream(text, info, bypass_cache=False):
+    prompt = summary_prompt(text, info)
+    key = cache_key(SUMMARY_MODEL, SUMMARY_PROMPT_VERSION, prompt)
+    if not bypass_cache:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            yield cached
+            return
+    with timed("condense"):
+        prompt = summary_prompt(condense_transcript(text, complete_notes), info)
+    summary = ""
+    for delta in client.chat_stream(
+        model=SUMMARY_MODEL,
+        messages=[{"role": "user", "content": prompt}]
+    ):
+        summary += delta
+        yield summary
+    get_llm_cache().set(key, summary)
+
+# Lines of the summary that name possible diagnoses
+def extract_diseases(summary):
+    return [l for l in summary.splitlines() if 'possible' in l.lower() or '可能' in l]
+
 # File reading
 def handle_uploaded_file(file):
     if file is None:
@@ -94,37 +151,233 @@ def handle_uploaded_file(file):
         with open(file.name, "r", encoding="utf-8") as f:
             return f.read()
     elif ext == ".pdf":
-        reader = PyPDF2.PdfReader(file.name)
-        return "\n".join([page.extract_text() or "" for page in reader.pages])
+        return "\n".join(get_pdf_extractor().pages(file.name))
     return "❌ Unsupported file format. Please upload PDF or TXT."
 
 
 # Generate downloadable PDF report
 def generate_report(info, transcript, summary, session_id, knowledge=[]):
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer)
-    styles = getSampleStyleSheet()
-    story = []
-    story.append(Paragraph(f"Session #{session_id} — Patient Info: {info}", styles['Title']))
-    story.append(Spacer(1,12))
-    story.append(Paragraph("Transcript:", styles['Heading2']))
-    story.append(Paragraph(transcript.replace("\n","<br/>"), styles['BodyText']))
-    story.append(Spacer(1,12))
-    story.append(Paragraph("Summary & Possible Diagnoses:", styles['Heading2']))
-    story.append(Paragraph(summary.replace("\n","<br/>"), styles['BodyText']))
-    story.append(Spacer(1,12))
-    if knowledge:
-        story.append(Paragraph("Related Knowledge:", styles['Heading2']))
-        for q, a in knowledge:
-            story.append(Paragraph(f"Q: {q}", styles['BodyText']))
-            story.append(Paragraph(f"A: {a}", styles['BodyText']))
-            story.append(Spacer(1,8))
-    doc.build(story)
+    build_report(buffer, info, transcript, summary, session_id, knowledge)
     buffer.seek(0)
     return buffer
 
+def run_new_session(doc_name, pat_name, date_str, audio_path, file_upload, manual_text, on_summary=None, on_done=None):
+    """
+    Transcribe, summarize, save, index and render one new session as a stage graph:
+    each stage starts once its inputs exist, so the session is saved and its transcript pages are
+    rendered while the summary is written, and the summary is indexed while the PDF is finished.
+    If a stage fails before the summary is saved, the half-saved session is deleted again
+    Args:
+        on_summary: called with the summary so far as it streams in
+        on_done: called as on_done(stage name, context) as each stage finishes
+    Returns:
+        The context: transcript, summary, session_id and pdf_path
+    """
+    info = f"Doctor: {doc_name}; Patient: {pat_name}; Date: {date_str}"
+
+    def transcribe(context):
+        if manual_text.strip():
+            return {"transcript": manual_text}
+        return {"transcript": transcribe_audio(audio_path, file_upload)}
+
+    def summarize(context):
+        summary = ""
+        for summary in summarize_and_extract_stream(context["transcript"], info):
+            if on_summary:
+                on_summary(summary)
+        return {"summary": summary}
+
+    def save(context):
+        # Save to history; the id comes from the insert itself, and the summary is filled in once written
+        session_id = db.add_session(doc_name, pat_name, date_str, context["transcript"], "", "")
+        return {"session_id": session_id}
+
+    def save_summary(context):
+        diseases = extract_diseases(context["summary"])
+        db.set_summary(context["session_id"], context["summary"], ','.join(diseases))
+
+    def index(context):
+        index_session(context["session_id"], context["summary"])
+
+    def render_skeleton(context):
+        # Title and transcript pages, laid out in the process pool before the summary exists
+        future = get_report_renderer().submit_skeleton(info, context["transcript"], context["session_id"])
+        return {"skeleton_path": future.result()}
+
+    def render_pdf(context):
+        # Only the summary pages are left to render; repeat downloads come from the report cache
+        return {"pdf_path": get_report_renderer().render(
+            info, context["transcript"], context["summary"], context["session_id"], skeleton=context["skeleton_path"]
+        )}
+
+    graph = StageGraph([
+        ("transcribe", transcribe, ()),
+        ("summarize", summarize, ("transcribe",)),
+        ("save", save, ("transcribe",)),
+        ("save_summary", save_summary, ("save", "summarize")),
+        ("index", index, ("save_summary",)),
+        ("render_skeleton", render_skeleton, ("save",)),
+        ("render_pdf", render_pdf, ("save_summary", "render_skeleton")),
+    ])
+    context = {}
+    try:
+        timings = graph.run(context, on_done)
+    except Exception:
+        if "session_id" in context:
+            # Otherwise a session without summary stays in the history and is never indexed
+            db.discard_unsummarized(context["session_id"])
+            skeleton_path = get_report_renderer().skeleton_path(context["session_id"])
+            if os.path.exists(skeleton_path):
+                os.remove(skeleton_path)
+        raise
+    path, seconds = critical_path(timings, graph.needs)
+    stage_seconds = sum(end - start for start, end in timings.values())
+    PIPELINE_SECONDS.observe(seconds, kind="critical_path")
+    PIPELINE_SECONDS.observe(stage_seconds, kind="stage_sum")
+    print(f"Session {context['session_id']} done in {seconds:.2f} s on {' -> '.join(path)} "
+          f"({stage_seconds:.2f} s of stages)")
+    return context
+
+
+@lru_cache(maxsize=None)
+def get_llm_cache():
+    """
+    The cache of LLM summaries, keyed on model + prompt version + input; opened on first use
+    """
+    return LLMCache()
+
+
+@lru_cache(maxsize=None)
+def get_report_renderer():
+    """
+    The renderer of session PDFs, which runs off the UI thread and caches them on disk by content
+    """
+    return ReportRenderer()
+
+
+@lru_cache(maxsize=None)
+def get_pdf_extractor():
+    """
+    The parser of uploaded PDFs, page by page in a process pool, with text cached by file hash
+    """
+    return PdfExtractor()
+
+
+@lru_cache(maxsize=None)
+def get_session_index():
+    """
+    The session index, opened (memory-mapping its files) on first use
+    """
+    from vector_index import VectorIndex
+    return VectorIndex(SESSION_INDEX_DIR)
+
+
+def index_session(session_id, summary):
+    """
+    Embed a session summary and add it to the session index
+    Args:
+        session_id: history row id
+        summary: the session summary
+    Returns:
+        True if the summary was indexed
+    """
+    try:
+        with timed("embed_summary"):
+            vector = client.embed([summary], model=EMBEDDING_MODEL)[0]
+        get_session_index().add(int(session_id), vector)
+        return True
+    except Exception as e:
+        print(f"Error indexing session {session_id}: {str(e)}")
+        return False
+
+
+def index_missing_sessions(batch_size=256):
+    """
+    Index every summary in the history that is not in the session index yet
+    Args:
+        batch_size: summaries embedded per request
+    Returns:
+        Number of sessions indexed
+    """
+    session_index = get_session_index()
+    missing = [(session_id, summary) for session_id, summary in db.summaries() if session_id not in session_index]
+    added = 0
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        try:
+            vectors = client.embed([summary for _, summary in batch], model=EMBEDDING_MODEL)
+            session_index.add_many([session_id for session_id, _ in batch], vectors)
+            added += len(batch)
+        except Exception as e:
+            print(f"Error indexing sessions: {str(e)}")
+    if added:
+        print(f"Session index backfilled: {added} summaries")
+    return added
+
+
+def similar_sessions(session_id, k=DEFAULT_SIMILAR_K):
+    """
+    Find the past sessions whose summaries are closest to a session's
+    Args:
+        session_id: history row id
+        k: number of sessions to return
+    Returns:
+        List of (id, date, patient, score), most similar first
+    """
+    session_id = int(session_id)
+    session_index = get_session_index()
+    if session_id not in session_index:
+        row = db.get_session(session_id)
+        if not row or not row[5] or not index_session(session_id, row[5]):
+            return []
+    with timed("similar_search"):
+        matches = session_index.search(session_index.get(session_id), k, exclude=[session_id])
+    scores = dict(matches)
+    return [(rid, dt, pt, round(scores[rid], 3)) for rid, dt, pt in db.sessions_by_ids([rid for rid, _ in matches])]
+
+
+# Start-up work done in the background once the UI is up; METRICS_PORT serves it at /ready
+WARM_UP_STEPS = ["history_db", "session_index", "report_renderer"]
+warm_up_status = {"status": "warming_up", "steps": {name: {"status": "pending"} for name in WARM_UP_STEPS}}
+
+
+def warm_up():
+    """
+    Open the history, load and backfill the session index and start the PDF workers
+    """
+    started = time.monotonic()
+    steps = {
+        "history_db": db.list_sessions,
+        # Sessions saved before summaries were embedded on save
+        "session_index": index_missing_sessions,
+        "report_renderer": lambda: get_report_renderer().warm_up(),
+    }
+    for name in WARM_UP_STEPS:
+        step = warm_up_status["steps"][name]
+        step["status"] = "running"
+        start = time.monotonic()
+        try:
+            steps[name]()
+        except Exception as e:
+            step["status"] = "failed"
+            warm_up_status.update(status="failed", error=f"{name}: {e}")
+            print(f"Error warming up {name}: {e}")
+            return
+        step.update(status="done", seconds=round(time.monotonic() - start, 3))
+    warm_up_status.update(status="ready", ready_after_seconds=round(time.monotonic() - started, 3))
+
+
+def readiness():
+    """
+    (ready, status) for the /ready probe
+    """
+    return warm_up_status["status"] == "ready", warm_up_status
+
+
 # Build Gradio UI
 def build_ui():
+    import gradio as gr
     with gr.Blocks() as demo:
         # Language selector
         lang = gr.Radio(choices=['中文', 'English'], value='中文', label="Language")
@@ -153,50 +406,51 @@ def build_ui():
                     outputs=text_input
                 )
 
-                import tempfile
-
                 def new_conversation(lang_sel, doc_name, pat_name, date_str, audio_path, file_upload, manual_text):
-                    if manual_text.strip():
-                        transcript = manual_text
-                    else:
-                        transcript = transcribe_audio(audio_path, file_upload)
-                        
-                    # Transcription and summary
-                    info = f"Doctor: {doc_name}; Patient: {pat_name}; Date: {date_str}"
-                    # transcript = transcribe_audio(audio_path, file_upload)
-                    summary = summarize_and_extract(transcript, info)
-                    
-                    c.execute("SELECT MAX(id) FROM history")
-                    last_id = c.fetchone()[0] or 0
-                    session_id = last_id + 1
-
-                    # Save to history
-                    diseases = [l for l in summary.splitlines() if 'possible' in l.lower() or '可能' in l]
-                    c.execute(
-                        "INSERT INTO history (id, doctor, patient, date, transcript, summary, diseases) VALUES (?,?,?,?,?,?,?)",
-                        (session_id, doc_name, pat_name, date_str, transcript, summary, ','.join(diseases))
-                    )
-                    conn.commit()
-
-                    # Generate PDF in memory
-                    pdf_buffer = generate_report(info, transcript, summary, session_id)
-
-                    # Write to temporary file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                        tmp.write(pdf_buffer.read())
-                        tmp_path = tmp.name
-                    
-                    # Markdown Summary: 显示 session 编号
-                    md_summary = f"**This conversation is Session #{session_id}**\n\n{summary}"
-
-                    return (
-                        transcript,
-                        summary,
-                        gr.update(value=tmp_path, visible=True),
-                        gr.update(value=md_summary, visible=True),   # 格式化 Markdown 展示
-                        gr.update(value=summary, visible=True)    # 文本框可编辑
-                        
-                    )
+                    # The stage graph runs on its own threads; its progress comes back through this queue
+                    events = queue.Queue()
+
+                    def run():
+                        try:
+                            run_new_session(
+                                doc_name, pat_name, date_str, audio_path, file_upload, manual_text,
+                                on_summary=lambda summary: events.put(("summary", summary)),
+                                on_done=lambda name, context: events.put((name, dict(context)))
+                            )
+                        except Exception as e:
+                            events.put(("error", e))
+
+                    threading.Thread(target=run, daemon=True).start()
+                    transcript = ""
+                    while True:
+                        kind, value = events.get()
+                        if kind == "error":
+                            raise value
+                        if kind == "transcribe":
+                            transcript = value["transcript"]
+                            yield transcript, "", gr.update(), gr.update(), gr.update()
+                        elif kind == "summary":
+                            # Stream the summary into the UI as tokens arrive
+                            yield (
+                                transcript,
+                                value,
+                                gr.update(),
+                                gr.update(value=value, visible=True),
+                                gr.update()
+                            )
+                        elif kind == "render_pdf":
+                            # Indexing may still be running; the UI does not wait for it
+                            summary, session_id = value["summary"], value["session_id"]
+                            # Markdown Summary: 显示 session 编号
+                            md_summary = f"**This conversation is Session #{session_id}**\n\n{summary}"
+                            yield (
+                                transcript,
+                                summary,
+                                gr.update(value=value["pdf_path"], visible=True),
+                                gr.update(value=md_summary, visible=True),   # 格式化 Markdown 展示
+                                gr.update(value=summary, visible=True)    # 文本框可编辑
+                            )
+                            return
 
 
 
@@ -209,13 +463,16 @@ def build_ui():
             with gr.Tab(i18n['中文']['history']) as history_tab:
                 hist_btn = gr.Button(value=i18n['中文']['history'])
                 history_table = gr.Dataframe(visible=False)
+                with gr.Row():
+                    similar_id = gr.Number(label=i18n['中文']['session_id'], precision=0)
+                    similar_btn = gr.Button(value=i18n['中文']['similar'])
+                similar_table = gr.Dataframe(visible=False)
 
                 def view_history(lang_sel):
                     labels = i18n[lang_sel]
                     history_tab.update(label=labels['history'])
                     hist_btn.update(value=labels['history'])
-                    c.execute("SELECT id, date, patient FROM history ORDER BY id DESC")
-                    rows = c.fetchall()
+                    rows = db.list_sessions()
                     return gr.Dataframe.update(
                         value=[[rid, dt, pt] for rid, dt, pt in rows],
                         headers=["ID", "Date", "Patient"],
@@ -227,6 +484,20 @@ def build_ui():
                     inputs=[lang],
                     outputs=[history_table]
                 )
+
+                def view_similar(session_id):
+                    rows = similar_sessions(session_id) if session_id else []
+                    return gr.Dataframe.update(
+                        value=[list(row) for row in rows],
+                        headers=["ID", "Date", "Patient", "Score"],
+                        visible=True
+                    )
+
+                similar_btn.click(
+                    fn=view_similar,
+                    inputs=[similar_id],
+                    outputs=[similar_table]
+                )
         # Language switch callback
         def update_labels(lang_sel):
             labels = i18n[lang_sel]
@@ -245,16 +516,26 @@ def build_ui():
                 gr.update(value=labels['history']),   # hist_btn
                 gr.update(label=labels['text_input']),
                 gr.update(label=labels['md_preview']),
-                gr.update(label=labels['md_editor'])
+                gr.update(label=labels['md_editor']),
+                gr.update(label=labels['session_id']),  # similar_id
+                gr.update(value=labels['similar'])      # similar_btn
 
             ]
 
         lang.change(
             fn=update_labels,
             inputs=[lang],
-            outputs=[new_tab, history_tab, doctor, patient, date, audio, file_obj, btn, transcript_out, summary_out, pdf_file, hist_btn, text_input, summary_md, summary_editor]
+            outputs=[new_tab, history_tab, doctor, patient, date, audio, file_obj, btn, transcript_out, summary_out, pdf_file, hist_btn, text_input, summary_md, summary_editor, similar_id, similar_btn]
         )
         return demo
 
-app = build_ui()
-app.launch()
+if __name__ == "__main__":
+    require_api_key()
+    # Prometheus metrics and the /ready probe on a separate port, e.g. METRICS_PORT=9100
+    if os.getenv("METRICS_PORT"):
+        serve_metrics(int(os.getenv("METRICS_PORT")), readiness=readiness)
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    app = build_ui()
+    # Generator handlers (streamed summaries) need the queue
+    app.queue()
+    app.launch()
@@ -0,0 +1,165 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Statements are module constants so sqlite3's per-connection statement
+# cache prepares each one once per thread
+CREATE_HISTORY = '''CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doctor TEXT,
+    patient TEXT,
+    date TEXT,
+    transcript TEXT,
+    summary TEXT,
+    diseases TEXT
+)'''
+INSERT_SESSION = "INSERT INTO history (doctor, patient, date, transcript, summary, diseases) VALUES (?,?,?,?,?,?)"
+UPDATE_SUMMARY = "UPDATE history SET summary = ?, diseases = ? WHERE id = ?"
+DELETE_UNSUMMARIZED = "DELETE FROM history WHERE id = ? AND summary = ''"
+SELECT_SESSIONS = "SELECT id, date, patient FROM history ORDER BY id DESC"
+SELECT_SESSION = "SELECT id, doctor, patient, date, transcript, summary, diseases FROM history WHERE id = ?"
+# Sessions backfilled from files carry the sha256 of their source, so re-runs skip them
+ADD_SOURCE_HASH = "ALTER TABLE history ADD COLUMN source_sha256 TEXT"
+CREATE_SOURCE_HASH_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_history_source_sha256 ON history(source_sha256) WHERE source_sha256 IS NOT NULL"
+INSERT_INGESTED = "INSERT OR IGNORE INTO history (doctor, patient, date, transcript, summary, diseases, source_sha256) VALUES (?,?,?,?,?,?,?)"
+SELECT_SOURCE_HASHES = "SELECT source_sha256 FROM history WHERE source_sha256 IS NOT NULL"
+SELECT_SUMMARIES = "SELECT id, summary FROM history WHERE summary IS NOT NULL AND summary != '' ORDER BY id"
+SELECT_SESSIONS_BY_IDS = "SELECT id, date, patient FROM history WHERE id IN ({})"
+
+
+class HistoryDB:
+    """
+    Data access for the session history table
+
+    Each thread gets its own connection, so Gradio workers never share a
+    cursor. WAL mode lets history reads proceed while a session is being
+    written, and ids come from the INSERT itself rather than SELECT MAX(id),
+    so concurrent submissions cannot collide.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # Nothing is opened until the first query, so importing the app touches no files
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, cached_statements=128, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(CREATE_HISTORY)
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(history)")]
+                if "source_sha256" not in columns:
+                    conn.execute(ADD_SOURCE_HASH)
+                conn.execute(CREATE_SOURCE_HASH_INDEX)
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            self._schema_ready = True
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block of statements in one write transaction, committed once at the end
+        """
+        conn = self.conn
+        # Take the write lock up front so the transaction cannot deadlock upgrading from a read
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def add_session(self, doctor, patient, date, transcript, summary, diseases):
+        """
+        Insert one session and return its id
+        """
+        return self.add_sessions([(doctor, patient, date, transcript, summary, diseases)])[0]
+
+    def add_sessions(self, sessions):
+        """
+        Insert many sessions in a single transaction
+        Args:
+            sessions: Iterable of (doctor, patient, date, transcript, summary, diseases)
+        Returns:
+            List of the new session ids, in order
+        """
+        with self.transaction() as conn:
+            return [conn.execute(INSERT_SESSION, session).lastrowid for session in sessions]
+
+    def set_summary(self, session_id, summary, diseases):
+        """
+        Fill in the summary and diseases of a session saved before its summary was written
+        """
+        with self.transaction() as conn:
+            conn.execute(UPDATE_SUMMARY, (summary, diseases, session_id))
+
+    def discard_unsummarized(self, session_id):
+        """
+        Delete a session saved before its summary was written, unless the summary has been filled in since
+        Returns:
+            True if the session was deleted
+        """
+        with self.transaction() as conn:
+            return conn.execute(DELETE_UNSUMMARIZED, (session_id,)).rowcount > 0
+
+    def add_ingested(self, sessions):
+        """
+        Insert sessions backfilled from files in a single transaction
+        Args:
+            sessions: Iterable of (doctor, patient, date, transcript, summary, diseases, source_sha256)
+        Returns:
+            Number of sessions inserted; sources already in the table are ignored
+        """
+        with self.transaction() as conn:
+            return sum(conn.execute(INSERT_INGESTED, session).rowcount for session in sessions)
+
+    def ingested_hashes(self):
+        """
+        Return the set of source hashes already in the history table
+        """
+        return {row[0] for row in self.conn.execute(SELECT_SOURCE_HASHES)}
+
+    def list_sessions(self):
+        """
+        Return (id, date, patient) for every session, newest first
+        """
+        return self.conn.execute(SELECT_SESSIONS).fetchall()
+
+    def summaries(self):
+        """
+        Return (id, summary) for every session that has a summary, oldest first
+        """
+        return self.conn.execute(SELECT_SUMMARIES).fetchall()
+
+    def sessions_by_ids(self, session_ids):
+        """
+        Return (id, date, patient) for the given sessions, in the order of session_ids
+        """
+        session_ids = [int(session_id) for session_id in session_ids]
+        if not session_ids:
+            return []
+        rows = self.conn.execute(SELECT_SESSIONS_BY_IDS.format(",".join("?" * len(session_ids))), session_ids).fetchall()
+        by_id = {row[0]: row for row in rows}
+        return [by_id[session_id] for session_id in session_ids if session_id in by_id]
+
+    def get_session(self, session_id):
+        return self.conn.execute(SELECT_SESSION, (session_id,)).fetchone()
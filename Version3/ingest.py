@@ -0,0 +1,147 @@
+"""
+Backfill the session history from a directory of recordings and notes
+
+    python ingest.py /archive/sessions --doctor "Dr. Lee" --workers 4 --rpm 60
+
+Audio files are transcribed with Whisper; PDF and TXT notes are read as
+transcripts. Each file becomes one history session, with the patient taken
+from its parent directory (or file name, for files at the top level) and the
+date from its modification time.
+
+Progress is checkpointed in the history DB itself: every session stores the
+sha256 of its source file and batches are committed together, so an
+interrupted run resumes where it stopped, and files already ingested (even
+under another name) are skipped. Files that fail are reported and retried on
+the next run.
+"""
+import os
+import sys
+import argparse
+from datetime import datetime
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app import (DB_PATH, client, db, extract_diseases, handle_uploaded_file, index_missing_sessions,
+                 require_api_key, summarize_and_extract, transcribe_audio)
+from db import HistoryDB
+from pdf_extractor import file_sha256
+from rate_limiter import TokenBucket
+
+AUDIO_EXTENSIONS = {".mp3", ".mp4", ".mpeg", ".mpga", ".m4a", ".wav", ".webm", ".ogg", ".flac"}
+TEXT_EXTENSIONS = {".pdf", ".txt"}
+
+
+def find_sources(root):
+    """
+    Return the paths of all ingestible files under root, in a stable order
+    """
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in AUDIO_EXTENSIONS or ext in TEXT_EXTENSIONS:
+                sources.append(os.path.join(dirpath, name))
+    return sources
+
+
+def patient_for(root, path):
+    parent = os.path.relpath(os.path.dirname(path), root)
+    if parent == ".":
+        return os.path.splitext(os.path.basename(path))[0]
+    return parent.split(os.sep)[0]
+
+
+def ingest_file(path, root, doctor):
+    """
+    Transcribe (or read) and summarize one file
+    Returns:
+        (doctor, patient, date, transcript, summary, diseases) ready for the history table
+    """
+    patient = patient_for(root, path)
+    date = datetime.fromtimestamp(os.path.getmtime(path)).date().isoformat()
+    ext = os.path.splitext(path)[1].lower()
+    if ext in AUDIO_EXTENSIONS:
+        transcript = transcribe_audio(path, None)
+    else:
+        transcript = handle_uploaded_file(SimpleNamespace(name=path))
+    if not transcript.strip():
+        raise ValueError("no text found")
+
+    info = f"Doctor: {doctor}; Patient: {patient}; Date: {date}"
+    summary = summarize_and_extract(transcript, info)
+    return (doctor, patient, date, transcript, summary, ','.join(extract_diseases(summary)))
+
+
+def ingest(root, history, doctor, workers, batch_size, dry_run=False):
+    """
+    Ingest every new file under root into the history DB
+    Returns:
+        Dict of counts: found, skipped, ingested, failed
+    """
+    sources = find_sources(root)
+    done = history.ingested_hashes()
+    pending = []
+    seen = set()
+    for path in sources:
+        sha256 = file_sha256(path)
+        # Skip files already in the DB, and copies of the same file within this run
+        if sha256 not in done and sha256 not in seen:
+            pending.append((path, sha256))
+            seen.add(sha256)
+    stats = {"found": len(sources), "skipped": len(sources) - len(pending), "ingested": 0, "failed": 0}
+    print(f"{stats['found']} files found, {stats['skipped']} already ingested or duplicates, {len(pending)} to process")
+    if dry_run:
+        for path, _ in pending:
+            print(path)
+        return stats
+
+    batch = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(ingest_file, path, root, doctor): (path, sha256) for path, sha256 in pending}
+        for future in as_completed(futures):
+            path, sha256 = futures[future]
+            try:
+                batch.append(future.result() + (sha256,))
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"Error ingesting {path}: {str(e)}")
+                continue
+            print(f"[{stats['ingested'] + len(batch) + stats['failed']}/{len(pending)}] {path}")
+            if len(batch) >= batch_size:
+                stats["ingested"] += history.add_ingested(batch)
+                batch = []
+    if batch:
+        stats["ingested"] += history.add_ingested(batch)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the session history from a directory of recordings and notes")
+    parser.add_argument("directory", help="directory to walk for audio, PDF and TXT files")
+    parser.add_argument("--doctor", default="", help="doctor name recorded on every session")
+    parser.add_argument("--db", default=DB_PATH, help="history database (default: the app's)")
+    parser.add_argument("--workers", type=int, default=4, help="files processed concurrently")
+    parser.add_argument("--rpm", type=float, help="OpenAI requests per minute (default: OPENAI_RPM)")
+    parser.add_argument("--batch-size", type=int, default=20, help="sessions committed per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="list the files that would be ingested")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"not a directory: {args.directory}")
+    if not args.dry_run:
+        require_api_key()
+    if args.rpm:
+        # Every call made by the app's functions already goes through this client's buckets
+        client.requests_bucket = TokenBucket(args.rpm)
+    history = db if args.db == DB_PATH else HistoryDB(args.db)
+    stats = ingest(args.directory, history, args.doctor, args.workers, args.batch_size, args.dry_run)
+    print(f"Done: {stats['ingested']} ingested, {stats['skipped']} skipped, {stats['failed']} failed")
+    if history is db and stats["ingested"]:
+        # Make the new sessions findable from the history tab's similar-session lookup
+        index_missing_sessions()
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
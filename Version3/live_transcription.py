@@ -0,0 +1,279 @@
+import os
+import io
+import time
+import queue
+import threading
+from metrics import AUDIO_SECONDS, timed
+from vad import TARGET_SAMPLE_RATE, load_audio, resample
+
+# Audio is cut into segments of this length as it is recorded; consecutive segments share the
+# overlap, so a word cut at one segment's edge is heard whole by the next
+SEGMENT_SECONDS = float(os.getenv("LIVE_SEGMENT_SECONDS", "10"))
+OVERLAP_SECONDS = float(os.getenv("LIVE_OVERLAP_SECONDS", "2"))
+# Segments in flight to Whisper at once; results are still committed in order
+TRANSCRIPTION_WORKERS = int(os.getenv("LIVE_TRANSCRIPTION_WORKERS", "2"))
+# Segments quieter than this RMS (~-50 dBFS) are not sent to Whisper
+MIN_RMS = 0.003
+# Characters of committed transcript passed to Whisper as context for the next segment
+PROMPT_CHARS = 200
+
+
+class RingBuffer:
+    """
+    Fixed-size ring of float32 samples that cuts overlapping segments as audio is written
+    Args:
+        on_segment: called as on_segment(index, start seconds, samples) for every full segment
+        sample_rate: sample rate of the audio written
+        segment_seconds: segment length; a new one starts every segment - overlap seconds
+        overlap_seconds: audio shared by consecutive segments
+    """
+
+    def __init__(self, on_segment, sample_rate, segment_seconds=SEGMENT_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+        if not 0 <= overlap_seconds < segment_seconds:
+            raise ValueError("Overlap must be shorter than the segment")
+        self.on_segment = on_segment
+        self.sample_rate = sample_rate
+        self.segment = int(segment_seconds * sample_rate)
+        self.overlap = int(overlap_seconds * sample_rate)
+        self.hop = self.segment - self.overlap
+        # numpy and scipy are loaded by the first recording, not by importing the module
+        import numpy as np
+        # One segment plus one hop: memory does not grow with the length of the recording
+        self._ring = np.zeros(self.segment + self.hop, dtype=np.float32)
+        self.written = 0
+        self.next_start = 0
+        self.index = 0
+
+    def write(self, samples):
+        """
+        Append samples; cheap enough to call from the audio callback
+        """
+        # At most one hop at a time, so unread audio is never overwritten
+        for offset in range(0, len(samples), self.hop):
+            piece = samples[offset:offset + self.hop]
+            position = self.written % len(self._ring)
+            first = min(len(piece), len(self._ring) - position)
+            self._ring[position:position + first] = piece[:first]
+            self._ring[:len(piece) - first] = piece[first:]
+            self.written += len(piece)
+            while self.written >= self.next_start + self.segment:
+                self._emit(self.segment)
+
+    def flush(self):
+        """
+        Emit the audio after the last full segment, if any of it is new, as a shorter final segment
+        """
+        if self.written > self.next_start + (self.overlap if self.index else 0):
+            self._emit(self.written - self.next_start)
+
+    def _emit(self, length):
+        import numpy as np
+        positions = (self.next_start + np.arange(length)) % len(self._ring)
+        self.on_segment(self.index, self.next_start / self.sample_rate, self._ring[positions])
+        self.index += 1
+        self.next_start += self.hop
+
+
+def _field(segment, name):
+    if isinstance(segment, dict):
+        return segment.get(name)
+    return getattr(segment, name, None)
+
+
+class LiveTranscriber:
+    """
+    Transcribes a recording while it is still being made. Segments cut by the
+    ring buffer go through a queue to worker threads that send them to Whisper;
+    results are committed in order, each Whisper segment kept by the audio
+    segment that owns its midpoint, so overlaps are not transcribed twice.
+    Args:
+        client: RateLimitedOpenAI
+        sample_rate: sample rate of the audio fed in
+        on_update: called as on_update(new segments, transcript so far) from a worker thread
+    """
+
+    def __init__(self, client, sample_rate, on_update=None, segment_seconds=SEGMENT_SECONDS,
+                 overlap_seconds=OVERLAP_SECONDS, workers=TRANSCRIPTION_WORKERS):
+        self.client = client
+        self.sample_rate = sample_rate
+        self.on_update = on_update
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        # (start, end, text) in seconds from the start of the recording
+        self.segments = []
+        self._buffer = RingBuffer(self._enqueue, sample_rate, segment_seconds, overlap_seconds)
+        self._queue = queue.Queue()
+        self._results = {}
+        self._committed = 0
+        self._total = None
+        # Whisper segments past the last committed segment's share; kept if no segment follows it
+        self._tail = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def transcript(self):
+        return " ".join(text for _, _, text in self.segments if text)
+
+    def callback(self, indata, frames, time_info, status):
+        """
+        sounddevice InputStream callback
+        """
+        if status:
+            print(f"Recording status: {status}")
+        self.feed(indata[:, 0])
+
+    def feed(self, samples):
+        import numpy as np
+        AUDIO_SECONDS.inc(len(samples) / self.sample_rate, kind="received")
+        self._buffer.write(np.asarray(samples, dtype=np.float32))
+
+    def finish(self, timeout=None):
+        """
+        End of the recording: transcribe the rest and wait for every segment
+        Returns:
+            The full transcript
+        """
+        with self._lock:
+            if self._total is None:
+                self._buffer.flush()
+                self._total = self._buffer.index
+                for _ in self._workers:
+                    self._queue.put(None)
+        self._commit()
+        self._done.wait(timeout)
+        return self.transcript
+
+    def _enqueue(self, index, start, samples):
+        self._queue.put((index, start, samples))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            index, start, samples = item
+            try:
+                result = self._transcribe(start, samples)
+            except Exception as e:
+                # One lost segment leaves a gap rather than ending the recording
+                print(f"Error transcribing live segment {index}: {e}")
+                result = []
+            with self._lock:
+                self._results[index] = (start, result)
+            self._commit()
+
+    def _transcribe(self, start, samples):
+        import numpy as np
+        import scipy.io.wavfile as wav
+        seconds = len(samples) / self.sample_rate
+        samples = resample(samples, self.sample_rate)
+        if np.sqrt(np.mean(np.square(samples, dtype=np.float64))) < MIN_RMS:
+            return []
+        buffer = io.BytesIO()
+        wav.write(buffer, TARGET_SAMPLE_RATE, np.clip(samples * 32767, -32768, 32767).astype(np.int16))
+        # The end of the transcript so far keeps spelling and names consistent across segments
+        context = {"prompt": self.transcript[-PROMPT_CHARS:]} if self.segments else {}
+        with timed("live_whisper"):
+            resp = self.client.transcribe(("segment.wav", buffer.getvalue()), model="whisper-1",
+                                          response_format="verbose_json", **context)
+        AUDIO_SECONDS.inc(seconds, kind="transcribed")
+        segments = getattr(resp, "segments", None)
+        if not segments:
+            return [(start, start + seconds, resp.text.strip())]
+        return [(start + _field(s, "start"), start + _field(s, "end"), _field(s, "text").strip()) for s in segments]
+
+    def _commit(self):
+        # Under the lock, so updates reach on_update in order whichever worker commits them
+        with self._lock:
+            while self._committed in self._results:
+                index = self._committed
+                start, segments = self._results.pop(index)
+                lower = start + self.overlap_seconds / 2 if index else float("-inf")
+                last = self._total is not None and index == self._total - 1
+                upper = float("inf") if last else start + self.segment_seconds - self.overlap_seconds / 2
+                kept, self._tail = [], []
+                for segment in segments:
+                    middle = (segment[0] + segment[1]) / 2
+                    if middle >= upper:
+                        self._tail.append(segment)
+                    elif middle >= lower and segment[2]:
+                        kept.append(segment)
+                self._committed += 1
+                self._publish(kept)
+            if self._total is not None and self._committed == self._total and not self._done.is_set():
+                # The recording ended on a segment that was already committed with a bounded share
+                self._publish([segment for segment in self._tail if segment[2]])
+                self._tail = []
+                self._done.set()
+
+    def _publish(self, segments):
+        if segments:
+            self.segments.extend(segments)
+            if self.on_update:
+                self.on_update(segments, self.transcript)
+
+
+class MicrophoneSource:
+    """
+    Streams blocks from an input device to a sounddevice-style callback
+    """
+
+    def __init__(self, sample_rate=44100, device_id=None, block_seconds=0.1):
+        import sounddevice as sd
+        self.sample_rate = sample_rate
+        self._stream = sd.InputStream(samplerate=sample_rate, channels=1, dtype='float32', device=device_id,
+                                      blocksize=int(sample_rate * block_seconds), callback=self._callback)
+        self._callback_fn = None
+
+    def _callback(self, indata, frames, time_info, status):
+        self._callback_fn(indata, frames, time_info, status)
+
+    def start(self, callback):
+        self._callback_fn = callback
+        self._stream.start()
+
+    def stop(self):
+        self._stream.stop()
+        self._stream.close()
+
+
+class FileReplaySource:
+    """
+    Plays an audio file back in real time through the same callback as the
+    microphone, so live transcription can run without audio hardware
+    Args:
+        path: audio file to replay
+        speed: playback speed, times real time
+    """
+
+    def __init__(self, path, speed=1.0, block_seconds=0.1):
+        self.samples, self.sample_rate = load_audio(path)
+        self.speed = speed
+        self.block = int(self.sample_rate * block_seconds)
+        self.finished = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, callback):
+        self._thread = threading.Thread(target=self._play, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def _play(self, callback):
+        start = time.monotonic()
+        for offset in range(0, len(self.samples), self.block):
+            block = self.samples[offset:offset + self.block]
+            # A block is handed over once it has been "recorded", paced against the start time
+            delay = start + (offset + len(block)) / self.sample_rate / self.speed - time.monotonic()
+            if self._stopped.wait(max(delay, 0)):
+                break
+            callback(block[:, None], len(block), None, None)
+        self.finished.set()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,203 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield from self._samples(key, value)
+
+    def _samples(self, key, value) -> Iterable[str]:
+        yield f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, count, total = self._values.get(key, ([0] * len(self.buckets), 0, 0.0))
+            # A new list, so a render in progress never sees a half-updated one
+            counts = list(counts)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, count + 1, total + value)
+
+    def _samples(self, key, value) -> Iterable[str]:
+        counts, count, total = value
+        for bound, bucket_count in zip(self.buckets, counts):
+            yield f"{self.name}_bucket{_labels(self.label_names, key, [('le', _number(bound))])} {bucket_count}"
+        yield f"{self.name}_bucket{_labels(self.label_names, key, [('le', '+Inf')])} {count}"
+        yield f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}"
+        yield f"{self.name}_count{_labels(self.label_names, key)} {count}"
+
+
+REGISTRY: List[_Metric] = []
+
+STAGE_SECONDS = Histogram("therapy_stage_seconds", "Time spent in each processing stage.", ["stage"])
+STAGE_ERRORS = Counter("therapy_stage_errors_total", "Processing stages that raised.", ["stage"])
+STAGE_IN_FLIGHT = Gauge("therapy_stage_in_flight", "Processing stages currently running.", ["stage"])
+AUDIO_SECONDS = Counter("therapy_audio_seconds_total", "Seconds of audio received, of silence trimmed, and of speech sent to Whisper.", ["kind"])
+OPENAI_REQUESTS = Counter("therapy_openai_requests_total", "OpenAI API requests by endpoint and outcome.", ["endpoint", "outcome"])
+OPENAI_IN_FLIGHT = Gauge("therapy_openai_in_flight", "OpenAI API requests currently in flight.", ["endpoint"])
+OPENAI_TOKENS = Counter("therapy_openai_tokens_total", "Tokens billed by OpenAI, from response usage.", ["model", "kind"])
+PIPELINE_SECONDS = Histogram("therapy_pipeline_seconds", "Per session: critical-path latency of its stage graph, and the sum of its stage times.", ["kind"])
+CACHE_REQUESTS = Counter("therapy_cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"])
+CACHE_HIT_RATIO = Gauge("therapy_cache_hit_ratio", "Share of cache lookups that hit since startup.", ["cache"])
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Time a block as a stage: latency histogram, in-flight gauge and error count
+    Args:
+        stage: stage label, e.g. "whisper" or "summarize"
+    """
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_IN_FLIGHT.dec(stage=stage)
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    hits = CACHE_REQUESTS.value(cache=cache, result="hit")
+    misses = CACHE_REQUESTS.value(cache=cache, result="miss")
+    CACHE_HIT_RATIO.set(hits / (hits + misses), cache=cache)
+
+
+def record_usage(model: str, response):
+    """
+    Count the prompt and completion tokens of an API response that reports usage
+    Args:
+        model: model label for the counter
+        response: OpenAI response; ignored if it has no usage
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+    OPENAI_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+
+
+def render() -> str:
+    """
+    Render every metric
+    Returns:
+        The metrics in the Prometheus text exposition format
+    """
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    readiness = None
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self._send(200, render().encode("utf-8"), CONTENT_TYPE + "; charset=utf-8")
+        elif path == "/ready" and self.readiness is not None:
+            # 503 with the warm-up progress until the app is ready
+            ready, status = self.readiness()
+            self._send(200 if ready else 503, json.dumps(status).encode("utf-8"), "application/json")
+        else:
+            self.send_error(404)
+
+    def _send(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="0.0.0.0", readiness=None):
+    """
+    Serve /metrics for Prometheus from a daemon thread; Gradio's own server has no hook for it
+    Args:
+        port: port to listen on
+        host: interface to bind
+        readiness: function returning (ready, status dict) for a /ready probe, or None for no probe
+    Returns:
+        The running ThreadingHTTPServer
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"readiness": staticmethod(readiness) if readiness else None})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,171 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from metrics import record_cache, timed
+
+PDF_TEXT_CACHE_DIR = os.getenv("PDF_TEXT_CACHE_DIR", "pdf_text_cache")
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Fewest pages parsed per worker task; every task reopens the file, so small PDFs stay whole
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+# Tasks kept in flight per worker; bounds how much parsed text waits in memory
+PDF_PREFETCH = 2
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_range(path, start, stop):
+    """
+    Text of pages start..stop - 1; runs in a worker process
+    """
+    import PyPDF2
+    reader = PyPDF2.PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _done(result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+class PdfExtractor:
+    """
+    Page-level PDF text extraction over a process pool, cached per file hash
+
+    extract() walks a sequence of files in order while page ranges of the
+    current and following files are parsed in the background; only
+    workers * PDF_PREFETCH ranges are in flight at once. Extracted text is
+    kept as <sha256>.jsonl (one page per line) in cache_dir, so a file seen
+    before is read back without parsing it again.
+    """
+
+    def __init__(self, cache_dir=PDF_TEXT_CACHE_DIR, workers=PDF_WORKERS, pages_per_task=PDF_PAGES_PER_TASK):
+        self.cache_dir = cache_dir
+        self.workers = max(1, workers)
+        self.pages_per_task = max(1, pages_per_task)
+        self._pool = None
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def cache_path(self, sha):
+        return os.path.join(self.cache_dir, f"{sha}.jsonl")
+
+    def extract(self, files):
+        """
+        Yield (path, sha256, pages) for each file, where pages yields page texts in order
+        Args:
+            files: (path, sha256) pairs
+        Consume each file's pages before moving on to the next file; pages
+        left unread are discarded.
+        """
+        window = deque()
+        ranges = self._ranges(files)
+
+        def fill():
+            while len(window) < self.workers * PDF_PREFETCH:
+                entry = next(ranges, None)
+                if entry is None:
+                    return
+                window.append(entry)
+
+        fill()
+        try:
+            while window:
+                path = window[0][0]
+                yield path, window[0][1], self._pages(window, fill)
+                while window and window[0][0] == path:
+                    future = window.popleft()[2]
+                    if future is not None:
+                        future.cancel()
+                fill()
+        finally:
+            for _, _, future, _ in window:
+                if future is not None:
+                    future.cancel()
+
+    def pages(self, path, sha=None):
+        """
+        Page texts of a single file, hashing it first if sha is not given
+        """
+        for _, _, pages in self.extract([(path, sha or file_sha256(path))]):
+            yield from pages
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def _ranges(self, files):
+        # (path, sha256, future of the page texts or None if cached, last range of the file),
+        # submitted lazily as the window makes room
+        for path, sha in files:
+            if os.path.exists(self.cache_path(sha)):
+                yield path, sha, None, True
+                continue
+            try:
+                import PyPDF2
+                count = len(PyPDF2.PdfReader(path).pages)
+            except Exception as e:
+                # Raised when the consumer reaches this file, not while it is still reading an earlier one
+                yield path, sha, _done(error=e), True
+                continue
+            if not count:
+                yield path, sha, _done([]), True
+                continue
+            # Large files are split once per worker, so each worker opens a file at most once
+            size = max(self.pages_per_task, -(-count // self.workers))
+            for start in range(0, count, size):
+                stop = min(count, start + size)
+                yield path, sha, self.pool.submit(extract_range, path, start, stop), stop == count
+
+    def _pages(self, window, fill):
+        path, sha, future, _ = window[0]
+        cache_path = self.cache_path(sha)
+        record_cache("pdf_text", future is None)
+        if future is None:
+            window.popleft()
+            fill()
+            with open(cache_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+            return
+
+        # Written alongside the consumer and renamed once complete, so a partial file is never reused
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as out:
+                last = False
+                while not last:
+                    _, _, future, last = window.popleft()
+                    fill()
+                    with timed("pdf_extract"):
+                        texts = future.result()
+                    for text in texts:
+                        out.write(json.dumps(text) + "\n")
+                        yield text
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
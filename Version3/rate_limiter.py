@@ -0,0 +1,276 @@
+import os
+import time
+import random
+import threading
+from metrics import OPENAI_IN_FLIGHT, OPENAI_REQUESTS, record_usage
+
+# Quota ceilings; 0 disables a limit
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "80000"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "60"))
+OPENAI_BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+OPENAI_BREAKER_RESET = float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+# Completion tokens charged against the TPM bucket when a call does not set max_tokens
+OPENAI_COMPLETION_TOKENS = int(os.getenv("OPENAI_COMPLETION_TOKENS", "1000"))
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling the API while the circuit breaker is open
+    """
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that adapts its rate to 429 responses
+
+    per_minute is the ceiling (the RPM or TPM quota). throttle() halves the
+    refill rate and pauses refilling for the server's Retry-After; every
+    success adds back a twentieth of the ceiling, so throughput settles just
+    under the quota the server actually enforces. 0 disables the bucket.
+    """
+
+    def __init__(self, per_minute, min_fraction=0.05):
+        self.ceiling = per_minute / 60.0
+        self.rate = self.ceiling
+        self.min_rate = self.ceiling * min_fraction
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if not self.ceiling:
+            return
+        # A request larger than the whole bucket could never be served otherwise
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now > self.updated:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                # updated may lie in the future while a Retry-After pause is in effect
+                wait = max(0.0, self.updated - now) + (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self, retry_after=None):
+        if not self.ceiling:
+            return
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.updated = max(self.updated, time.monotonic() + (retry_after or 0))
+
+    def success(self):
+        with self._lock:
+            self.rate = min(self.ceiling, self.rate + self.ceiling / 20)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing API for a while instead of piling up retries
+
+    After failure_threshold consecutive failures, calls fail fast with
+    CircuitOpenError for reset_timeout seconds; then one trial call is let
+    through, and its success closes the breaker again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("OpenAI API circuit breaker is open")
+            # Let this call through as the trial; everyone else waits out another timeout
+            self.opened_at = time.monotonic()
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt, base, maximum, retry_after=None):
+    """
+    Full-jitter exponential backoff, but never sooner than the server's Retry-After
+    """
+    delay = random.uniform(0, min(maximum, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def retry_after_seconds(error):
+    """
+    Read retry-after-ms or retry-after (seconds) from an API error's response, if any
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # An HTTP date instead of seconds; fall back to plain backoff
+        return None
+    return None
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """
+    Rough prompt + completion size of a chat call (about 4 characters per token)
+    """
+    prompt = sum(len(str(message.get("content") or "")) for message in messages or [])
+    return prompt // 4 + (max_tokens or OPENAI_COMPLETION_TOKENS)
+
+
+class RateLimitedOpenAI:
+    """
+    OpenAI client wrapper shared by every call site in the app
+
+    Each request waits for the requests-per-minute and tokens-per-minute
+    buckets, holds one of max_concurrency slots, and is retried on 429s, 5xx
+    responses and connection errors with jittered exponential backoff (at
+    least the server's Retry-After). Repeated server failures open a circuit
+    breaker. The underlying OpenAI client is created on first use, so importing
+    a module that builds one does not need an API key yet.
+    """
+
+    def __init__(self, client=None, rpm=OPENAI_RPM, tpm=OPENAI_TPM, max_concurrency=OPENAI_MAX_CONCURRENCY,
+                 max_retries=OPENAI_MAX_RETRIES, backoff_base=OPENAI_BACKOFF_BASE, backoff_max=OPENAI_BACKOFF_MAX):
+        self._client = client
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        self.breaker = CircuitBreaker(OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RESET)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                # The SDK takes most of a second to import, so it is loaded with the first client
+                import openai
+                # Retries happen in call(), where they are paced by the rate limits
+                self._client = openai.OpenAI(max_retries=0)
+            return self._client
+
+    def call(self, create, tokens=0, endpoint="chat"):
+        """
+        Run one API request under the rate limits, retrying transient failures
+        Args:
+            create: Function that starts a fresh request each time it is called
+            tokens: Estimated size of the request for the TPM bucket
+            endpoint: Label for the request in the metrics
+        Returns:
+            The response of the first successful attempt
+        """
+        import openai
+        # Failures that say nothing about the request itself, so retrying may succeed
+        server_errors = (openai.APIConnectionError, openai.InternalServerError)
+        attempt = 0
+        while True:
+            self.breaker.check()
+            self.requests_bucket.acquire(1)
+            self.tokens_bucket.acquire(tokens)
+            retry_after = None
+            try:
+                with self._semaphore:
+                    OPENAI_IN_FLIGHT.inc(endpoint=endpoint)
+                    try:
+                        result = create()
+                    finally:
+                        OPENAI_IN_FLIGHT.dec(endpoint=endpoint)
+            except openai.RateLimitError as e:
+                OPENAI_REQUESTS.inc(endpoint=endpoint, outcome="rate_limited")
+                # The API is up, we are just over quota; an exhausted quota will not recover by retrying
+                self.breaker.success()
+                if getattr(e, "code", None) == "insufficient_quota" or attempt >= self.max_retries:
+                    raise
+                retry_after = retry_after_seconds(e)
+                self.requests_bucket.throttle(retry_after)
+                self.tokens_bucket.throttle(retry_after)
+                error = e
+            except server_errors as e:
+                OPENAI_REQUESTS.inc(endpoint=endpoint, outcome="server_error")
+                self.breaker.failure()
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = retry_after_seconds(e)
+                error = e
+            except openai.APIStatusError:
+                OPENAI_REQUESTS.inc(endpoint=endpoint, outcome="client_error")
+                self.breaker.success()
+                raise
+            else:
+                OPENAI_REQUESTS.inc(endpoint=endpoint, outcome="ok")
+                record_usage(getattr(result, "model", None) or "unknown", result)
+                self.breaker.success()
+                self.requests_bucket.success()
+                self.tokens_bucket.success()
+                return result
+
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after)
+            print(f"OpenAI request failed ({type(error).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def chat(self, messages, model="gpt-4o", **kwargs):
+        return self.call(
+            lambda: self.client.chat.completions.create(model=model, messages=messages, **kwargs),
+            estimate_tokens(messages, kwargs.get("max_tokens"))
+        )
+
+    def chat_stream(self, messages, model="gpt-4o", **kwargs):
+        """
+        Yield the completion's content deltas as they arrive; only opening the stream is retried
+        """
+        stream = self.chat(messages, model=model, stream=True, **kwargs)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def embed(self, texts, model="text-embedding-3-small", **kwargs):
+        """
+        Return one embedding per text, in order
+        """
+        response = self.call(
+            lambda: self.client.embeddings.create(model=model, input=list(texts), **kwargs),
+            sum(len(text) for text in texts) // 4,
+            endpoint="embeddings"
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def transcribe(self, file, model="whisper-1", **kwargs):
+        def create():
+            # The file is re-read from the start on every attempt
+            if hasattr(file, "seek"):
+                file.seek(0)
+            return self.client.audio.transcriptions.create(model=model, file=file, **kwargs)
+
+        return self.call(create, endpoint="transcription")
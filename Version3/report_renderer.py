@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from io import BytesIO
+from concurrent.futures import Future, ProcessPoolExecutor
+from metrics import record_cache, timed
+
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "report_cache")
+REPORT_CACHE_MAX_AGE_DAYS = float(os.getenv("REPORT_CACHE_MAX_AGE_DAYS", "7"))
+REPORT_CACHE_MAX_MB = float(os.getenv("REPORT_CACHE_MAX_MB", "500"))
+REPORT_RENDER_WORKERS = int(os.getenv("REPORT_RENDER_WORKERS", str(os.cpu_count() or 1)))
+# Evict after this many renders rather than on every one
+EVICT_EVERY = 20
+
+
+def _head_story(info, transcript, session_id, styles):
+    from reportlab.platypus import Paragraph, Spacer
+    return [
+        Paragraph(f"Session #{session_id} — Patient Info: {info}", styles['Title']),
+        Spacer(1,12),
+        Paragraph("Transcript:", styles['Heading2']),
+        Paragraph(transcript.replace("\n","<br/>"), styles['BodyText']),
+    ]
+
+
+def _summary_story(summary, knowledge, styles):
+    from reportlab.platypus import Paragraph, Spacer
+    story = []
+    story.append(Paragraph("Summary & Possible Diagnoses:", styles['Heading2']))
+    story.append(Paragraph(summary.replace("\n","<br/>"), styles['BodyText']))
+    story.append(Spacer(1,12))
+    if knowledge:
+        story.append(Paragraph("Related Knowledge:", styles['Heading2']))
+        for q, a in knowledge:
+            story.append(Paragraph(f"Q: {q}", styles['BodyText']))
+            story.append(Paragraph(f"A: {a}", styles['BodyText']))
+            story.append(Spacer(1,8))
+    return story
+
+
+def build_report(output, info, transcript, summary, session_id, knowledge=()):
+    """
+    Lay out a session report with ReportLab
+    Args:
+        output: File path or binary file object to write the PDF to
+        info: Patient/doctor/date line
+        transcript: Session transcript
+        summary: Summary and possible diagnoses
+        session_id: History id of the session
+        knowledge: Optional (question, answer) pairs
+    """
+    # ReportLab is only loaded by the processes that render
+    from reportlab.platypus import SimpleDocTemplate, PageBreak
+    from reportlab.lib.styles import getSampleStyleSheet
+    styles = getSampleStyleSheet()
+    # The summary starts on its own page, as in reports finished from a skeleton
+    story = _head_story(info, transcript, session_id, styles) + [PageBreak()]
+    story += _summary_story(summary, knowledge, styles)
+    SimpleDocTemplate(output).build(story)
+
+
+def build_skeleton(output, info, transcript, session_id):
+    """
+    Lay out the pages of a session report that do not depend on the summary: title and transcript
+    Args:
+        output: File path or binary file object to write the PDF to
+        info: Patient/doctor/date line
+        transcript: Session transcript
+        session_id: History id of the session
+    """
+    from reportlab.platypus import SimpleDocTemplate
+    from reportlab.lib.styles import getSampleStyleSheet
+    SimpleDocTemplate(output).build(_head_story(info, transcript, session_id, getSampleStyleSheet()))
+
+
+def _write_atomically(path, write):
+    # Write then rename so readers never see a partial PDF
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def _render_to_file(path, info, transcript, summary, session_id, knowledge):
+    # Runs in a worker process
+    return _write_atomically(path, lambda tmp_path: build_report(tmp_path, info, transcript, summary, session_id, knowledge))
+
+
+def _render_skeleton(path, info, transcript, session_id):
+    return _write_atomically(path, lambda tmp_path: build_skeleton(tmp_path, info, transcript, session_id))
+
+
+def _finish_skeleton(path, skeleton_path, summary, knowledge):
+    # Only the summary pages are laid out here; the skeleton's pages are copied as they are
+    from reportlab.platypus import SimpleDocTemplate
+    from reportlab.lib.styles import getSampleStyleSheet
+    from PyPDF2 import PdfReader, PdfWriter
+    summary_pdf = BytesIO()
+    SimpleDocTemplate(summary_pdf).build(_summary_story(summary, knowledge, getSampleStyleSheet()))
+    writer = PdfWriter()
+    for reader in (PdfReader(skeleton_path), PdfReader(summary_pdf)):
+        for page in reader.pages:
+            writer.add_page(page)
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            writer.write(f)
+    _write_atomically(path, write)
+    os.remove(skeleton_path)
+    return path
+
+
+def _load_reportlab():
+    import reportlab.platypus  # noqa: F401
+    import PyPDF2  # noqa: F401
+
+
+class ReportRenderer:
+    """
+    Renders session PDFs in a process pool into a content-addressed disk cache
+
+    A report is stored as session-<id>-<hash>.pdf, where the hash covers
+    everything printed in it, so repeat downloads are served from disk and an
+    edited summary gets a new file. Files older than max_age_days, and the
+    least recently used ones beyond max_mb, are evicted.
+
+    The transcript pages can be rendered as a skeleton before the summary
+    exists (``submit_skeleton``); ``render`` then only lays out the summary
+    pages and appends them.
+    """
+
+    def __init__(self, cache_dir=REPORT_CACHE_DIR, workers=REPORT_RENDER_WORKERS,
+                 max_age_days=REPORT_CACHE_MAX_AGE_DAYS, max_mb=REPORT_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.max_age = max_age_days * 24 * 3600
+        self.max_bytes = max_mb * 1024 * 1024
+        self._pool = None
+        self._lock = threading.Lock()
+        self._renders = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def warm_up(self):
+        """
+        Start the worker processes and load ReportLab in them, so the first report does not wait for it
+        """
+        for future in [self.pool.submit(_load_reportlab) for _ in range(self.workers)]:
+            future.result()
+
+    def path_for(self, info, transcript, summary, session_id, knowledge=()):
+        content = json.dumps([info, transcript, summary, [list(pair) for pair in knowledge]], ensure_ascii=False)
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.cache_dir, f"session-{session_id}-{digest}.pdf")
+
+    def submit(self, info, transcript, summary, session_id, knowledge=(), skeleton=None):
+        """
+        Start rendering in the pool and return a Future of the PDF path
+        Args:
+            skeleton: Optional path from submit_skeleton for the same info, transcript and session;
+                only the summary pages are rendered then. It is deleted once used
+        """
+        path = self.path_for(info, transcript, summary, session_id, knowledge)
+        if os.path.exists(path):
+            # Cache hit: refresh its age so LRU eviction keeps it
+            record_cache("report_pdf", True)
+            os.utime(path)
+            if skeleton is not None:
+                os.remove(skeleton)
+            future = Future()
+            future.set_result(path)
+            return future
+        record_cache("report_pdf", False)
+        with self._lock:
+            self._renders += 1
+            evict = self._renders % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+        if skeleton is not None:
+            return self.pool.submit(_finish_skeleton, path, skeleton, summary, tuple(knowledge))
+        return self.pool.submit(_render_to_file, path, info, transcript, summary, session_id, tuple(knowledge))
+
+    def skeleton_path(self, session_id):
+        return os.path.join(self.cache_dir, f"skeleton-{session_id}.pdf")
+
+    def submit_skeleton(self, info, transcript, session_id):
+        """
+        Start rendering the title and transcript pages in the pool and return a Future of their path
+        """
+        return self.pool.submit(_render_skeleton, self.skeleton_path(session_id), info, transcript, session_id)
+
+    def render(self, info, transcript, summary, session_id, knowledge=(), skeleton=None):
+        """
+        Return the path of the session's PDF, rendering it only if it is not cached
+        """
+        with timed("pdf"):
+            return self.submit(info, transcript, summary, session_id, knowledge, skeleton).result()
+
+    def evict(self):
+        """
+        Delete cached reports older than max_age, then the least recently used beyond max_bytes
+        """
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pdf"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                os.remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
@@ -0,0 +1,92 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def critical_path(timings, needs):
+    """
+    The chain of stages that decided when the run finished
+    Args:
+        timings: {stage: (start, end)} offsets in seconds of the stages that ran
+        needs: {stage: stages it waits for}
+    Returns:
+        (stage names in order, seconds from the first one's start to the last one's end)
+    """
+    if not timings:
+        return [], 0.0
+    name = max(timings, key=lambda stage: timings[stage][1])
+    path = [name]
+    while True:
+        # Each step goes back to the needed stage that ended last: the one actually waited on
+        waited_on = [dep for dep in needs.get(name, ()) if dep in timings]
+        if not waited_on:
+            break
+        name = max(waited_on, key=lambda stage: timings[stage][1])
+        path.append(name)
+    path.reverse()
+    return path, timings[path[-1]][1] - timings[path[0]][0]
+
+
+class StageGraph:
+    """
+    Runs stages as a dependency graph on threads, each one as soon as the
+    stages it needs are done. A stage takes the shared context dict and
+    returns a dict (or None) that is merged into it. The first stage to
+    raise stops new stages from starting and the error propagates once the
+    running ones have finished.
+    Args:
+        stages: (name, function, names of the stages it needs) tuples
+    """
+
+    def __init__(self, stages):
+        self.stages = {}
+        self.needs = {}
+        for name, func, needs in stages:
+            if name in self.stages:
+                raise ValueError(f"Duplicate stage: {name}")
+            self.stages[name] = func
+            self.needs[name] = tuple(needs)
+        for name, needs in self.needs.items():
+            unknown = [dep for dep in needs if dep not in self.stages]
+            if unknown:
+                raise ValueError(f"Stage {name} needs unknown stages: {', '.join(unknown)}")
+        self.order = []
+        while len(self.order) < len(self.stages):
+            ready = [name for name in self.stages
+                     if name not in self.order and all(dep in self.order for dep in self.needs[name])]
+            if not ready:
+                raise ValueError("Stage dependencies form a cycle")
+            self.order.extend(ready)
+
+    def run(self, context, on_done=None):
+        """
+        Run every stage
+        Args:
+            context: dict passed to every stage and updated with their output
+            on_done: called as on_done(stage name, context) as each stage finishes
+        Returns:
+            {stage: (start, end)} offsets in seconds
+        """
+        pending = list(self.order)
+        running = {}
+        done = set()
+        timings = {}
+        clock = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(self.stages)) as pool:
+            while pending or running:
+                for name in [name for name in pending if all(dep in done for dep in self.needs[name])]:
+                    pending.remove(name)
+                    running[pool.submit(self.stages[name], context)] = (name, time.monotonic() - clock)
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, start = running.pop(future)
+                    try:
+                        output = future.result()
+                    except Exception:
+                        pending.clear()
+                        raise
+                    context.update(output or {})
+                    timings[name] = (start, time.monotonic() - clock)
+                    done.add(name)
+                    if on_done:
+                        on_done(name, context)
+        return timings
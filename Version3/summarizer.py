@@ -0,0 +1,122 @@
+import os
+import re
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+# Transcripts up to this size go to the model in one prompt
+SUMMARY_SINGLE_SHOT_TOKENS = int(os.getenv("SUMMARY_SINGLE_SHOT_TOKENS", "24000"))
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+SUMMARY_CHUNK_OVERLAP_TOKENS = int(os.getenv("SUMMARY_CHUNK_OVERLAP_TOKENS", "300"))
+SUMMARY_FAN_OUT = int(os.getenv("SUMMARY_FAN_OUT", "4"))
+
+MAP_PROMPT = "You are a medical assistant. The following is part {part} of {parts} of a doctor-patient conversation. Write concise notes that keep every symptom, history item, medication, test, diagnosis and treatment discussed. Do not add anything that is not in the text."
+REDUCE_PROMPT = "You are a medical assistant. The following are notes on consecutive parts of one doctor-patient conversation. Merge them into a single set of notes, removing repetition but keeping every clinical detail."
+CONDENSED_PREFIX = "Notes on consecutive parts of the conversation:\n\n"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？\n])\s*")
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model):
+    """
+    The model's tiktoken encoding, or None to estimate instead
+    """
+    # Loaded on the first count, not by importing the app
+    try:
+        import tiktoken
+    except ImportError:  # fall back to a character-based estimate
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # tiktoken downloads its vocabulary on first use; offline, estimate instead
+        return None
+
+
+def count_tokens(text, model="gpt-4o"):
+    """
+    Count tokens with tiktoken, or estimate them when it is unavailable
+    """
+    encoding = _encoding_for(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_text(text, chunk_tokens=SUMMARY_CHUNK_TOKENS, overlap_tokens=SUMMARY_CHUNK_OVERLAP_TOKENS):
+    """
+    Split text into chunks of at most chunk_tokens, on sentence boundaries where possible
+    Args:
+        text: Text to split
+        chunk_tokens: Maximum tokens per chunk
+        overlap_tokens: Tokens of trailing context repeated at the start of the next chunk
+    Returns:
+        List of chunks
+    """
+    pieces = []
+    for sentence in _SENTENCE_END.split(text):
+        if not sentence:
+            continue
+        if count_tokens(sentence) <= chunk_tokens:
+            pieces.append(sentence)
+            continue
+        # A single over-long "sentence" (e.g. an unpunctuated transcript) is split on words
+        words = sentence.split(" ")
+        step = max(1, len(words) * chunk_tokens // (2 * count_tokens(sentence)))
+        pieces.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+
+    chunks = []
+    current = []
+    size = 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and size + tokens > chunk_tokens:
+            chunks.append(" ".join(current))
+            # Carry the tail of this chunk into the next one for context
+            overlap = []
+            overlap_size = 0
+            for previous in reversed(current):
+                previous_size = count_tokens(previous)
+                if overlap_size + previous_size > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += previous_size
+            current = overlap
+            size = overlap_size
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def condense_transcript(text, complete, single_shot_tokens=SUMMARY_SINGLE_SHOT_TOKENS,
+                        chunk_tokens=SUMMARY_CHUNK_TOKENS, overlap_tokens=SUMMARY_CHUNK_OVERLAP_TOKENS,
+                        fan_out=SUMMARY_FAN_OUT):
+    """
+    Map-reduce a transcript that is too long for one prompt into notes
+    Args:
+        text: Transcript
+        complete: Function (system_prompt, text) -> completion text
+        single_shot_tokens: Transcripts up to this size are returned unchanged
+        chunk_tokens: Size of each chunk summarized in the map step
+        overlap_tokens: Overlap between consecutive chunks
+        fan_out: Maximum concurrent model calls
+    Returns:
+        The transcript itself, or notes covering all of it that fit in single_shot_tokens
+    """
+    if count_tokens(text) <= single_shot_tokens:
+        return text
+
+    chunks = split_text(text, chunk_tokens, overlap_tokens)
+    with ThreadPoolExecutor(max_workers=fan_out) as pool:
+        notes = list(pool.map(
+            complete,
+            [MAP_PROMPT.format(part=i + 1, parts=len(chunks)) for i in range(len(chunks))],
+            chunks
+        ))
+        # Merge pairs of notes until everything fits in one final prompt
+        while len(notes) > 1 and count_tokens("\n\n".join(notes)) > single_shot_tokens:
+            groups = ["\n\n".join(notes[i:i + 2]) for i in range(0, len(notes), 2)]
+            notes = list(pool.map(complete, [REDUCE_PROMPT] * len(groups), groups))
+    return CONDENSED_PREFIX + "\n\n".join(notes)
@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from metrics import timed
+from vad import MAX_CHUNK_SECONDS, export_mp3, plan_chunks, prepare_for_transcription
+
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "4"))
+
+
+def _field(item, name):
+    # verbose_json segments come back as dicts or objects depending on the client version
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
+
+
+def _segments(response, offset, end):
+    segments = _field(response, "segments")
+    if not segments:
+        return [(offset, end, response.text.strip())]
+    return [
+        (offset + _field(segment, "start"), offset + _field(segment, "end"), _field(segment, "text").strip())
+        for segment in segments
+    ]
+
+
+def transcribe_recording(path, transcribe, max_chunk_seconds=MAX_CHUNK_SECONDS, workers=TRANSCRIPTION_WORKERS):
+    """
+    Trim a recording's long pauses, then transcribe it in MP3 chunks cut at pauses, several at a time
+    Args:
+        path: audio file to transcribe
+        transcribe: Function (file) -> Whisper response in verbose_json; file is a path-less
+            (name, bytes) tuple for chunks, or an open file when the recording could not be trimmed
+        max_chunk_seconds: Longest chunk of trimmed audio sent in one request
+        workers: Maximum concurrent requests
+    Returns:
+        List of (start s, end s, text) on the timeline of the original recording
+    """
+    upload_path, offsets = prepare_for_transcription(path)
+    if upload_path is None:
+        return []
+    try:
+        if offsets is None:
+            # Trimming failed (e.g. no ffmpeg): the original file in one request
+            with open(upload_path, "rb") as f, timed("whisper"):
+                response = transcribe(f)
+            return _segments(response, 0.0, _field(response, "duration") or 0.0)
+
+        # Pieces of kept audio meet in the middle of the pauses that were shortened
+        ranges = [(start, start + length) for start, _, length in offsets.pieces]
+        chunks = plan_chunks(ranges, offsets.trimmed_ms, int(max_chunk_seconds * 1000))
+
+        def run(chunk):
+            start, end = chunk
+            with timed("encode_chunk"):
+                data = export_mp3(upload_path, start, end)
+            with timed("whisper"):
+                return _segments(transcribe(("chunk.mp3", data)), start / 1000, end / 1000)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run, chunks))
+        # Whisper's times are in the trimmed audio; the offset map puts them back on the recording
+        return [
+            (offsets.to_original(start * 1000) / 1000, offsets.to_original(end * 1000) / 1000, text)
+            for segments in results for start, end, text in segments
+        ]
+    finally:
+        if upload_path != path:
+            os.remove(upload_path)
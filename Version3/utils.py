@@ -1,4 +1,3 @@
-import openai
 import os
 from pydub import AudioSegment
 import tempfile
@@ -6,8 +5,22 @@ import sounddevice as sd
 import numpy as np
 import scipy.io.wavfile as wav
 import time
+import wave
+import queue
 import base64
 from io import BytesIO
+from llm_cache import LLMCache, cache_key
+from rate_limiter import RateLimitedOpenAI
+from transcription import transcribe_recording
+from live_transcription import FileReplaySource, LiveTranscriber, MicrophoneSource
+
+# Summaries and reports are cached on model + prompt version + input text;
+# bump a prompt version when its prompt changes
+llm_cache = LLMCache()
+SUMMARY_PROMPT_VERSION = "therapy-summary-v1"
+REPORT_PROMPT_VERSION = "therapy-report-v1"
+# Shared OpenAI client with rate limits, retries and a circuit breaker
+client = RateLimitedOpenAI()
 
 def get_microphone_devices():
     """
@@ -58,6 +71,72 @@ def record_audio(duration=10, sample_rate=44100, device_id=None):
             print(f"{i}: {device['name']}")
         return None
 
+def record_audio_live(duration=None, sample_rate=44100, device_id=None, on_update=None, stop_event=None,
+                      replay_path=None):
+    """
+    Record from the microphone and transcribe while recording, instead of after
+    Args:
+        duration: Recording duration in seconds, or None to record until stop_event is set
+        sample_rate: Sample rate for recording
+        device_id: ID of the input device to use
+        on_update: Called as on_update(new segments, transcript so far) while recording;
+            segments are (start seconds, end seconds, text)
+        stop_event: threading.Event that ends the recording early
+        replay_path: Play this audio file back in real time instead of recording, e.g. to
+            test without a microphone
+    Returns:
+        (path to the recorded audio file, transcript), or (None, None) on error
+    """
+    try:
+        if replay_path:
+            source = FileReplaySource(replay_path)
+            sample_rate = source.sample_rate
+        else:
+            if device_id is None:
+                device_id = sd.default.device[0]
+            source = MicrophoneSource(sample_rate, device_id)
+        transcriber = LiveTranscriber(client, sample_rate, on_update=on_update)
+
+        # The audio callback only copies blocks; the full recording is written out here
+        blocks = queue.Queue()
+
+        def callback(indata, frames, time_info, status):
+            transcriber.callback(indata, frames, time_info, status)
+            blocks.put(indata[:, 0].copy())
+
+        temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
+        temp_file.close()
+        print(f"Recording with live transcription{f' for {duration} seconds' if duration else ''}...")
+        with wave.open(temp_file.name, 'wb') as recording:
+            recording.setnchannels(1)
+            recording.setsampwidth(2)
+            recording.setframerate(sample_rate)
+
+            def write(block):
+                recording.writeframes((np.clip(block, -1, 1) * 32767).astype(np.int16).tobytes())
+
+            source.start(callback)
+            deadline = time.monotonic() + duration if duration else None
+            while not (stop_event and stop_event.is_set()) and not (deadline and time.monotonic() >= deadline):
+                if replay_path and source.finished.is_set() and blocks.empty():
+                    break
+                try:
+                    write(blocks.get(timeout=0.1))
+                except queue.Empty:
+                    continue
+            # Stopped before finishing, so no block arrives after the final segment is cut
+            source.stop()
+            while not blocks.empty():
+                write(blocks.get())
+        return temp_file.name, transcriber.finish()
+
+    except Exception as e:
+        print(f"Error in live recording: {e}")
+        print("Available input devices:")
+        for i, device in enumerate(get_microphone_devices()):
+            print(f"{i}: {device['name']}")
+        return None, None
+
 def process_audio_data(audio_data):
     """
     Process audio data from Streamlit's audio recorder
@@ -84,46 +163,65 @@ def transcribe_audio(audio_path):
     Transcribe audio file using OpenAI's Whisper API
     """
     try:
-        with open(audio_path, "rb") as audio_file:
-            transcript = openai.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
-        return transcript.text
+        segments = transcribe_recording(
+            audio_path,
+            lambda file: client.transcribe(file, model="whisper-1", response_format="verbose_json")
+        )
+        return " ".join(text for _, _, text in segments if text)
     except Exception as e:
         print(f"Error in transcription: {e}")
         return None
 
-def generate_summary(text):
+def generate_summary(text, bypass_cache=False):
     """
     Generate a summary of the transcribed text using OpenAI's GPT model
+    Args:
+        text: Transcribed session text
+        bypass_cache: Skip the cached result and regenerate it
     """
+    key = cache_key("gpt-3.5-turbo", SUMMARY_PROMPT_VERSION, text)
+    if not bypass_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
     try:
-        response = openai.chat.completions.create(
+        response = client.chat(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that summarizes therapy sessions."},
                 {"role": "user", "content": f"Please provide a concise summary of the following therapy session:\n\n{text}"}
             ]
         )
-        return response.choices[0].message.content
+        summary = response.choices[0].message.content
+        llm_cache.set(key, summary)
+        return summary
     except Exception as e:
         print(f"Error in summary generation: {e}")
         return None
 
-def generate_report(summary):
+def generate_report(summary, bypass_cache=False):
     """
     Generate a detailed therapy report based on the summary
+    Args:
+        summary: Session summary
+        bypass_cache: Skip the cached result and regenerate it
     """
+    key = cache_key("gpt-3.5-turbo", REPORT_PROMPT_VERSION, summary)
+    if not bypass_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
     try:
-        response = openai.chat.completions.create(
+        response = client.chat(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a professional therapist creating detailed session reports."},
                 {"role": "user", "content": f"Based on the following summary, create a detailed therapy session report including key points, observations, and recommendations:\n\n{summary}"}
             ]
         )
-        return response.choices[0].message.content
+        report = response.choices[0].message.content
+        llm_cache.set(key, report)
+        return report
     except Exception as e:
         print(f"Error in report generation: {e}")
         return None
@@ -0,0 +1,324 @@
+import os
+import io
+import wave
+import tempfile
+import subprocess
+from bisect import bisect_right
+from math import gcd
+from metrics import AUDIO_SECONDS, timed
+
+# Whisper resamples to 16 kHz mono anyway, so downsampling first loses nothing
+TARGET_SAMPLE_RATE = 16000
+FRAME_MS = 30
+# A frame is speech when it is this much louder than the recording's noise floor
+SPEECH_MARGIN_DB = 10
+NOISE_FLOOR_PERCENTILE = 10
+# Frames quieter than this (dBFS) are never speech, however clean the silence around them
+MIN_SPEECH_DB = -55
+MIN_SILENCE_MS = 700
+MIN_SPEECH_MS = 90
+# Pauses longer than this are shortened to it, so Whisper still hears a break
+KEEP_SILENCE_MS = int(os.getenv("VAD_KEEP_SILENCE_MS", "400"))
+# Frames of decoded audio read at a time, so memory does not grow with the recording
+READ_BLOCK_FRAMES = 1000
+# Whisper rejects uploads over 25 MB; ten minutes of 64 kbps mono MP3 is ~4.8 MB
+MAX_CHUNK_SECONDS = float(os.getenv("TRANSCRIPTION_MAX_CHUNK_SECONDS", "600"))
+CHUNK_BITRATE = "64k"
+
+
+class OffsetMap:
+    """
+    Maps times in trimmed audio back to the original recording and vice versa
+    Args:
+        pieces: (trimmed start, original start, length) in ms, in order
+        original_ms: length of the original recording in ms
+    """
+
+    def __init__(self, pieces, original_ms):
+        self.pieces = pieces
+        self.original_ms = original_ms
+        self._trimmed_starts = [piece[0] for piece in pieces]
+        self._original_starts = [piece[1] for piece in pieces]
+
+    @property
+    def trimmed_ms(self):
+        if not self.pieces:
+            return 0
+        start, _, length = self.pieces[-1]
+        return start + length
+
+    @property
+    def saved_seconds(self):
+        return (self.original_ms - self.trimmed_ms) / 1000
+
+    def to_original(self, ms):
+        if not self.pieces:
+            return ms
+        i = max(0, bisect_right(self._trimmed_starts, ms) - 1)
+        trimmed_start, original_start, length = self.pieces[i]
+        return original_start + min(max(ms - trimmed_start, 0), length)
+
+    def to_trimmed(self, ms):
+        if not self.pieces:
+            return ms
+        i = max(0, bisect_right(self._original_starts, ms) - 1)
+        trimmed_start, original_start, length = self.pieces[i]
+        return trimmed_start + min(max(ms - original_start, 0), length)
+
+
+def load_audio(path):
+    """
+    Read an audio file as mono float32 samples in [-1, 1]
+    Returns:
+        (samples, sample rate)
+    """
+    # numpy and scipy are loaded by the first recording, not by importing the app
+    import numpy as np
+    import scipy.io.wavfile as wav
+    if path.lower().endswith(".wav"):
+        rate, samples = wav.read(path)
+        if samples.dtype == np.int16:
+            samples = samples / 32768.0
+        elif samples.dtype == np.int32:
+            samples = samples / 2147483648.0
+        elif samples.dtype == np.uint8:
+            samples = (samples - 128) / 128.0
+    else:
+        # Compressed formats are decoded by ffmpeg through pydub
+        from pydub import AudioSegment
+        segment = AudioSegment.from_file(path)
+        rate = segment.frame_rate
+        samples = np.array(segment.get_array_of_samples()).reshape(-1, segment.channels)
+        samples = samples / float(1 << (8 * segment.sample_width - 1))
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    return samples, rate
+
+
+def resample(samples, rate, target_rate=TARGET_SAMPLE_RATE):
+    """
+    Polyphase resampling, e.g. 44.1 kHz -> 16 kHz as 160/441
+    """
+    if rate == target_rate:
+        return samples
+    import numpy as np
+    from scipy.signal import resample_poly
+    divisor = gcd(rate, target_rate)
+    return resample_poly(samples, target_rate // divisor, rate // divisor).astype(np.float32)
+
+
+def detect_speech(samples, rate, frame_ms=FRAME_MS, margin_db=SPEECH_MARGIN_DB,
+                  min_silence_ms=MIN_SILENCE_MS, min_speech_ms=MIN_SPEECH_MS):
+    """
+    Energy-based voice activity detection
+    Args:
+        samples: mono float samples
+        rate: sample rate
+    Returns:
+        List of (start ms, end ms) speech ranges
+    """
+    import numpy as np
+    frame = rate * frame_ms // 1000
+    count = len(samples) // frame
+    if count == 0:
+        return []
+    frames = samples[:count * frame].reshape(count, frame).astype(np.float64)
+    levels = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+    return speech_ranges(levels, frame_ms, margin_db, min_silence_ms, min_speech_ms)
+
+
+def wav_levels(path, frame_ms=FRAME_MS):
+    """
+    Level in dBFS of each frame of a 16-bit mono WAV, read a block of frames at a time
+    Returns:
+        (levels, duration in ms)
+    """
+    import numpy as np
+    levels = []
+    with wave.open(path, "rb") as wav:
+        rate = wav.getframerate()
+        frame = rate * frame_ms // 1000
+        while True:
+            block = np.frombuffer(wav.readframes(frame * READ_BLOCK_FRAMES), dtype=np.int16)
+            count = len(block) // frame
+            if count == 0:
+                break
+            frames = block[:count * frame].reshape(count, frame) / 32768.0
+            levels.append(10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12))
+        total_ms = wav.getnframes() * 1000 // rate
+    return (np.concatenate(levels) if levels else np.zeros(0)), total_ms
+
+
+def speech_ranges(levels, frame_ms=FRAME_MS, margin_db=SPEECH_MARGIN_DB,
+                  min_silence_ms=MIN_SILENCE_MS, min_speech_ms=MIN_SPEECH_MS):
+    """
+    Speech ranges from per-frame levels in dBFS
+    Returns:
+        List of (start ms, end ms) speech ranges
+    """
+    import numpy as np
+    if len(levels) == 0:
+        return []
+    noise_floor = np.percentile(levels, NOISE_FLOOR_PERCENTILE)
+    active = levels > max(noise_floor + margin_db, MIN_SPEECH_DB)
+    if not active.any():
+        return []
+
+    # Rising and falling edges of the active frames
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], active.astype(np.int8), [0]))))
+    ranges = []
+    for start, end in zip(edges[::2] * frame_ms, edges[1::2] * frame_ms):
+        # Pauses shorter than min_silence_ms do not split speech
+        if ranges and start - ranges[-1][1] < min_silence_ms:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return [(int(start), int(end)) for start, end in ranges if end - start >= min_speech_ms]
+
+
+def keep_spans(speech, total_ms, keep_silence_ms=KEEP_SILENCE_MS):
+    """
+    Stretches to keep: speech padded by half of keep_silence_ms on each side
+    """
+    pad = keep_silence_ms // 2
+    spans = []
+    for start, end in speech:
+        start, end = max(0, start - pad), min(total_ms, end + pad)
+        if spans and start <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    return spans
+
+
+def decode_to_wav(src_path, dest_path, sample_rate=TARGET_SAMPLE_RATE):
+    """
+    Decode any ffmpeg-readable file to 16-bit mono WAV at sample_rate; ffmpeg streams file to file
+    """
+    # pydub looks for ffmpeg when it is imported, so it is only loaded once audio arrives
+    from pydub.utils import get_encoder_name
+    result = subprocess.run(
+        [get_encoder_name(), "-nostdin", "-v", "error", "-y", "-i", src_path,
+         "-ac", "1", "-ar", str(sample_rate), "-sample_fmt", "s16", dest_path],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+
+
+def copy_spans(src_path, dest_path, spans):
+    """
+    Write the (start ms, end ms) spans of a WAV file, back to back, to a new WAV file
+    """
+    with wave.open(src_path, "rb") as src, wave.open(dest_path, "wb") as dest:
+        rate = src.getframerate()
+        dest.setparams(src.getparams())
+        block = rate * FRAME_MS // 1000 * READ_BLOCK_FRAMES
+        for start, end in spans:
+            src.setpos(start * rate // 1000)
+            remaining = end * rate // 1000 - start * rate // 1000
+            while remaining > 0:
+                data = src.readframes(min(block, remaining))
+                if not data:
+                    break
+                dest.writeframes(data)
+                remaining -= len(data) // (src.getsampwidth() * src.getnchannels())
+
+
+def trim_silence(path, keep_silence_ms=KEEP_SILENCE_MS, sample_rate=TARGET_SAMPLE_RATE):
+    """
+    Decode a recording to 16 kHz mono with ffmpeg and cut its long pauses, a block at a time
+    Args:
+        path: audio file to preprocess
+        keep_silence_ms: longest pause left in the output
+    Returns:
+        (path of a temporary 16-bit WAV file, OffsetMap), or (None, OffsetMap) if there is no speech
+    """
+    fd, decoded_path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        decode_to_wav(path, decoded_path, sample_rate)
+        levels, total_ms = wav_levels(decoded_path)
+        speech = speech_ranges(levels)
+        if not speech:
+            return None, OffsetMap([], total_ms)
+
+        pieces, spans, trimmed = [], [], 0
+        for start, end in keep_spans(speech, total_ms, keep_silence_ms):
+            spans.append((start, end))
+            pieces.append((trimmed, start, end - start))
+            trimmed += end - start
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
+            trimmed_path = temp_file.name
+        copy_spans(decoded_path, trimmed_path, spans)
+        return trimmed_path, OffsetMap(pieces, total_ms)
+    finally:
+        os.remove(decoded_path)
+
+
+def plan_chunks(ranges, total_ms, max_chunk_ms):
+    """
+    Split [0, total_ms) into contiguous chunks of at most max_chunk_ms
+    Cuts go in the middle of the gaps between ranges; a chunk is only hard-split when a single range is too long
+    Args:
+        ranges: (start ms, end ms) stretches of speech, in order
+    Returns:
+        List of (start ms, end ms)
+    """
+    if not ranges or total_ms <= 0:
+        return []
+    cuts = [(prev_end + next_start) // 2 for (_, prev_end), (next_start, _) in zip(ranges, ranges[1:])]
+    cuts.append(total_ms)
+
+    chunks = []
+    start = 0
+    last_cut = None
+    for cut in cuts:
+        while cut - start > max_chunk_ms:
+            end = last_cut if last_cut is not None and last_cut > start else start + max_chunk_ms
+            chunks.append((start, end))
+            start = end
+            last_cut = None
+        last_cut = cut
+    if total_ms > start:
+        chunks.append((start, total_ms))
+    return chunks
+
+
+def export_mp3(wav_path, start_ms, end_ms, bitrate=CHUNK_BITRATE):
+    """
+    Encode a slice of a WAV file as MP3, small enough to stay far below Whisper's upload limit
+    Returns:
+        The MP3 bytes
+    """
+    from pydub import AudioSegment
+    with wave.open(wav_path, "rb") as wav:
+        rate = wav.getframerate()
+        wav.setpos(start_ms * rate // 1000)
+        data = wav.readframes((end_ms - start_ms) * rate // 1000)
+        segment = AudioSegment(data=data, sample_width=wav.getsampwidth(), frame_rate=rate, channels=wav.getnchannels())
+    buffer = io.BytesIO()
+    segment.export(buffer, format="mp3", bitrate=bitrate)
+    return buffer.getvalue()
+
+
+def prepare_for_transcription(path):
+    """
+    Trim a recording before it is sent to Whisper, falling back to the original file
+    Args:
+        path: audio file to transcribe
+    Returns:
+        (path to upload or None if there is no speech, OffsetMap or None when untrimmed)
+    """
+    try:
+        with timed("trim_silence"):
+            trimmed_path, offsets = trim_silence(path)
+    except Exception as e:
+        print(f"Error trimming silence, sending the original audio: {e}")
+        return path, None
+    AUDIO_SECONDS.inc(offsets.original_ms / 1000, kind="received")
+    AUDIO_SECONDS.inc(offsets.saved_seconds, kind="silence_trimmed")
+    AUDIO_SECONDS.inc(offsets.trimmed_ms / 1000, kind="transcribed")
+    print(f"Trimmed {offsets.saved_seconds:.1f} s of silence from {offsets.original_ms / 1000:.1f} s of audio")
+    return trimmed_path, offsets
@@ -1,17 +1,162 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import os
-from datetime import datetime
+import time
+import uuid
+from datetime import date, datetime
 import json
+import asyncio
+from contextlib import asynccontextmanager
 from services.language_service import LanguageService
+from services.job_service import JobService
+from services.upload_service import InvalidUpload, UploadTooLarge, spool_multipart_file
+from services.llm_cache import LLMCache
+from services.conversation_store import ConversationStore, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, DEFAULT_SEARCH_LIMIT
+from services.similar_sessions import SimilarSessions, DEFAULT_SIMILAR_K
+from services.warmup import WarmUp
+from services import metrics
 
-app = FastAPI(title="Medical Conversation Analysis System")
+# Services with heavy dependencies (openai, pydub, langchain, chromadb, pypdf) are imported in
+# the lifespan hook and the warm-up task, so importing this module stays cheap
+WARM_UP_STEPS = ["report_service", "case_index", "similar_sessions"]
 
-# Initialize language service
-language_service = LanguageService()
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "backend/data/recordings")
+# Retrieve case context from the transcript while the summary is written, and start the report on it.
+# Off by default: a guess the summary's own retrieval does not confirm pays for a discarded report call
+REPORT_SPECULATION = os.getenv("REPORT_SPECULATION", "false").lower() == "true"
+
+# Record pipeline stages; each one stores its output on the conversation as it completes.
+# They run as a graph (see the JobService setup in lifespan): a stage starts once its inputs exist
+async def transcribe_stage(context: dict) -> dict:
+    transcript = await app.state.audio_service.process_audio(context["audio_path"])
+    if transcript is None:
+        raise RuntimeError("Transcription failed")
+    app.state.conversation_store.update(context["conversation_id"], transcript=transcript)
+    return {"transcript": transcript}
+
+async def summarize_stage(context: dict) -> dict:
+    from services.audio_service import extract_diseases
+    summary = await app.state.audio_service.generate_summary(
+        context["transcript"],
+        bypass_cache=context.get("bypass_cache", False)
+    )
+    if summary is None:
+        raise RuntimeError("Summary generation failed")
+    app.state.conversation_store.update(
+        context["conversation_id"],
+        summary=summary,
+        diseases=extract_diseases(summary)
+    )
+    return {"summary": summary}
+
+async def index_summary_stage(context: dict) -> dict:
+    if app.state.warmup.ready:
+        # Otherwise the backfill that follows the warm-up indexes it
+        await app.state.similar_sessions.add(context["conversation_id"], context["summary"])
+    return {}
+
+async def retrieve_stage(context: dict) -> dict:
+    # Speculative, so it never waits: until the case index is up there is nothing to guess with
+    if not app.state.warmup.ready:
+        return {"speculative_documents": []}
+    documents = await app.state.report_service.retrieve_speculatively(context["transcript"])
+    return {"speculative_documents": documents}
+
+async def report_stage(context: dict) -> dict:
+    # Reports need the case index; jobs resumed at startup wait for it here
+    await app.state.warmup.wait()
+    report = await app.state.report_service.generate_report(
+        context["summary"],
+        bypass_cache=context.get("bypass_cache", False),
+        speculative_documents=context.get("speculative_documents")
+    )
+    if report is None:
+        raise RuntimeError("Report generation failed")
+    app.state.conversation_store.update(context["conversation_id"], report=report)
+    return {"report": report}
+
+def record_stages(speculation: bool) -> list:
+    """The record pipeline's stage graph, with the speculative retrieval when enabled."""
+    stages = [
+        ("transcribe", transcribe_stage, ()),
+        ("summarize", summarize_stage, ("transcribe",)),
+        ("index_summary", index_summary_stage, ("summarize",)),
+    ]
+    if not speculation:
+        return stages + [("report", report_stage, ("summarize",))]
+    return stages + [
+        ("retrieve", retrieve_stage, ("transcribe",)),
+        ("report", report_stage, ("summarize", "retrieve")),
+    ]
+
+def build_report_service(openai_client, llm_cache):
+    # Imported here, on the warm-up thread: langchain alone takes seconds to import
+    from services.report_service import ReportService
+    return ReportService(openai_client, llm_cache=llm_cache)
+
+async def warm_up(app: FastAPI, warmup: WarmUp):
+    """Build the services that take seconds to start, after the app is already serving."""
+    try:
+        report_service = await warmup.run(
+            "report_service", build_report_service, app.state.openai_client, app.state.llm_cache
+        )
+        app.state.report_service = report_service
+        await warmup.run(
+            "case_index", report_service.initialize_vector_store,
+            lambda done, total: warmup.progress("case_index", done, total)
+        )
+        if report_service.case_index.failed:
+            # Skipped PDFs are retried on the next start; the rest of the corpus is served meanwhile
+            warmup.detail("case_index", failed=report_service.case_index.failed)
+        # Summaries share the report service's embedding model and cache
+        app.state.similar_sessions = await warmup.run("similar_sessions", SimilarSessions, report_service.embeddings)
+    except Exception as e:
+        print(f"Error warming up: {str(e)}")
+        # Otherwise /ready and every report waiting on the warm-up would wait forever
+        warmup.fail(str(e))
+        return
+    warmup.finish()
+    print(f"Warm-up finished in {warmup.ready_after:.1f} s")
+    await app.state.similar_sessions.backfill(app.state.conversation_store)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from services.openai_client import OpenAIClient
+    from services.audio_service import AudioService
+    # One OpenAI client and connection pool shared by every service for the app's lifetime
+    openai_client = OpenAIClient()
+    app.state.openai_client = openai_client
+    app.state.language_service = LanguageService()
+    app.state.conversation_store = ConversationStore()
+    app.state.llm_cache = LLMCache()
+    app.state.audio_service = AudioService(openai_client, llm_cache=app.state.llm_cache)
+    app.state.warmup = WarmUp(WARM_UP_STEPS)
+    app.state.job_service = JobService(record_stages(REPORT_SPECULATION))
+    await app.state.job_service.start()
+    # The report service (case index) and similar-session index come up in the background;
+    # /ready reports their progress
+    warming = asyncio.create_task(warm_up(app, app.state.warmup))
+    # Edited translation files are picked up without a restart
+    watching = asyncio.create_task(app.state.language_service.watch())
+    try:
+        yield
+    finally:
+        watching.cancel()
+        warming.cancel()
+        await app.state.job_service.stop()
+        await openai_client.aclose()
+        # A step still running in its thread finishes on its own; only close what was built
+        if getattr(app.state, "similar_sessions", None):
+            app.state.similar_sessions.close()
+        if getattr(app.state, "report_service", None):
+            app.state.report_service.close()
+        app.state.conversation_store.close()
+        app.state.llm_cache.close()
+
+app = FastAPI(title="Medical Conversation Analysis System", lifespan=lifespan)
 
 # CORS middleware configuration
 origins = [
@@ -36,6 +181,24 @@ class Conversation(BaseModel):
     summary: Optional[str] = None
     transcript: Optional[str] = None
     report: Optional[str] = None
+    diseases: Optional[str] = None
+
+class ConversationListItem(BaseModel):
+    id: str
+    doctor_id: str
+    patient_id: str
+    date: datetime
+
+class ConversationSearchResult(ConversationListItem):
+    score: float
+    snippet: str
+
+class SimilarConversation(ConversationListItem):
+    score: float
+
+class ConversationPage(BaseModel):
+    items: List[ConversationListItem]
+    next_cursor: Optional[str] = None
 
 class ConversationCreate(BaseModel):
     doctor_id: str
@@ -44,28 +207,88 @@ class ConversationCreate(BaseModel):
 class LanguageUpdate(BaseModel):
     language: str
 
-# In-memory storage (replace with database in production)
-conversations = {}
+class Job(BaseModel):
+    id: str
+    conversation_id: str
+    status: str
+    stage: Optional[str] = None
+    completed_stages: List[str] = []
+    attempts: int = 0
+    error: Optional[str] = None
+    # Set once the job succeeds: the stages its latency waited on, and the time they took
+    critical_path: Optional[dict] = None
+    created_at: datetime
+    updated_at: datetime
+
+def to_api(row: dict) -> dict:
+    # The store uses integer ids; the API has always exposed them as strings
+    return {**row, "id": str(row["id"])}
 
 @app.middleware("http")
-async def language_middleware(request: Request, call_next):
-    # Get language from cookie or default to English
-    language = request.cookies.get("language", "en")
-    language_service.set_language(language)
-    response = await call_next(request)
+async def metrics_middleware(request: Request, call_next):
+    # Send "X-Trace: 1" to get a Server-Timing breakdown of the stages this request ran
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    traced = metrics.METRICS_TRACE_ALL or request.headers.get("x-trace") == "1"
+    token = metrics.start_trace() if traced else None
+    metrics.HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.HTTP_IN_FLIGHT.dec()
+        # Label by route template, not raw path, to keep the series count bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.HTTP_REQUESTS.observe(elapsed, method=request.method, route=route, status=status)
+        timing = metrics.end_trace(token) if token is not None else None
+    response.headers["X-Request-ID"] = request_id
+    if timing is not None:
+        response.headers["Server-Timing"] = ", ".join(filter(None, [timing, f"total;dur={elapsed * 1000:.1f}"]))
     return response
 
+@app.middleware("http")
+async def language_middleware(request: Request, call_next):
+    # The cookie's language applies to this request only; unknown codes fall back to English
+    language_service = request.app.state.language_service
+    token = language_service.activate(request.cookies.get("language"))
+    try:
+        return await call_next(request)
+    finally:
+        language_service.deactivate(token)
+
 @app.get("/")
 async def root():
-    return {"message": language_service.get_translation("welcome")}
+    return {"message": app.state.language_service.get_translation("welcome")}
+
+@app.get("/health")
+async def health():
+    # Liveness: the process is up and serving, warmed up or not
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    # Readiness: 503 with per-step progress until the warm-up is done
+    status = app.state.warmup.status()
+    return JSONResponse(status_code=200 if app.state.warmup.ready else 503, content=status)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/translations")
-async def get_translations():
-    return language_service.get_all_translations()
+async def get_translations(request: Request):
+    # Serialized once per catalog load; clients revalidate with If-None-Match and get a 304
+    bundle = app.state.language_service.bundle()
+    headers = {"ETag": bundle.etag, "Cache-Control": "no-cache", "Vary": "Cookie"}
+    if bundle.etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(bundle.body, media_type="application/json", headers=headers)
 
 @app.post("/language")
 async def set_language(language_update: LanguageUpdate):
-    if language_service.set_language(language_update.language):
+    if app.state.language_service.is_supported(language_update.language):
         response = JSONResponse(content={"message": "Language updated successfully"})
         response.set_cookie(
             key="language",
@@ -79,33 +302,202 @@ async def set_language(language_update: LanguageUpdate):
 
 @app.post("/conversations/", response_model=Conversation)
 async def create_conversation(conversation: ConversationCreate):
-    conversation_id = str(len(conversations) + 1)
-    new_conversation = Conversation(
-        id=conversation_id,
-        doctor_id=conversation.doctor_id,
-        patient_id=conversation.patient_id,
-        date=datetime.now(),
-    )
-    conversations[conversation_id] = new_conversation
-    return new_conversation
+    return to_api(app.state.conversation_store.create(conversation.doctor_id, conversation.patient_id))
+
+@app.get("/conversations/", response_model=ConversationPage)
+async def get_conversations(
+    doctor_id: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    try:
+        items, next_cursor = app.state.conversation_store.list_page(doctor_id, patient_id, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [to_api(item) for item in items], "next_cursor": next_cursor}
 
-@app.get("/conversations/", response_model=List[Conversation])
-async def get_conversations():
-    return list(conversations.values())
+@app.get("/conversations/search", response_model=List[ConversationSearchResult])
+async def search_conversations(
+    q: str = Query(..., min_length=1),
+    doctor_id: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_PAGE_SIZE)
+):
+    results = app.state.conversation_store.search(q, doctor_id, patient_id, date_from, date_to, limit)
+    return [to_api(result) for result in results]
 
 @app.get("/conversations/{conversation_id}", response_model=Conversation)
 async def get_conversation(conversation_id: str):
-    if conversation_id not in conversations:
+    conversation = app.state.conversation_store.get(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return to_api(conversation)
+
+@app.get("/conversations/{conversation_id}/similar", response_model=List[SimilarConversation])
+async def similar_conversations(conversation_id: str, k: int = Query(DEFAULT_SIMILAR_K, ge=1, le=MAX_PAGE_SIZE)):
+    conversation = app.state.conversation_store.get(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if not conversation["summary"]:
+        raise HTTPException(status_code=409, detail="Conversation has no summary yet")
+    if not app.state.warmup.ready:
+        raise HTTPException(status_code=503, detail="Similar conversations are warming up", headers={"Retry-After": "5"})
+    matches = await app.state.similar_sessions.similar(conversation["id"], conversation["summary"], k)
+    if matches is None:
+        raise HTTPException(status_code=503, detail="Similar conversations are unavailable")
+    scores = dict(matches)
+    rows = app.state.conversation_store.list_by_ids([match_id for match_id, _ in matches])
+    return [to_api({**row, "score": scores[row["id"]]}) for row in rows]
+
+@app.get("/conversations/{conversation_id}/summary/stream")
+async def stream_summary(conversation_id: str, bypass_cache: bool = False):
+    conversation = app.state.conversation_store.get(conversation_id)
+    if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return conversations[conversation_id]
+    if not conversation["transcript"]:
+        raise HTTPException(status_code=409, detail="Conversation has no transcript yet")
+
+    from services.audio_service import extract_diseases
+
+    # Server-sent events: one "token" event per delta, then "done" with the full summary
+    async def events():
+        parts = []
+        try:
+            async for delta in app.state.audio_service.stream_summary(conversation["transcript"], bypass_cache):
+                parts.append(delta)
+                yield f"event: token\ndata: {json.dumps({'delta': delta})}\n\n"
+        except Exception as e:
+            print(f"Error streaming summary: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Summary generation failed'})}\n\n"
+            return
+        summary = "".join(parts)
+        app.state.conversation_store.update(conversation_id, summary=summary, diseases=extract_diseases(summary))
+        if app.state.warmup.ready:
+            await app.state.similar_sessions.add(conversation_id, summary)
+        yield f"event: done\ndata: {json.dumps({'summary': summary})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+# The body is parsed by the handler rather than as an UploadFile, so oversized uploads are rejected
+# before they are written to disk
+RECORD_REQUEST_BODY = {
+    "required": True,
+    "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "properties": {"file": {"type": "string", "format": "binary"}},
+        "required": ["file"]
+    }}}
+}
 
-@app.post("/conversations/{conversation_id}/record")
-async def upload_recording(conversation_id: str, file: UploadFile = File(...)):
-    if conversation_id not in conversations:
+@app.post("/conversations/{conversation_id}/record", response_model=Job, status_code=202,
+          openapi_extra={"requestBody": RECORD_REQUEST_BODY})
+async def upload_recording(conversation_id: str, request: Request, bypass_cache: bool = False):
+    if not app.state.conversation_store.exists(conversation_id):
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    # TODO: Implement audio processing and transcription
-    return {"message": "Recording uploaded successfully"}
+
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+
+    def audio_path(filename: str) -> str:
+        extension = os.path.splitext(filename)[1] or ".wav"
+        return os.path.join(RECORDINGS_DIR, f"{conversation_id}-{uuid.uuid4().hex}{extension}")
+
+    try:
+        upload = await spool_multipart_file(request, audio_path)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Transcription, summary and report run in the background; poll the job for progress
+    return app.state.job_service.enqueue(
+        conversation_id,
+        {
+            "conversation_id": conversation_id,
+            "audio_path": upload.path,
+            "size": upload.size,
+            "sha256": upload.sha256,
+            "bypass_cache": bypass_cache,
+        }
+    )
+
+@app.websocket("/conversations/{conversation_id}/live")
+async def live_transcription(websocket: WebSocket, conversation_id: str, sample_rate: int = Query(16000, ge=8000, le=192000)):
+    """Transcribe a recording while it is being made.
+
+    The client sends binary frames of 16-bit little-endian mono PCM at
+    ``sample_rate`` and the text frame ``stop`` when the recording ends. The
+    server sends ``{"type": "segments", ...}`` with each batch of newly
+    transcribed segments and the transcript so far, then ``{"type": "done"}``
+    once the last segment is in; the transcript is saved on the conversation.
+    """
+    if not app.state.conversation_store.exists(conversation_id):
+        await websocket.close(code=1008, reason="Conversation not found")
+        return
+    await websocket.accept()
+    from services.live_transcription import LiveTranscription
+    live = LiveTranscription(app.state.openai_client, sample_rate)
+
+    async def send_updates():
+        async for segments in live.updates():
+            try:
+                await websocket.send_json({
+                    "type": "segments",
+                    "segments": [{"start": s.start, "end": s.end, "text": s.text} for s in segments],
+                    "transcript": live.transcript
+                })
+            except Exception:
+                # The client left; the transcript is still finished and saved
+                pass
+
+    sender = asyncio.create_task(send_updates())
+    connected = True
+    try:
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    connected = False
+                    break
+                if message.get("bytes"):
+                    live.feed(message["bytes"])
+                elif message.get("text") == "stop":
+                    break
+        except WebSocketDisconnect:
+            connected = False
+        # A dropped connection ends the recording too; what was received is still transcribed
+        live.finish()
+        transcript = await live.wait()
+        await sender
+    finally:
+        sender.cancel()
+        await live.close()
+
+    if transcript:
+        app.state.conversation_store.update(conversation_id, transcript=transcript)
+    if connected:
+        await websocket.send_json({"type": "done", "transcript": transcript})
+        await websocket.close()
+
+@app.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    job = app.state.job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job(job_id: str):
+    if app.state.job_service.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for job in app.state.job_service.watch(job_id):
+            yield f"data: {json.dumps(job)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,47 +1,308 @@
 import os
-from pydub import AudioSegment
-import openai
-from typing import Optional
+import io
+import math
+import wave
+import audioop
+import asyncio
+import tempfile
+from array import array
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Tuple
 from dotenv import load_dotenv
+from services.openai_client import OpenAIClient
+from services.llm_cache import LLMCache, cache_key
+from services.summarizer import Summarizer
+from services.metrics import AUDIO_SECONDS, timed
+from services.vad import TRIM_SILENCE, OffsetMap, trim_silence
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
 
 load_dotenv()
 
+# Whisper rejects uploads over 25 MB; ten minutes of 64 kbps mono MP3 is ~4.8 MB.
+MAX_CHUNK_SECONDS = float(os.getenv("TRANSCRIPTION_MAX_CHUNK_SECONDS", "600"))
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "4"))
+MIN_SILENCE_MS = 700
+SILENCE_THRESHOLD_DB = 16  # below the clip's average loudness
+SILENCE_WINDOW_MS = 10
+CHUNK_BITRATE = "64k"
+# Whisper resamples to 16 kHz mono anyway, so decoding to it loses nothing
+TARGET_SAMPLE_RATE = 16000
+READ_BLOCK_MS = 1000
+SUMMARY_MODEL = "gpt-4"
+# Bump when the summary prompt changes so cached summaries are not reused
+SUMMARY_PROMPT_VERSION = "summary-v1"
+SUMMARY_SYSTEM_PROMPT = "You are a medical assistant. Summarize the following conversation in a structured format, highlighting key medical information, symptoms, and treatment discussions."
+
+
+@dataclass
+class TranscriptSegment:
+    start: float  # seconds from the start of the recording
+    end: float
+    text: str
+
+
+def plan_chunks(nonsilent_ranges: List[Tuple[int, int]], total_ms: int, max_chunk_ms: int) -> List[Tuple[int, int]]:
+    """Split [0, total_ms) into contiguous chunks of at most max_chunk_ms.
+
+    Cuts are placed in the middle of the silences between speech ranges; a
+    chunk is only hard-split when a single stretch of speech is too long.
+    """
+    if not nonsilent_ranges or total_ms <= 0:
+        return []
+
+    cuts = [
+        (prev_end + next_start) // 2
+        for (_, prev_end), (next_start, _) in zip(nonsilent_ranges, nonsilent_ranges[1:])
+    ]
+    cuts.append(total_ms)
+
+    chunks = []
+    start = 0
+    last_cut = None
+    for cut in cuts:
+        while cut - start > max_chunk_ms:
+            end = last_cut if last_cut is not None and last_cut > start else start + max_chunk_ms
+            chunks.append((start, end))
+            start = end
+            last_cut = None
+        last_cut = cut
+    if total_ms > start:
+        chunks.append((start, total_ms))
+    return chunks
+
+
+async def decode_to_wav(src_path: str, dest_path: str, sample_rate: int = TARGET_SAMPLE_RATE):
+    """Decode any ffmpeg-readable file to 16-bit mono PCM WAV at sample_rate.
+
+    ffmpeg streams from file to file, so memory use does not grow with the
+    length of the recording.
+    """
+    # pydub looks for ffmpeg when it is imported, so it is only loaded once audio arrives
+    from pydub.utils import get_encoder_name
+    process = await asyncio.create_subprocess_exec(
+        get_encoder_name(), "-nostdin", "-v", "error", "-y",
+        "-i", src_path,
+        "-ac", "1", "-ar", str(sample_rate), "-sample_fmt", "s16",
+        dest_path,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+
+
+def detect_speech_ranges(wav_path: str, min_silence_ms: int = MIN_SILENCE_MS,
+                         threshold_db: float = SILENCE_THRESHOLD_DB,
+                         window_ms: int = SILENCE_WINDOW_MS) -> Tuple[List[Tuple[int, int]], int]:
+    """Streaming equivalent of pydub's detect_nonsilent over a PCM WAV file.
+
+    Reads one block at a time and keeps only a per-window RMS array, so an
+    hour of audio costs a few MB instead of the decoded samples.
+    Returns (speech ranges in ms, total duration in ms).
+    """
+    levels = array("d")
+    sum_squares = 0.0
+    with wave.open(wav_path, "rb") as wav:
+        width = wav.getsampwidth()
+        frames_per_window = wav.getframerate() * window_ms // 1000
+        total_frames = wav.getnframes()
+        block_frames = frames_per_window * (READ_BLOCK_MS // window_ms)
+        while True:
+            block = wav.readframes(block_frames)
+            if not block:
+                break
+            step = frames_per_window * width
+            for offset in range(0, len(block), step):
+                rms = audioop.rms(block[offset:offset + step], width)
+                levels.append(rms)
+                sum_squares += rms * rms
+        total_ms = total_frames * 1000 // wav.getframerate()
+
+    if not levels or sum_squares == 0:
+        return [], total_ms
+    threshold = math.sqrt(sum_squares / len(levels)) * 10 ** (-threshold_db / 20)
+
+    ranges = []
+    start = None
+    for i, level in enumerate(levels):
+        if level > threshold and start is None:
+            start = i
+        elif level <= threshold and start is not None:
+            ranges.append([start * window_ms, i * window_ms])
+            start = None
+    if start is not None:
+        ranges.append([start * window_ms, total_ms])
+
+    # Silences shorter than min_silence_ms do not split speech
+    merged = []
+    for range_start, range_end in ranges:
+        if merged and range_start - merged[-1][1] < min_silence_ms:
+            merged[-1][1] = range_end
+        else:
+            merged.append([range_start, range_end])
+    return [tuple(r) for r in merged], total_ms
+
+
+def read_wav_slice(wav_path: str, start_ms: int, end_ms: int) -> "AudioSegment":
+    from pydub import AudioSegment
+    with wave.open(wav_path, "rb") as wav:
+        rate = wav.getframerate()
+        wav.setpos(start_ms * rate // 1000)
+        data = wav.readframes((end_ms - start_ms) * rate // 1000)
+        return AudioSegment(data=data, sample_width=wav.getsampwidth(), frame_rate=rate, channels=wav.getnchannels())
+
+
+def extract_diseases(summary: str) -> str:
+    """Pull the candidate-diagnosis lines out of a summary, comma-joined."""
+    return ",".join(
+        line.strip() for line in summary.splitlines()
+        if "possible" in line.lower() or "diagnos" in line.lower() or "可能" in line
+    )
+
+
+def _segment_field(segment, name):
+    if isinstance(segment, dict):
+        return segment.get(name)
+    return getattr(segment, name, None)
+
+
+def _export_mp3(wav_path: str, start_ms: int, end_ms: int) -> bytes:
+    buffer = io.BytesIO()
+    read_wav_slice(wav_path, start_ms, end_ms).export(buffer, format="mp3", bitrate=CHUNK_BITRATE)
+    return buffer.getvalue()
+
+
 class AudioService:
-    def __init__(self):
-        self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
+    def __init__(self, openai_client: Optional[OpenAIClient] = None, max_workers: Optional[int] = None, max_chunk_seconds: Optional[float] = None,
+                 llm_cache: Optional[LLMCache] = None):
+        self.openai_client = openai_client or OpenAIClient()
+        self.llm_cache = llm_cache or LLMCache()
+        self.summarizer = Summarizer(self.openai_client, SUMMARY_MODEL)
+        self.max_workers = max_workers or TRANSCRIPTION_WORKERS
+        self.max_chunk_ms = int((max_chunk_seconds or MAX_CHUNK_SECONDS) * 1000)
+
     async def process_audio(self, audio_file_path: str) -> Optional[str]:
+        segments = await self.transcribe_segments(audio_file_path)
+        if segments is None:
+            return None
+        return " ".join(segment.text for segment in segments if segment.text)
+
+    async def transcribe_segments(self, audio_file_path: str) -> Optional[List[TranscriptSegment]]:
+        fd, wav_path = tempfile.mkstemp(suffix=".wav", dir=os.path.dirname(audio_file_path) or None)
+        os.close(fd)
+        trimmed_path = wav_path[:-len(".wav")] + ".trimmed.wav"
         try:
-            # Convert audio to mp3 if needed
-            audio = AudioSegment.from_file(audio_file_path)
-            mp3_path = audio_file_path.replace(os.path.splitext(audio_file_path)[1], ".mp3")
-            audio.export(mp3_path, format="mp3")
-            
-            # Transcribe using OpenAI Whisper
-            with open(mp3_path, "rb") as audio_file:
-                transcript = self.openai_client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
-                )
-            
-            # Clean up temporary file
-            os.remove(mp3_path)
-            
-            return transcript.text
+            # Decode once to 16 kHz mono on disk; only one chunk per worker is ever held in memory
+            with timed("decode"):
+                await decode_to_wav(audio_file_path, wav_path)
+            with timed("detect_speech"):
+                speech, total_ms = await asyncio.to_thread(detect_speech_ranges, wav_path)
+            AUDIO_SECONDS.inc(total_ms / 1000, kind="received")
+
+            # Long pauses are cut before upload; the offset map puts segment times back on the recording
+            offsets = OffsetMap.identity(total_ms)
+            if TRIM_SILENCE and speech:
+                with timed("trim_silence"):
+                    offsets = await asyncio.to_thread(trim_silence, wav_path, trimmed_path, speech, total_ms)
+                os.replace(trimmed_path, wav_path)
+                speech = [(int(offsets.to_trimmed(start)), int(offsets.to_trimmed(end))) for start, end in speech]
+                AUDIO_SECONDS.inc(offsets.saved_seconds, kind="silence_trimmed")
+                print(f"Trimmed {offsets.saved_seconds:.1f} s of silence from {total_ms / 1000:.1f} s of audio")
+            chunks = plan_chunks(speech, offsets.trimmed_ms, self.max_chunk_ms)
+
+            # Chunks are transcribed concurrently; gather keeps them in order.
+            semaphore = asyncio.Semaphore(self.max_workers)
+
+            async def transcribe(start: int, end: int) -> List[TranscriptSegment]:
+                async with semaphore:
+                    return await self._transcribe_chunk(wav_path, start, end)
+
+            results = await asyncio.gather(*[transcribe(start, end) for start, end in chunks])
+            return [
+                TranscriptSegment(offsets.to_original(segment.start * 1000) / 1000,
+                                  offsets.to_original(segment.end * 1000) / 1000, segment.text)
+                for chunk_segments in results for segment in chunk_segments
+            ]
         except Exception as e:
             print(f"Error processing audio: {str(e)}")
             return None
-    
-    async def generate_summary(self, transcript: str) -> Optional[str]:
-        try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a medical assistant. Summarize the following conversation in a structured format, highlighting key medical information, symptoms, and treatment discussions."},
-                    {"role": "user", "content": transcript}
-                ]
+        finally:
+            for path in (wav_path, trimmed_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    async def _transcribe_chunk(self, wav_path: str, start_ms: int, end_ms: int) -> List[TranscriptSegment]:
+        with timed("encode_chunk"):
+            data = await asyncio.to_thread(_export_mp3, wav_path, start_ms, end_ms)
+        with timed("whisper"):
+            transcript = await self.openai_client.transcribe(
+                ("chunk.mp3", data),
+                response_format="verbose_json"
             )
-            return response.choices[0].message.content
+        AUDIO_SECONDS.inc((end_ms - start_ms) / 1000, kind="transcribed")
+
+        offset = start_ms / 1000
+        segments = getattr(transcript, "segments", None)
+        if not segments:
+            return [TranscriptSegment(offset, end_ms / 1000, transcript.text.strip())]
+        return [
+            TranscriptSegment(
+                offset + _segment_field(segment, "start"),
+                offset + _segment_field(segment, "end"),
+                _segment_field(segment, "text").strip()
+            )
+            for segment in segments
+        ]
+
+    async def generate_summary(self, transcript: str, bypass_cache: bool = False) -> Optional[str]:
+        key = cache_key(SUMMARY_MODEL, SUMMARY_PROMPT_VERSION, transcript)
+        if not bypass_cache:
+            cached = self.llm_cache.get(key)
+            if cached is not None:
+                return cached
+        try:
+            # Long transcripts are condensed map-reduce style to fit one prompt
+            with timed("condense"):
+                condensed = await self.summarizer.condense(transcript)
+            with timed("summarize"):
+                response = await self.openai_client.chat(
+                    model=SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                        {"role": "user", "content": condensed}
+                    ]
+                )
+            summary = response.choices[0].message.content
+            self.llm_cache.set(key, summary)
+            return summary
         except Exception as e:
             print(f"Error generating summary: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
+
+    async def stream_summary(self, transcript: str, bypass_cache: bool = False) -> AsyncIterator[str]:
+        """Like generate_summary, but yields the summary in pieces as the model produces them.
+
+        A cached summary is yielded in one piece. Errors propagate to the caller.
+        """
+        key = cache_key(SUMMARY_MODEL, SUMMARY_PROMPT_VERSION, transcript)
+        if not bypass_cache:
+            cached = self.llm_cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        with timed("condense"):
+            condensed = await self.summarizer.condense(transcript)
+        async for delta in self.openai_client.chat_stream(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": condensed}
+            ]
+        ):
+            parts.append(delta)
+            yield delta
+        self.llm_cache.set(key, "".join(parts))
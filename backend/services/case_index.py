@@ -0,0 +1,188 @@
+import os
+import json
+import hashlib
+import chromadb
+from langchain.vectorstores import Chroma
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import Callable, Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+from services.pdf_extractor import PdfExtractor
+
+load_dotenv()
+
+CASES_DIR = os.getenv("CASES_DIR", "backend/data/cases")
+INDEX_DIR = os.getenv("INDEX_DIR", "backend/data/index")
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+COLLECTION_NAME = "medical_cases"
+MANIFEST_FILE = "cases_manifest.json"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Chunks handed to the vector store (and so the embedder) per call
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+PDF_TEXT_CACHE = "pdf_text"
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def create_chroma_client(index_dir: str = INDEX_DIR):
+    # Use the docker-compose chroma service when configured, otherwise an on-disk store
+    if CHROMA_HOST:
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    return chromadb.PersistentClient(path=os.path.join(index_dir, "chroma"))
+
+
+class CaseIndex:
+    """Incrementally maintained Chroma collection over the case PDFs.
+
+    A manifest maps each PDF to the SHA-256 of its content and the ids of the
+    chunks it produced. ``sync`` only embeds new or changed files and deletes
+    the chunks of removed ones, so an unchanged corpus costs no embedding calls.
+    PDFs are parsed page by page in a process pool and their text is cached by
+    hash, so re-adding a file that was indexed before skips parsing. A file
+    that cannot be read or parsed is skipped and listed in ``failed``; it is
+    left out of the manifest, so the next sync tries it again.
+    """
+
+    def __init__(self, embeddings, cases_dir: str = CASES_DIR, index_dir: str = INDEX_DIR,
+                 client=None, collection_name: str = COLLECTION_NAME):
+        self.cases_dir = cases_dir
+        self.index_dir = index_dir
+        os.makedirs(cases_dir, exist_ok=True)
+        os.makedirs(index_dir, exist_ok=True)
+        self.manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        self._fingerprint = None
+        # File -> error of the case PDFs the last sync could not index
+        self.failed: Dict[str, str] = {}
+        self.vector_store = Chroma(
+            client=client or create_chroma_client(index_dir),
+            collection_name=collection_name,
+            embedding_function=embeddings
+        )
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP
+        )
+        self.extractor = PdfExtractor(os.path.join(index_dir, PDF_TEXT_CACHE))
+
+    def fingerprint(self) -> str:
+        """Hash of the indexed corpus; changes whenever any case PDF is added, changed or removed."""
+        if self._fingerprint is None:
+            manifest = self._load_manifest()
+            entries = sorted((file, entry["sha256"]) for file, entry in manifest.items())
+            self._fingerprint = hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()[:16]
+        return self._fingerprint
+
+    def count(self) -> int:
+        return self.vector_store._collection.count()
+
+    def sync(self, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """Bring the collection in line with the case directory; ``progress(done, total)`` follows changed files."""
+        self._fingerprint = None
+        self.failed = {}
+        manifest = self._load_manifest()
+        if any(entry.get("ids") for entry in manifest.values()) and self.count() == 0:
+            # The collection was wiped (e.g. a fresh chroma volume); re-embed everything
+            manifest = {}
+
+        current = {}
+        for file in sorted(os.listdir(self.cases_dir)):
+            if not file.endswith(".pdf"):
+                continue
+            try:
+                current[file] = file_sha256(os.path.join(self.cases_dir, file))
+            except OSError as e:
+                self._skip(file, e)
+        # An unreadable file keeps its chunks until it can be read again
+        removed = [file for file in manifest if file not in current and file not in self.failed]
+        changed = [file for file, sha in current.items() if manifest.get(file, {}).get("sha256") != sha]
+        new = {file for file in changed if file not in manifest}
+        stats = {
+            "added": len(new),
+            "updated": len(changed) - len(new),
+            "removed": len(removed),
+            "unchanged": len(current) - len(changed),
+            "failed": 0,
+        }
+
+        for file in removed + changed:
+            ids = manifest.pop(file, {}).get("ids")
+            if ids:
+                self.vector_store.delete(ids=ids)
+        if removed or changed:
+            self._save_manifest(manifest)
+
+        if progress:
+            progress(0, len(changed))
+        try:
+            # Later files are parsed in the background while earlier ones are split and embedded
+            sources = ((os.path.join(self.cases_dir, file), current[file]) for file in changed)
+            for done, (path, sha, pages) in enumerate(self.extractor.extract(sources), 1):
+                file = os.path.basename(path)
+                try:
+                    ids = self._add_file(file, sha, pages)
+                except Exception as e:
+                    # One broken PDF must not keep the rest of the corpus out of the index
+                    self._skip(file, e)
+                    stats["added" if file in new else "updated"] -= 1
+                else:
+                    manifest[file] = {"sha256": sha, "ids": ids}
+                    # Saved per file so an interrupted sync resumes where it stopped
+                    self._save_manifest(manifest)
+                if progress:
+                    progress(done, len(changed))
+        finally:
+            # Worker processes are only needed while syncing
+            self.extractor.shutdown()
+
+        stats["failed"] = len(self.failed)
+        return stats
+
+    def _skip(self, file: str, error: Exception):
+        print(f"Error indexing case {file}: {str(error)}")
+        self.failed[file] = str(error)
+
+    def _add_file(self, file: str, sha: str, pages: Iterable[str]) -> List[str]:
+        source = os.path.join(self.cases_dir, file)
+        ids: List[str] = []
+        batch: List[Document] = []
+        try:
+            for page, text in enumerate(pages):
+                # One document per page, as PyPDFLoader produced, split as pages arrive
+                document = Document(page_content=text, metadata={"source": source, "page": page, "sha256": sha})
+                batch.extend(self.text_splitter.split_documents([document]))
+                if len(batch) >= INDEX_BATCH_SIZE:
+                    ids.extend(self._add_batch(file, sha, batch, len(ids)))
+                    batch = []
+            if batch:
+                ids.extend(self._add_batch(file, sha, batch, len(ids)))
+        except Exception:
+            # Not in the manifest yet, so nothing else would ever delete these chunks
+            if ids:
+                self.vector_store.delete(ids=ids)
+            raise
+        return ids
+
+    def _add_batch(self, file: str, sha: str, documents: List[Document], offset: int) -> List[str]:
+        ids = [f"{file}:{sha[:16]}:{offset + i}" for i in range(len(documents))]
+        self.vector_store.add_documents(documents, ids=ids)
+        return ids
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: Dict[str, Dict]):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
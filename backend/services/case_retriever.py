@@ -0,0 +1,176 @@
+import os
+import asyncio
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+from dotenv import load_dotenv
+from services.case_index import CaseIndex
+from services.summarizer import count_tokens
+from services.metrics import record_cache, timed
+
+load_dotenv()
+
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+# "mmr" trades a little relevance for chunks that do not repeat each other; "similarity" is plain top-k
+RETRIEVAL_SEARCH_TYPE = os.getenv("RETRIEVAL_SEARCH_TYPE", "mmr")
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.5"))
+# Upper bound on case-context tokens stuffed into the report prompt
+REPORT_CONTEXT_TOKENS = int(os.getenv("REPORT_CONTEXT_TOKENS", "2000"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))
+# Queries whose embeddings are at least this similar share cached results
+RETRIEVAL_CACHE_SIMILARITY = float(os.getenv("RETRIEVAL_CACHE_SIMILARITY", "0.98"))
+# Shortest suffix/prefix match treated as splitter overlap rather than coincidence
+MIN_CHUNK_OVERLAP = 40
+
+
+def _overlap(left: str, right: str, min_overlap: int) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``, or 0 if under ``min_overlap``."""
+    for size in range(min(len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_overlapping(documents: List[Document], min_overlap: int = MIN_CHUNK_OVERLAP) -> List[Document]:
+    """Drop repeated chunks and stitch neighbours from the same source back together.
+
+    The case splitter repeats up to ``CHUNK_OVERLAP`` characters between
+    consecutive chunks, so retrieving two neighbours would pay for that text
+    twice. Documents keep the rank of their best-ranked piece.
+    """
+    merged: List[Document] = []
+    for document in documents:
+        text = document.page_content
+        source = document.metadata.get("source")
+        for i, kept in enumerate(merged):
+            if kept.metadata.get("source") != source:
+                continue
+            if text in kept.page_content:
+                break
+            if kept.page_content in text:
+                merged[i] = Document(page_content=text, metadata=kept.metadata)
+                break
+            size = _overlap(kept.page_content, text, min_overlap)
+            if size:
+                merged[i] = Document(page_content=kept.page_content + text[size:], metadata=kept.metadata)
+                break
+            size = _overlap(text, kept.page_content, min_overlap)
+            if size:
+                merged[i] = Document(page_content=text + kept.page_content[size:], metadata=kept.metadata)
+                break
+        else:
+            merged.append(document)
+    return merged
+
+
+def fit_to_budget(documents: List[Document], max_tokens: int) -> List[Document]:
+    """Keep documents in rank order while they fit in ``max_tokens``; the first is trimmed if it alone is too long."""
+    kept = []
+    used = 0
+    for document in documents:
+        tokens = count_tokens(document.page_content)
+        if used + tokens > max_tokens:
+            if not kept:
+                # Roughly 4 characters per token
+                kept.append(Document(page_content=document.page_content[:max_tokens * 4], metadata=document.metadata))
+            break
+        kept.append(document)
+        used += tokens
+    return kept
+
+
+class CaseRetriever:
+    """Retrieves case context for a report, with a cache keyed on the query embedding.
+
+    A query seen before (up to whitespace) reuses its embedding; a cached
+    result is reused when a previous query's embedding is within
+    ``cache_similarity`` (cosine) and the case corpus has not changed since. Results are MMR or top-k searches, merged
+    where chunks overlap and trimmed to ``max_context_tokens``.
+    """
+
+    def __init__(self, case_index: CaseIndex, embeddings, k: Optional[int] = None, search_type: Optional[str] = None,
+                 fetch_k: Optional[int] = None, lambda_mult: Optional[float] = None,
+                 max_context_tokens: Optional[int] = None, cache_size: Optional[int] = None,
+                 cache_similarity: Optional[float] = None):
+        self.case_index = case_index
+        self.embeddings = embeddings
+        self.k = k or RETRIEVAL_K
+        self.search_type = search_type or RETRIEVAL_SEARCH_TYPE
+        self.fetch_k = fetch_k or RETRIEVAL_FETCH_K
+        self.lambda_mult = RETRIEVAL_MMR_LAMBDA if lambda_mult is None else lambda_mult
+        self.max_context_tokens = max_context_tokens or REPORT_CONTEXT_TOKENS
+        self.cache_size = RETRIEVAL_CACHE_SIZE if cache_size is None else cache_size
+        self.cache_similarity = cache_similarity or RETRIEVAL_CACHE_SIMILARITY
+        self._cache: "OrderedDict[int, Tuple[np.ndarray, List[Document]]]" = OrderedDict()
+        self._cache_fingerprint = None
+        self._next_id = 0
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def settings_key(self) -> str:
+        """Identifies everything about retrieval that changes the context a report sees."""
+        return f"{self.search_type}:{self.k}:{self.fetch_k}:{self.lambda_mult}:{self.max_context_tokens}"
+
+    async def retrieve(self, query: str) -> List[Document]:
+        vector = await self._embed(query)
+        norm = np.linalg.norm(vector)
+        unit = vector / norm if norm else vector
+
+        documents = self._lookup(unit)
+        record_cache("retrieval", documents is not None)
+        if documents is not None:
+            return documents
+
+        with timed("retrieve"):
+            if self.search_type == "mmr":
+                found = await asyncio.to_thread(
+                    self.case_index.vector_store.max_marginal_relevance_search_by_vector,
+                    vector.tolist(), k=self.k, fetch_k=max(self.fetch_k, self.k), lambda_mult=self.lambda_mult
+                )
+            else:
+                found = await asyncio.to_thread(
+                    self.case_index.vector_store.similarity_search_by_vector, vector.tolist(), k=self.k
+                )
+        documents = fit_to_budget(merge_overlapping(found), self.max_context_tokens)
+        self._store(unit, documents)
+        return documents
+
+    async def _embed(self, query: str) -> np.ndarray:
+        key = " ".join(query.split())
+        vector = self._vectors.get(key)
+        if vector is not None:
+            self._vectors.move_to_end(key)
+            return vector
+        with timed("embed_query"):
+            vector = np.asarray(await self.embeddings.aembed_query(query), dtype=np.float32)
+        if self.cache_size:
+            self._vectors[key] = vector
+            while len(self._vectors) > self.cache_size:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def _lookup(self, unit: np.ndarray) -> Optional[List[Document]]:
+        fingerprint = self.case_index.fingerprint()
+        if fingerprint != self._cache_fingerprint:
+            # The corpus changed; every cached result may be stale
+            self._cache.clear()
+            self._cache_fingerprint = fingerprint
+        if not self._cache:
+            return None
+        ids = list(self._cache)
+        matrix = np.stack([self._cache[entry_id][0] for entry_id in ids])
+        similarities = matrix @ unit
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.cache_similarity:
+            return None
+        self._cache.move_to_end(ids[best])
+        return self._cache[ids[best]][1]
+
+    def _store(self, unit: np.ndarray, documents: List[Document]):
+        if not self.cache_size:
+            return
+        self._cache[self._next_id] = (unit, documents)
+        self._next_id += 1
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
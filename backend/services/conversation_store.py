@@ -0,0 +1,284 @@
+import os
+import html
+import json
+import base64
+import sqlite3
+import threading
+from datetime import date as date_type, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONVERSATIONS_DB_PATH = os.getenv("CONVERSATIONS_DB_PATH", "backend/data/conversations.db")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Columns returned by list views; transcript, summary and report are only loaded by get()
+LIST_COLUMNS = ("id", "doctor_id", "patient_id", "date")
+UPDATABLE_COLUMNS = ("summary", "transcript", "report", "diseases")
+DEFAULT_SEARCH_LIMIT = 20
+# bm25 column weights for (transcript, summary, diseases): a hit in the
+# distilled summary or diagnosis list says more than one in the raw transcript
+SEARCH_WEIGHTS = (1.0, 2.0, 4.0)
+# FTS marks matches with these private-use characters; the text around them is escaped before they
+# become <mark> tags, so a snippet is safe to render as HTML
+SNIPPET_OPEN, SNIPPET_CLOSE = "\ue000", "\ue001"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(date: str, conversation_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([date, conversation_id]).encode()).decode()
+
+
+def to_match_query(query: str) -> str:
+    """Turn free text into an FTS5 query that ANDs every term, each quoted so
+    user input cannot inject FTS operators."""
+    terms = query.split()
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def highlight_snippet(snippet: Optional[str]) -> str:
+    """HTML-escape an FTS snippet, keeping only its match markers as <mark> tags."""
+    escaped = html.escape(snippet or "")
+    return escaped.replace(SNIPPET_OPEN, "<mark>").replace(SNIPPET_CLOSE, "</mark>")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        date, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(date), int(conversation_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+class ConversationStore:
+    """SQLite-backed conversations with keyset pagination and full-text search.
+
+    Ids come from AUTOINCREMENT, so they are unique across workers and never
+    reused. Listings are ordered newest first by (date, id) and served from
+    indexes, so a page costs the same at 100 rows as at 100k. An FTS5 index
+    over transcript, summary and diseases is kept in step by triggers.
+    """
+
+    def __init__(self, db_path: str = CONVERSATIONS_DB_PATH):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doctor_id TEXT NOT NULL,
+                    patient_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    summary TEXT,
+                    transcript TEXT,
+                    report TEXT,
+                    diseases TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_conversations_date ON conversations (date DESC, id DESC);
+                CREATE INDEX IF NOT EXISTS idx_conversations_doctor ON conversations (doctor_id, date DESC, id DESC);
+                CREATE INDEX IF NOT EXISTS idx_conversations_patient ON conversations (patient_id, date DESC, id DESC);
+            ''')
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(conversations)")]
+            if "diseases" not in columns:
+                self._conn.execute("ALTER TABLE conversations ADD COLUMN diseases TEXT")
+            self._create_search_index()
+            self._conn.commit()
+
+    def _create_search_index(self):
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+        ).fetchone()
+        # External-content table: the text lives only in conversations, the index in conversations_fts
+        self._conn.executescript('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+                transcript, summary, diseases,
+                content='conversations', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+                INSERT INTO conversations_fts (rowid, transcript, summary, diseases)
+                VALUES (new.id, new.transcript, new.summary, new.diseases);
+            END;
+            CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+                INSERT INTO conversations_fts (conversations_fts, rowid, transcript, summary, diseases)
+                VALUES ('delete', old.id, old.transcript, old.summary, old.diseases);
+            END;
+            CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE OF transcript, summary, diseases ON conversations BEGIN
+                INSERT INTO conversations_fts (conversations_fts, rowid, transcript, summary, diseases)
+                VALUES ('delete', old.id, old.transcript, old.summary, old.diseases);
+                INSERT INTO conversations_fts (rowid, transcript, summary, diseases)
+                VALUES (new.id, new.transcript, new.summary, new.diseases);
+            END;
+        ''')
+        if not exists:
+            # Index rows written before search existed
+            self._conn.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def create(self, doctor_id: str, patient_id: str, date: Optional[datetime] = None) -> Dict:
+        date = (date or datetime.now()).isoformat()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO conversations (doctor_id, patient_id, date) VALUES (?,?,?)",
+                (doctor_id, patient_id, date)
+            )
+            self._conn.commit()
+        return self.get(cursor.lastrowid)
+
+    def get(self, conversation_id) -> Optional[Dict]:
+        try:
+            conversation_id = int(conversation_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def exists(self, conversation_id) -> bool:
+        try:
+            conversation_id = int(conversation_id)
+        except (TypeError, ValueError):
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def list_by_ids(self, ids: List[int]) -> List[Dict]:
+        """List columns of the given conversations, in the order of ``ids``; unknown ids are skipped."""
+        if not ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(LIST_COLUMNS)} FROM conversations WHERE id IN ({','.join('?' * len(ids))})",
+                [int(conversation_id) for conversation_id in ids]
+            ).fetchall()
+        by_id = {row["id"]: dict(row) for row in rows}
+        return [by_id[int(conversation_id)] for conversation_id in ids if int(conversation_id) in by_id]
+
+    def iter_summaries(self, batch_size: int = 500) -> Iterator[Tuple[int, str]]:
+        """Yield (id, summary) for every summarized conversation, in id order, a batch at a time."""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, summary FROM conversations WHERE id > ? AND summary IS NOT NULL ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row["id"], row["summary"]
+            last_id = rows[-1]["id"]
+
+    def update(self, conversation_id, **fields) -> bool:
+        unknown = set(fields) - set(UPDATABLE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot update columns: {', '.join(sorted(unknown))}")
+        if not fields:
+            return self.exists(conversation_id)
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE conversations SET {assignments} WHERE id = ?",
+                (*fields.values(), int(conversation_id))
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def list_page(self, doctor_id: Optional[str] = None, patient_id: Optional[str] = None,
+                  limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Return one page of lightweight rows and the cursor for the next page (None on the last page)."""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conditions = []
+        params = []
+        if doctor_id is not None:
+            conditions.append("doctor_id = ?")
+            params.append(doctor_id)
+        if patient_id is not None:
+            conditions.append("patient_id = ?")
+            params.append(patient_id)
+        if cursor:
+            conditions.append("(date, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # Fetch one extra row to learn whether another page exists
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(LIST_COLUMNS)} FROM conversations {where} ORDER BY date DESC, id DESC LIMIT ?",
+                (*params, limit + 1)
+            ).fetchall()
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor(last["date"], last["id"])
+        return items, next_cursor
+
+    def search(self, query: str, doctor_id: Optional[str] = None, patient_id: Optional[str] = None,
+               date_from: Optional[date_type] = None, date_to: Optional[date_type] = None,
+               limit: int = DEFAULT_SEARCH_LIMIT) -> List[Dict]:
+        """Rank conversations matching every term in query by BM25, best first.
+
+        date_from and date_to are inclusive calendar dates. Each result has the
+        list columns plus ``score`` (lower is better) and a ``snippet``: HTML-escaped
+        text with the matched terms in ``<mark>`` tags.
+        """
+        match = to_match_query(query)
+        if not match:
+            return []
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conditions = []
+        params = []
+        if doctor_id is not None:
+            conditions.append("c.doctor_id = ?")
+            params.append(doctor_id)
+        if patient_id is not None:
+            conditions.append("c.patient_id = ?")
+            params.append(patient_id)
+        if date_from is not None:
+            conditions.append("c.date >= ?")
+            params.append(date_from.isoformat())
+        if date_to is not None:
+            conditions.append("c.date < ?")
+            params.append((date_to + timedelta(days=1)).isoformat())
+        # Only join the base table when a filter needs it; ranking alone runs on the index
+        join = "JOIN conversations c ON c.id = conversations_fts.rowid" if conditions else ""
+        filters = "".join(f" AND {condition}" for condition in conditions)
+
+        # Rank first, then build snippets for the top rows only: snippet() is
+        # the expensive part and would otherwise run for every match
+        columns = ", ".join(f"c.{column}" for column in LIST_COLUMNS)
+        weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""WITH ranked AS (
+                        SELECT conversations_fts.rowid AS id, bm25(conversations_fts, {weights}) AS score
+                        FROM conversations_fts {join}
+                        WHERE conversations_fts MATCH ?{filters}
+                        ORDER BY score
+                        LIMIT ?
+                    )
+                    SELECT {columns}, ranked.score,
+                           (SELECT snippet(conversations_fts, -1, ?, ?, '…', 16)
+                            FROM conversations_fts
+                            WHERE conversations_fts MATCH ? AND rowid = ranked.id) AS snippet
+                    FROM ranked
+                    JOIN conversations c ON c.id = ranked.id
+                    ORDER BY ranked.score""",
+                (match, *params, limit, SNIPPET_OPEN, SNIPPET_CLOSE, match)
+            ).fetchall()
+        return [{**dict(row), "snippet": highlight_snippet(row["snippet"])} for row in rows]
@@ -0,0 +1,223 @@
+import os
+import time
+import asyncio
+import hashlib
+import sqlite3
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from dotenv import load_dotenv
+from services.local_clients import LocalEmbeddings
+from services.metrics import record_cache, timed
+from services.summarizer import count_tokens
+
+load_dotenv()
+
+# "openai", "local" (hashed stand-in), "huggingface", or "package.module:Class" for any LangChain Embeddings
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "openai")
+EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "backend/data/embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+# Most tokens and texts sent to the embedding model in one request
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "50000"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "1000"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+
+def create_embeddings(backend: str = EMBEDDINGS_BACKEND) -> Embeddings:
+    """Build the embedding model named by ``backend``; local models need no network."""
+    if backend == "local":
+        return LocalEmbeddings()
+    if backend == "huggingface":
+        # Needs sentence-transformers; the model is downloaded once and then runs offline
+        from langchain.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL)
+    if ":" in backend:
+        module, name = backend.split(":", 1)
+        return getattr(importlib.import_module(module), name)()
+    from langchain.embeddings import OpenAIEmbeddings
+    return OpenAIEmbeddings()
+
+
+def model_id(embeddings: Embeddings) -> str:
+    """Name of the model behind ``embeddings``; vectors from different models never share cache entries."""
+    if isinstance(embeddings, LocalEmbeddings):
+        return f"local-{embeddings.dimensions}"
+    for attribute in ("model", "model_name", "model_id"):
+        value = getattr(embeddings, attribute, None)
+        if isinstance(value, str):
+            return f"{type(embeddings).__name__}:{value}"
+    return type(embeddings).__name__
+
+
+def normalize(text: str) -> str:
+    # Chunks that differ only in whitespace (re-flowed PDF boilerplate) share one vector
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Persistent map from (model, kind, normalized text) hashes to vectors.
+
+    Vectors are stored as float32 blobs. Once the cache holds more than
+    ``max_entries`` the least recently read entries are evicted.
+    """
+
+    def __init__(self, db_path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS embedding_cache (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                accessed_at REAL NOT NULL
+            )''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_accessed ON embedding_cache (accessed_at)")
+            self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embedding_cache WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+            if found:
+                self._conn.executemany("UPDATE embedding_cache SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def set_many(self, items: Iterable[Tuple[str, List[float]]]):
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embedding_cache (key, vector, accessed_at) VALUES (?,?,?)", rows)
+            count = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embedding_cache WHERE key IN (SELECT key FROM embedding_cache ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BatchedEmbeddings(Embeddings):
+    """Wraps any LangChain embedding model with dedup, token-budget batching and a vector cache.
+
+    Texts are deduplicated by the hash of their normalized form and looked up
+    in ``cache``; only the rest reach the model, packed into batches of at
+    most ``batch_tokens`` tokens and ``batch_size`` texts that run
+    ``concurrency`` at a time. ``embedded_texts`` counts texts actually sent.
+    """
+
+    def __init__(self, model: Embeddings, cache: Optional[EmbeddingCache] = None, batch_tokens: int = EMBED_BATCH_TOKENS,
+                 batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY):
+        self.model = model
+        self.model_id = model_id(model)
+        self.cache = cache
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.embedded_texts = 0
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="embed")
+        self._lock = threading.Lock()
+
+    def key(self, text: str, kind: str = "document") -> str:
+        # Some models embed queries differently from documents, so the two never share entries
+        return hashlib.sha256(f"{self.model_id}\0{kind}\0{normalize(text)}".encode("utf-8")).hexdigest()
+
+    def batches(self, texts: List[str]) -> List[List[int]]:
+        """Indexes of ``texts`` grouped into batches that fit the token and size budgets."""
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        tokens = 0
+        for i, text in enumerate(texts):
+            size = count_tokens(text)
+            if batch and (tokens + size > self.batch_tokens or len(batch) >= self.batch_size):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(i)
+            tokens += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        first: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            first.setdefault(key, text)
+
+        vectors = self.cache.get_many(list(first)) if self.cache else {}
+        record_cache("embedding", True, len(vectors))
+        missing = [key for key in first if key not in vectors]
+        record_cache("embedding", False, len(missing))
+
+        if missing:
+            missing_texts = [first[key] for key in missing]
+            batches = self.batches(missing_texts)
+            with timed("embed"):
+                results = list(self._pool.map(lambda batch: self._embed_batch([missing_texts[i] for i in batch]), batches))
+            embedded = [(missing[i], vector) for batch, result in zip(batches, results) for i, vector in zip(batch, result)]
+            vectors.update(embedded)
+            if self.cache:
+                self.cache.set_many(embedded)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key, vector = self._cached_query(text)
+        if vector is None:
+            vector = self.model.embed_query(text)
+            self._store_query(key, vector)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key, vector = self._cached_query(text)
+        if vector is None:
+            vector = await self.model.aembed_query(text)
+            self._store_query(key, vector)
+        return vector
+
+    def close(self):
+        self._pool.shutdown()
+        if self.cache:
+            self.cache.close()
+
+    def _cached_query(self, text: str) -> Tuple[str, Optional[List[float]]]:
+        key = self.key(text, "query")
+        vector = self.cache.get_many([key]).get(key) if self.cache else None
+        record_cache("embedding", vector is not None)
+        return key, vector
+
+    def _store_query(self, key: str, vector: List[float]):
+        self._count(1)
+        if self.cache:
+            self.cache.set_many([(key, vector)])
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.embed_documents(texts)
+        self._count(len(texts))
+        return vectors
+
+    def _count(self, n: int):
+        with self._lock:
+            self.embedded_texts += n
@@ -0,0 +1,216 @@
+import os
+import json
+import uuid
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+from services.metrics import JOBS, PIPELINE_SECONDS, timed
+from services.stage_graph import StageEntry, StageGraph, critical_path
+
+load_dotenv()
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "backend/data/jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "2"))
+WATCH_POLL_INTERVAL = 5.0
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATUSES = (SUCCEEDED, FAILED)
+
+PUBLIC_FIELDS = ("id", "conversation_id", "status", "stage", "completed_stages", "attempts", "error", "critical_path",
+                 "created_at", "updated_at")
+
+
+class JobService:
+    """Persistent background jobs that run a fixed graph of stages.
+
+    A stage starts as soon as the stages it needs have completed, so
+    independent stages of a job run concurrently. Jobs live in SQLite, so
+    unfinished jobs are picked up again on restart and resume with the stages
+    they had not completed. Each stage is retried with exponential backoff
+    before the job is marked failed. A finished job records its critical
+    path: the chain of stages its latency was spent waiting on.
+    """
+
+    def __init__(self, stages: List[StageEntry], db_path: str = JOBS_DB_PATH, workers: int = JOB_WORKERS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, retry_delay: float = JOB_RETRY_DELAY):
+        self.graph = StageGraph(stages)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._changed = asyncio.Condition()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                conversation_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                completed_stages TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                context TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if "critical_path" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN critical_path TEXT")
+            self._conn.commit()
+
+    async def start(self):
+        # Anything queued or running when the process stopped is resumed
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING)
+            ).fetchall()
+        for row in rows:
+            self._queue.put_nowait(row["id"])
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, conversation_id: str, payload: Dict) -> Dict:
+        now = datetime.now().isoformat()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, conversation_id, status, completed_stages, context, created_at, updated_at) VALUES (?,?,?,?,?,?,?)",
+                (job_id, conversation_id, QUEUED, "[]", json.dumps(payload), now, now)
+            )
+            self._conn.commit()
+        self._queue.put_nowait(job_id)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        job = self._load(job_id)
+        if job is None:
+            return None
+        return {field: job[field] for field in PUBLIC_FIELDS}
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict]:
+        """Yield the job every time it changes, until it succeeds or fails."""
+        last_seen = None
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job != last_seen:
+                last_seen = job
+                yield job
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            async with self._changed:
+                try:
+                    # The timeout covers a change that landed between get() and wait()
+                    await asyncio.wait_for(self._changed.wait(), timeout=WATCH_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Error running job {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = self._load(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return
+        context = job["context"]
+        completed = job["completed_stages"]
+        running: List[str] = []
+        errors: List[str] = []
+
+        async def run_stage(name, stage):
+            running.append(name)
+            try:
+                for attempt in range(1, self.max_attempts + 1):
+                    await self._update(job_id, status=RUNNING, stage=",".join(running), attempts=attempt)
+                    try:
+                        with timed(f"job_{name}"):
+                            output = await stage(context) or {}
+                        break
+                    except Exception as e:
+                        print(f"Job {job_id} stage {name} attempt {attempt} failed: {str(e)}")
+                        await self._update(job_id, error=f"{name}: {str(e)}")
+                        if attempt == self.max_attempts:
+                            errors.append(f"{name}: {str(e)}")
+                            raise
+                        await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            finally:
+                running.remove(name)
+            context.update(output)
+            completed.append(name)
+            await self._update(job_id, stage=",".join(running) or None, completed_stages=completed, context=context,
+                               error=None)
+
+        try:
+            timings = await self.graph.run(run_stage, completed)
+        except Exception:
+            # Stages still running when one gave up are cancelled
+            await self._update(job_id, status=FAILED, stage=None, error=errors[0] if errors else None)
+            JOBS.inc(status=FAILED)
+            return
+
+        path, seconds = critical_path(timings, self.graph.needs)
+        stage_seconds = {name: round(end - start, 3) for name, (start, end) in timings.items()}
+        summary = {"stages": path, "seconds": round(seconds, 3), "stage_seconds": stage_seconds,
+                   "sequential_seconds": round(sum(stage_seconds.values()), 3)}
+        if timings:
+            PIPELINE_SECONDS.observe(seconds, kind="critical_path")
+            PIPELINE_SECONDS.observe(summary["sequential_seconds"], kind="stage_sum")
+            print(f"Job {job_id} finished in {seconds:.2f} s on {' -> '.join(path)} "
+                  f"({summary['sequential_seconds']:.2f} s of stages)")
+        await self._update(job_id, status=SUCCEEDED, stage=None, critical_path=summary)
+        JOBS.inc(status=SUCCEEDED)
+
+    def _load(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["completed_stages"] = json.loads(job["completed_stages"])
+        job["context"] = json.loads(job["context"])
+        job["critical_path"] = json.loads(job["critical_path"]) if job["critical_path"] else None
+        return job
+
+    async def _update(self, job_id: str, **fields):
+        for key in ("completed_stages", "context", "critical_path"):
+            if key in fields:
+                fields[key] = json.dumps(fields[key])
+        fields["updated_at"] = datetime.now().isoformat()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+        async with self._changed:
+            self._changed.notify_all()
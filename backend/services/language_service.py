@@ -1,98 +1,191 @@
-from typing import Dict, Optional
-import json
 import os
+import json
+import asyncio
+import hashlib
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Next to the services package rather than relative to wherever the server was started
+TRANSLATIONS_DIR = os.getenv(
+    "TRANSLATIONS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "translations")
+)
+# How often the translation files are checked for changes
+TRANSLATIONS_RELOAD_SECONDS = float(os.getenv("TRANSLATIONS_RELOAD_SECONDS", "2"))
+DEFAULT_LANGUAGE = "en"
+
+# Written out when a language file is missing, so there is always something to edit
+DEFAULT_TRANSLATIONS = {
+    "en": {
+        "welcome": "Medical Conversation Analysis System",
+        "new_conversation": "New Conversation",
+        "new_conversation_desc": "Start a new conversation with a patient",
+        "search_conversations": "Search Conversations",
+        "search_conversations_desc": "Find and review previous conversations",
+        "start_recording": "Start Recording",
+        "start_recording_desc": "Record and transcribe a conversation",
+        "generate_summary": "Generate Summary",
+        "generate_report": "Generate Report",
+        "export_pdf": "Export PDF",
+        "patient_id": "Patient ID",
+        "doctor_id": "Doctor ID",
+        "date": "Date",
+        "summary": "Summary",
+        "transcript": "Transcript",
+        "report": "Report",
+        "save": "Save",
+        "cancel": "Cancel",
+        "edit": "Edit",
+        "delete": "Delete",
+        "confirm_delete": "Are you sure you want to delete this conversation?",
+        "yes": "Yes",
+        "no": "No"
+    },
+    "zh": {
+        "welcome": "医疗对话分析系统",
+        "new_conversation": "新建对话",
+        "new_conversation_desc": "开始与患者的新对话",
+        "search_conversations": "搜索对话",
+        "search_conversations_desc": "查找和查看历史对话",
+        "start_recording": "开始录音",
+        "start_recording_desc": "录制并转录对话",
+        "generate_summary": "生成摘要",
+        "generate_report": "生成报告",
+        "export_pdf": "导出PDF",
+        "patient_id": "患者ID",
+        "doctor_id": "医生ID",
+        "date": "日期",
+        "summary": "摘要",
+        "transcript": "转录文本",
+        "report": "报告",
+        "save": "保存",
+        "cancel": "取消",
+        "edit": "编辑",
+        "delete": "删除",
+        "confirm_delete": "确定要删除此对话吗？",
+        "yes": "是",
+        "no": "否"
+    }
+}
+
+# The language of the request being handled; set by the language middleware
+_language: ContextVar[str] = ContextVar("language", default=DEFAULT_LANGUAGE)
+
+
+def current_language() -> str:
+    return _language.get()
+
+
+@dataclass(frozen=True)
+class Bundle:
+    """One language's translations plus its serialized body and ETag, computed once per load."""
+    messages: Mapping[str, str]
+    body: bytes
+    etag: str
+
+
+@dataclass(frozen=True)
+class Catalog:
+    bundles: Mapping[str, Bundle]
+    # (file name, mtime, size) of every translation file the catalog was built from
+    signature: Tuple[Tuple[str, int, int], ...]
+
 
 class LanguageService:
-    def __init__(self):
-        self.default_language = "en"
-        self.current_language = self.default_language
-        self.translations = self._load_translations()
-    
-    def _load_translations(self) -> Dict[str, Dict[str, str]]:
-        translations = {}
-        translations_dir = "backend/data/translations"
-        
-        if not os.path.exists(translations_dir):
-            os.makedirs(translations_dir)
-        
-        # Load English translations
-        en_file = os.path.join(translations_dir, "en.json")
-        if os.path.exists(en_file):
-            with open(en_file, "r", encoding="utf-8") as f:
-                translations["en"] = json.load(f)
-        else:
-            translations["en"] = {
-                "welcome": "Medical Conversation Analysis System",
-                "new_conversation": "New Conversation",
-                "new_conversation_desc": "Start a new conversation with a patient",
-                "search_conversations": "Search Conversations",
-                "search_conversations_desc": "Find and review previous conversations",
-                "start_recording": "Start Recording",
-                "start_recording_desc": "Record and transcribe a conversation",
-                "generate_summary": "Generate Summary",
-                "generate_report": "Generate Report",
-                "export_pdf": "Export PDF",
-                "patient_id": "Patient ID",
-                "doctor_id": "Doctor ID",
-                "date": "Date",
-                "summary": "Summary",
-                "transcript": "Transcript",
-                "report": "Report",
-                "save": "Save",
-                "cancel": "Cancel",
-                "edit": "Edit",
-                "delete": "Delete",
-                "confirm_delete": "Are you sure you want to delete this conversation?",
-                "yes": "Yes",
-                "no": "No"
-            }
-            with open(en_file, "w", encoding="utf-8") as f:
-                json.dump(translations["en"], f, ensure_ascii=False, indent=2)
-        
-        # Load Chinese translations
-        zh_file = os.path.join(translations_dir, "zh.json")
-        if os.path.exists(zh_file):
-            with open(zh_file, "r", encoding="utf-8") as f:
-                translations["zh"] = json.load(f)
-        else:
-            translations["zh"] = {
-                "welcome": "医疗对话分析系统",
-                "new_conversation": "新建对话",
-                "new_conversation_desc": "开始与患者的新对话",
-                "search_conversations": "搜索对话",
-                "search_conversations_desc": "查找和查看历史对话",
-                "start_recording": "开始录音",
-                "start_recording_desc": "录制并转录对话",
-                "generate_summary": "生成摘要",
-                "generate_report": "生成报告",
-                "export_pdf": "导出PDF",
-                "patient_id": "患者ID",
-                "doctor_id": "医生ID",
-                "date": "日期",
-                "summary": "摘要",
-                "transcript": "转录文本",
-                "report": "报告",
-                "save": "保存",
-                "cancel": "取消",
-                "edit": "编辑",
-                "delete": "删除",
-                "confirm_delete": "确定要删除此对话吗？",
-                "yes": "是",
-                "no": "否"
-            }
-            with open(zh_file, "w", encoding="utf-8") as f:
-                json.dump(translations["zh"], f, ensure_ascii=False, indent=2)
-        
-        return translations
-    
-    def set_language(self, language: str) -> bool:
-        if language in self.translations:
-            self.current_language = language
-            return True
-        return False
-    
+    """Translations for every language, loaded into an immutable catalog.
+
+    Nothing here is mutated per request: the request's language lives in a
+    context variable, and a reload builds a new catalog and swaps the
+    reference, so lookups are plain dictionary reads without locks.
+    Missing keys fall back to the default language, then to the key itself.
+    """
+
+    def __init__(self, translations_dir: str = TRANSLATIONS_DIR, default_language: str = DEFAULT_LANGUAGE):
+        self.translations_dir = translations_dir
+        self.default_language = default_language
+        self._seed_defaults()
+        self.catalog = self._load()
+        self._rejected: Optional[Tuple[Tuple[str, int, int], ...]] = None
+
+    @property
+    def languages(self) -> Tuple[str, ...]:
+        return tuple(self.catalog.bundles)
+
+    def is_supported(self, language: Optional[str]) -> bool:
+        return language in self.catalog.bundles
+
+    def activate(self, language: Optional[str]) -> Token:
+        """Make ``language`` (or the default, if unsupported) current for this request; pass the token to ``deactivate``."""
+        return _language.set(language if language in self.catalog.bundles else self.default_language)
+
+    def deactivate(self, token: Token):
+        _language.reset(token)
+
+    def bundle(self, language: Optional[str] = None) -> Bundle:
+        bundles = self.catalog.bundles
+        return bundles.get(language or current_language()) or bundles[self.default_language]
+
     def get_translation(self, key: str) -> str:
-        return self.translations[self.current_language].get(key, key)
-    
-    def get_all_translations(self) -> Dict[str, str]:
-        return self.translations[self.current_language] 
\ No newline at end of file
+        return self.bundle().messages.get(key, key)
+
+    def get_all_translations(self) -> Mapping[str, str]:
+        return self.bundle().messages
+
+    def reload_if_changed(self) -> bool:
+        """Rebuild the catalog if a translation file was added, changed or removed; a broken file keeps the old one."""
+        signature = self._signature()
+        if signature in (self.catalog.signature, self._rejected):
+            return False
+        try:
+            self.catalog = self._load()
+        except (OSError, ValueError) as e:
+            # Not retried (or logged again) until the files change once more
+            self._rejected = signature
+            print(f"Error reloading translations: {str(e)}")
+            return False
+        print(f"Translations reloaded: {', '.join(self.languages)}")
+        return True
+
+    async def watch(self, interval: float = TRANSLATIONS_RELOAD_SECONDS):
+        """Reload the catalog whenever the translation files change, until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.reload_if_changed)
+
+    def _seed_defaults(self):
+        os.makedirs(self.translations_dir, exist_ok=True)
+        for language, messages in DEFAULT_TRANSLATIONS.items():
+            path = os.path.join(self.translations_dir, f"{language}.json")
+            if not os.path.exists(path):
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(messages, f, ensure_ascii=False, indent=2)
+
+    def _signature(self) -> Tuple[Tuple[str, int, int], ...]:
+        entries = []
+        for name in sorted(os.listdir(self.translations_dir)):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(self.translations_dir, name))
+                entries.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(entries)
+
+    def _load(self) -> Catalog:
+        signature = self._signature()
+        raw: Dict[str, Dict[str, str]] = {}
+        for name, _, _ in signature:
+            with open(os.path.join(self.translations_dir, name), "r", encoding="utf-8") as f:
+                raw[name[:-len(".json")]] = json.load(f)
+        fallback = raw.get(self.default_language, DEFAULT_TRANSLATIONS.get(self.default_language, {}))
+        raw.setdefault(self.default_language, fallback)
+
+        bundles = {}
+        for language, messages in raw.items():
+            merged = {**fallback, **messages}
+            body = json.dumps(merged, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            etag = f'"{language}-{hashlib.sha256(body).hexdigest()[:16]}"'
+            bundles[language] = Bundle(MappingProxyType(merged), body, etag)
+        return Catalog(MappingProxyType(bundles), signature)
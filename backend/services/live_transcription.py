@@ -0,0 +1,279 @@
+import os
+import io
+import time
+import wave
+import audioop
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from services.openai_client import OpenAIClient
+from services.metrics import AUDIO_SECONDS, timed
+from services.audio_service import TARGET_SAMPLE_RATE, TranscriptSegment, _segment_field
+
+load_dotenv()
+
+# Audio is cut into segments of this length as it arrives; consecutive segments share the
+# overlap, so a word cut at one segment's edge is heard whole by the next
+LIVE_SEGMENT_SECONDS = float(os.getenv("LIVE_SEGMENT_SECONDS", "10"))
+LIVE_OVERLAP_SECONDS = float(os.getenv("LIVE_OVERLAP_SECONDS", "2"))
+# Segments in flight to Whisper at once per session; results are still committed in order
+LIVE_TRANSCRIPTION_WORKERS = int(os.getenv("LIVE_TRANSCRIPTION_WORKERS", "2"))
+# Segments quieter than this RMS (16-bit scale, ~-50 dBFS) are not sent to Whisper
+LIVE_MIN_RMS = int(os.getenv("LIVE_MIN_RMS", "100"))
+SAMPLE_WIDTH = 2
+# Characters of committed transcript passed to Whisper as context for the next segment
+PROMPT_CHARS = 200
+
+
+class PcmRingBuffer:
+    """Fixed-size ring of 16-bit mono PCM that cuts overlapping segments as audio is written.
+
+    ``on_segment(index, start_ms, pcm)`` is called from ``write`` each time a
+    full segment is available; segments start every ``segment - overlap`` ms.
+    The ring holds one segment plus one hop, so memory does not grow with
+    the length of the recording.
+    """
+
+    def __init__(self, on_segment: Callable[[int, int, bytes], None], segment_ms: int, overlap_ms: int,
+                 sample_rate: int = TARGET_SAMPLE_RATE):
+        if not 0 <= overlap_ms < segment_ms:
+            raise ValueError("Overlap must be shorter than the segment")
+        self.on_segment = on_segment
+        self.sample_rate = sample_rate
+        self.segment_bytes = self._bytes(segment_ms)
+        self.hop_bytes = self.segment_bytes - self._bytes(overlap_ms)
+        self.overlap_bytes = self.segment_bytes - self.hop_bytes
+        self._ring = bytearray(self.segment_bytes + self.hop_bytes)
+        self.written = 0  # bytes written since the start
+        self.next_start = 0  # byte offset of the next segment
+        self.index = 0
+
+    def _bytes(self, ms: int) -> int:
+        return ms * self.sample_rate // 1000 * SAMPLE_WIDTH
+
+    def write(self, pcm: bytes):
+        # At most one hop at a time, so unread audio is never overwritten
+        for offset in range(0, len(pcm), self.hop_bytes):
+            piece = pcm[offset:offset + self.hop_bytes]
+            position = self.written % len(self._ring)
+            first = min(len(piece), len(self._ring) - position)
+            self._ring[position:position + first] = piece[:first]
+            self._ring[:len(piece) - first] = piece[first:]
+            self.written += len(piece)
+            while self.written >= self.next_start + self.segment_bytes:
+                self._emit(self.segment_bytes)
+
+    def flush(self):
+        """Emit the audio after the last full segment, if any of it is new, as a shorter final segment."""
+        if self.written > self.next_start + (self.overlap_bytes if self.index else 0):
+            self._emit(self.written - self.next_start)
+
+    def _emit(self, length: int):
+        position = self.next_start % len(self._ring)
+        pcm = bytes(self._ring[position:position + length])
+        if len(pcm) < length:
+            pcm += self._ring[:length - len(pcm)]
+        start_ms = self.next_start // SAMPLE_WIDTH * 1000 // self.sample_rate
+        self.on_segment(self.index, start_ms, pcm)
+        self.index += 1
+        self.next_start += self.hop_bytes
+
+
+def wav_bytes(pcm: bytes, sample_rate: int = TARGET_SAMPLE_RATE) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class LiveTranscription:
+    """Transcribes a recording while it is still being made.
+
+    ``feed`` takes 16-bit mono PCM at ``sample_rate`` in chunks of any size;
+    the ring buffer cuts it into overlapping segments that a few workers send
+    to Whisper. Results are committed in segment order: each Whisper segment
+    is kept by the audio segment that owns its midpoint, the owner of each
+    overlap switching half way through it, so nothing is transcribed twice.
+    ``updates`` yields the newly committed segments as they arrive.
+    """
+
+    def __init__(self, openai_client: OpenAIClient, sample_rate: int = TARGET_SAMPLE_RATE,
+                 segment_seconds: float = LIVE_SEGMENT_SECONDS, overlap_seconds: float = LIVE_OVERLAP_SECONDS,
+                 workers: int = LIVE_TRANSCRIPTION_WORKERS):
+        self.openai_client = openai_client
+        self.sample_rate = sample_rate
+        self.segment_ms = int(segment_seconds * 1000)
+        self.overlap_ms = int(overlap_seconds * 1000)
+        self.segments: List[TranscriptSegment] = []
+        self._buffer = PcmRingBuffer(self._enqueue, self.segment_ms, self.overlap_ms)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._updates: asyncio.Queue = asyncio.Queue()
+        self._results: Dict[int, Tuple[int, List[TranscriptSegment]]] = {}
+        self._committed = 0
+        self._total: Optional[int] = None
+        # Whisper segments past the last committed segment's share; kept if no segment follows it
+        self._tail: List[TranscriptSegment] = []
+        self._partial = b""
+        self._resample_state = None
+        self._done = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(workers)]
+
+    @property
+    def transcript(self) -> str:
+        return " ".join(segment.text for segment in self.segments if segment.text)
+
+    def feed(self, pcm: bytes):
+        # A chunk may end mid-sample; the odd byte waits for the next one
+        pcm = self._partial + pcm
+        whole = len(pcm) - len(pcm) % SAMPLE_WIDTH
+        pcm, self._partial = pcm[:whole], pcm[whole:]
+        if not pcm:
+            return
+        AUDIO_SECONDS.inc(len(pcm) / SAMPLE_WIDTH / self.sample_rate, kind="received")
+        if self.sample_rate != TARGET_SAMPLE_RATE:
+            pcm, self._resample_state = audioop.ratecv(
+                pcm, SAMPLE_WIDTH, 1, self.sample_rate, TARGET_SAMPLE_RATE, self._resample_state
+            )
+        self._buffer.write(pcm)
+
+    def finish(self):
+        """End of the recording: the rest of the audio becomes the final segment."""
+        if self._total is not None:
+            return
+        self._buffer.flush()
+        self._total = self._buffer.index
+        for _ in self._workers:
+            self._queue.put_nowait(None)
+        self._commit()
+
+    async def wait(self) -> str:
+        """Wait until every segment is transcribed and committed; returns the transcript."""
+        await self._done.wait()
+        return self.transcript
+
+    async def updates(self) -> AsyncIterator[List[TranscriptSegment]]:
+        while True:
+            segments = await self._updates.get()
+            if segments is None:
+                return
+            yield segments
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def _enqueue(self, index: int, start_ms: int, pcm: bytes):
+        self._queue.put_nowait((index, start_ms, pcm))
+
+    async def _work(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            index, start_ms, pcm = item
+            try:
+                self._results[index] = (start_ms, await self._transcribe(start_ms, pcm))
+            except Exception as e:
+                # One lost segment leaves a gap rather than ending the session
+                print(f"Error transcribing live segment {index}: {str(e)}")
+                self._results[index] = (start_ms, [])
+            self._commit()
+
+    async def _transcribe(self, start_ms: int, pcm: bytes) -> List[TranscriptSegment]:
+        if audioop.rms(pcm, SAMPLE_WIDTH) < LIVE_MIN_RMS:
+            return []
+        seconds = len(pcm) / SAMPLE_WIDTH / TARGET_SAMPLE_RATE
+        # The end of the transcript so far keeps spelling and names consistent across segments
+        context = {"prompt": self.transcript[-PROMPT_CHARS:]} if self.segments else {}
+        with timed("live_whisper"):
+            transcript = await self.openai_client.transcribe(
+                ("segment.wav", wav_bytes(pcm)),
+                response_format="verbose_json",
+                **context
+            )
+        AUDIO_SECONDS.inc(seconds, kind="transcribed")
+
+        offset = start_ms / 1000
+        segments = getattr(transcript, "segments", None)
+        if not segments:
+            return [TranscriptSegment(offset, offset + seconds, transcript.text.strip())]
+        return [
+            TranscriptSegment(
+                offset + _segment_field(segment, "start"),
+                offset + _segment_field(segment, "end"),
+                _segment_field(segment, "text").strip()
+            )
+            for segment in segments
+        ]
+
+    def _commit(self):
+        while self._committed in self._results:
+            index = self._committed
+            start_ms, segments = self._results.pop(index)
+            lower = (start_ms + self.overlap_ms / 2) / 1000 if index else float("-inf")
+            last = self._total is not None and index == self._total - 1
+            upper = float("inf") if last else (start_ms + self.segment_ms - self.overlap_ms / 2) / 1000
+            kept, self._tail = [], []
+            for segment in segments:
+                middle = (segment.start + segment.end) / 2
+                if middle >= upper:
+                    self._tail.append(segment)
+                elif middle >= lower and segment.text:
+                    kept.append(segment)
+            self._committed += 1
+            self._publish(kept)
+        if self._total is not None and self._committed == self._total and not self._done.is_set():
+            # The recording ended on a segment that was already committed with a bounded share
+            self._publish([segment for segment in self._tail if segment.text])
+            self._tail = []
+            self._updates.put_nowait(None)
+            self._done.set()
+
+    def _publish(self, segments: List[TranscriptSegment]):
+        if segments:
+            self.segments.extend(segments)
+            self._updates.put_nowait(segments)
+
+
+class WavReplaySource:
+    """Plays a WAV file back in real time as a stand-in for a microphone.
+
+    Yields 16-bit mono PCM chunks of ``chunk_ms`` at ``speed`` times real
+    time, so live transcription can be exercised without audio hardware.
+    """
+
+    def __init__(self, path: str, chunk_ms: int = 100, speed: float = 1.0):
+        self.path = path
+        self.chunk_ms = chunk_ms
+        self.speed = speed
+        with wave.open(path, "rb") as wav:
+            self.sample_rate = wav.getframerate()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        start = time.monotonic()
+        sent_ms = 0
+        with wave.open(self.path, "rb") as wav:
+            width, channels = wav.getsampwidth(), wav.getnchannels()
+            frames = self.sample_rate * self.chunk_ms // 1000
+            while True:
+                data = wav.readframes(frames)
+                if not data:
+                    return
+                if channels == 2:
+                    data = audioop.tomono(data, width, 0.5, 0.5)
+                if width == 1:
+                    # 8-bit WAV samples are unsigned
+                    data = audioop.bias(data, 1, -128)
+                if width != SAMPLE_WIDTH:
+                    data = audioop.lin2lin(data, width, SAMPLE_WIDTH)
+                # A chunk is handed over once it has been "recorded", paced against the start
+                # time so sleeps that overrun do not add up
+                sent_ms += len(data) // SAMPLE_WIDTH * 1000 / self.sample_rate
+                delay = start + sent_ms / 1000 / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield data
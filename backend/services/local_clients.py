@@ -0,0 +1,116 @@
+"""Offline stand-ins for the OpenAI clients used by the services.
+
+They mirror just enough of the ``openai`` SDK surface for the services to run
+without network access, with configurable latency so pipelines can be timed.
+"""
+import asyncio
+import hashlib
+import math
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import List
+from langchain.embeddings.base import Embeddings
+
+
+class _Response(SimpleNamespace):
+    """Attribute access like the SDK's models, plus ``dict()`` for LangChain."""
+
+    def dict(self):
+        def convert(value):
+            if isinstance(value, SimpleNamespace):
+                return {key: convert(item) for key, item in vars(value).items()}
+            if isinstance(value, list):
+                return [convert(item) for item in value]
+            return value
+        return convert(self)
+
+
+class LocalOpenAI:
+    """Drop-in for ``openai.AsyncOpenAI`` implementing transcriptions and chat completions.
+
+    Pass it as ``OpenAIClient(client=LocalOpenAI())`` so the shared wrapper's
+    concurrency limits and timeouts are still exercised.
+    """
+
+    def __init__(self, transcription_latency: float = 0.0, chat_latency: float = 0.0, token_latency: float = 0.0):
+        # chat_latency is the time to first token; each further token adds token_latency
+        self.transcription_latency = transcription_latency
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.transcription_calls = 0
+        self.chat_calls = 0
+        self.prompt_tokens = 0
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._create_transcription))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_chat_completion))
+
+    def with_options(self, **kwargs):
+        return self
+
+    async def _create_transcription(self, model, file, **kwargs):
+        self.transcription_calls += 1
+        call = self.transcription_calls
+        await asyncio.sleep(self.transcription_latency)
+        if isinstance(file, tuple):
+            size = len(file[1])
+        else:
+            size = len(file.read())
+        return _Response(text=f"[chunk {call}: {size} bytes]")
+
+    async def _create_chat_completion(self, model, messages, stream=False, **kwargs):
+        self.chat_calls += 1
+        words = messages[-1]["content"].split()
+        self.prompt_tokens += sum(len(str(message["content"]).split()) for message in messages)
+        content = f"[{model} summary of {len(words)} words] " + " ".join(words[:20])
+        if stream:
+            return self._stream_chat_completion(content)
+        await asyncio.sleep(self.chat_latency + self.token_latency * len(content.split(" ")))
+        return _Response(
+            model=model,
+            choices=[SimpleNamespace(index=0, finish_reason="stop", message=SimpleNamespace(role="assistant", content=content))],
+            usage=SimpleNamespace(prompt_tokens=len(words), completion_tokens=len(content.split()), total_tokens=len(words) + len(content.split()))
+        )
+
+    async def _stream_chat_completion(self, content):
+        await asyncio.sleep(self.chat_latency)
+        tokens = content.split(" ")
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            delta = token if i == 0 else " " + token
+            yield _Response(choices=[SimpleNamespace(index=0, finish_reason=None, delta=SimpleNamespace(role="assistant", content=delta))])
+
+
+class LocalEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-words embeddings; no model or network needed.
+
+    ``embedded_texts`` counts every text passed to the model, so callers can
+    assert how much embedding work a rebuild actually did. ``latency`` is added
+    to every call, like a round trip to an embeddings API.
+    """
+
+    def __init__(self, dimensions: int = 256, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.embedded_texts = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.embedded_texts += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,207 @@
+import os
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Optional
+import httpx
+import openai
+from dotenv import load_dotenv
+from services.rate_limiter import CircuitBreaker, TokenBucket, backoff_delay, retry_after_seconds
+from services.metrics import OPENAI_IN_FLIGHT, OPENAI_REQUESTS, record_usage
+
+load_dotenv()
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_TRANSCRIPTION_TIMEOUT = float(os.getenv("OPENAI_TRANSCRIPTION_TIMEOUT", "300"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+# Quota ceilings; 0 disables a limit
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "80000"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "60"))
+OPENAI_BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+OPENAI_BREAKER_RESET = float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+# Completion tokens charged against the TPM bucket when a call does not set max_tokens
+OPENAI_COMPLETION_TOKENS = int(os.getenv("OPENAI_COMPLETION_TOKENS", "1000"))
+
+# Failures that say nothing about the request itself, so retrying may succeed
+SERVER_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+
+def estimate_tokens(messages, max_tokens: Optional[int] = None) -> int:
+    """Rough prompt + completion size of a chat call, for the TPM bucket (about 4 characters per token)."""
+    prompt = sum(len(str(message.get("content") or "")) for message in messages or [])
+    return prompt // 4 + (max_tokens or OPENAI_COMPLETION_TOKENS)
+
+
+class _LimitedCompletions:
+    """A ``chat.completions`` look-alike whose ``create`` goes through the client's limits and retries."""
+
+    def __init__(self, owner: "OpenAIClient", completions):
+        self.owner = owner
+        self.completions = completions
+
+    async def create(self, **kwargs):
+        return await self.owner.call(
+            lambda: self.completions.create(**kwargs),
+            estimate_tokens(kwargs.get("messages"), kwargs.get("max_tokens")),
+            endpoint="chat"
+        )
+
+
+class OpenAIClient:
+    """A single AsyncOpenAI client, and its connection pool, shared by every service.
+
+    Create one per application lifespan and close it with ``aclose``. Every
+    call goes through ``call``, which waits for the requests-per-minute and
+    tokens-per-minute buckets, holds one of ``max_concurrency`` slots, and
+    retries 429s, 5xx responses and connection errors with jittered
+    exponential backoff (at least the server's Retry-After). 429s also slow
+    the buckets down; repeated server failures open a circuit breaker so
+    callers fail fast with ``CircuitOpenError`` until the API recovers.
+    """
+
+    def __init__(self, client=None, max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                 rpm: Optional[float] = None, tpm: Optional[float] = None, max_retries: Optional[int] = None,
+                 backoff_base: Optional[float] = None, backoff_max: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.timeout = timeout or OPENAI_TIMEOUT
+        self._http_client = None
+        if client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                ),
+                timeout=self.timeout
+            )
+            client = openai.AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=self._http_client,
+                # Retries happen in ``call``, where they are paced by the rate limits
+                max_retries=0
+            )
+        self.client = client
+        self.max_retries = OPENAI_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = OPENAI_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = OPENAI_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.requests_bucket = TokenBucket(OPENAI_RPM if rpm is None else rpm)
+        self.tokens_bucket = TokenBucket(OPENAI_TPM if tpm is None else tpm)
+        self.breaker = breaker or CircuitBreaker(OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RESET)
+        self._semaphore = asyncio.Semaphore(max_concurrency or OPENAI_MAX_CONCURRENCY)
+
+    async def call(self, create: Callable[[], Awaitable], tokens: int = 0, hold_slot: bool = True, endpoint: str = "chat"):
+        """Run one API request under the rate limits, retrying transient failures.
+
+        ``create`` starts a fresh request each time it is called; ``tokens`` is
+        the request's estimated size for the TPM bucket. Pass ``hold_slot=False``
+        if the caller already holds a concurrency slot. ``endpoint`` labels the
+        request in the metrics.
+        """
+        attempt = 0
+        while True:
+            self.breaker.check()
+            await self.requests_bucket.acquire(1)
+            await self.tokens_bucket.acquire(tokens)
+            retry_after = None
+            try:
+                if hold_slot:
+                    async with self._semaphore:
+                        result = await self._send(create, endpoint)
+                else:
+                    result = await self._send(create, endpoint)
+            except openai.RateLimitError as e:
+                OPENAI_REQUESTS.inc(endpoint=endpoint, outcome="rate_limited")
+                # The API is up, we are just over quota; an exhausted quota will not recover by retrying
+                self.breaker.success()
+                if getattr(e, "code", None) == "insufficient_quota" or attempt >= self.max_retries:
+                    raise
+                retry_after = retry_after_seconds(e)
+                self.requests_bucket.throttle(retry_after)
+                self.tokens_bucket.throttle(retry_after)
+                error = e
+            except SERVER_ERRORS as e:
+                OPENAI_REQUESTS.inc(endpoint=endpoint, outcome="server_error")
+                self.breaker.failure()
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = retry_after_seconds(e)
+                error = e
+            except openai.APIStatusError:
+                OPENAI_REQUESTS.inc(endpoint=endpoint, outcome="client_error")
+                self.breaker.success()
+                raise
+            else:
+                OPENAI_REQUESTS.inc(endpoint=endpoint, outcome="ok")
+                record_usage(getattr(result, "model", None) or "unknown", result)
+                self.breaker.success()
+                self.requests_bucket.success()
+                self.tokens_bucket.success()
+                return result
+
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after)
+            print(f"OpenAI request failed ({type(error).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    async def _send(create: Callable[[], Awaitable], endpoint: str):
+        OPENAI_IN_FLIGHT.inc(endpoint=endpoint)
+        try:
+            return await create()
+        finally:
+            OPENAI_IN_FLIGHT.dec(endpoint=endpoint)
+
+    def chat_completions(self, timeout: Optional[float] = None):
+        """A rate-limited ``chat.completions`` with a per-call timeout, for LangChain's ``async_client``."""
+        return _LimitedCompletions(self, self.client.with_options(timeout=timeout or self.timeout).chat.completions)
+
+    async def chat(self, messages, model: str = "gpt-4", timeout: Optional[float] = None, **kwargs):
+        return await self.call(
+            lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=timeout or self.timeout,
+                **kwargs
+            ),
+            estimate_tokens(messages, kwargs.get("max_tokens"))
+        )
+
+    async def chat_stream(self, messages, model: str = "gpt-4", timeout: Optional[float] = None, **kwargs) -> AsyncIterator[str]:
+        """Yield the completion's content deltas as they arrive; the slot is held until the stream ends.
+
+        Only opening the stream is retried; an error mid-stream propagates.
+        """
+        async with self._semaphore:
+            stream = await self.call(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    timeout=timeout or self.timeout,
+                    stream=True,
+                    **kwargs
+                ),
+                estimate_tokens(messages, kwargs.get("max_tokens")),
+                hold_slot=False
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    async def transcribe(self, file, model: str = "whisper-1", timeout: Optional[float] = None, **kwargs):
+        def create():
+            # A file object is re-read from the start on every attempt
+            if hasattr(file, "seek"):
+                file.seek(0)
+            return self.client.audio.transcriptions.create(
+                model=model,
+                file=file,
+                timeout=timeout or OPENAI_TRANSCRIPTION_TIMEOUT,
+                **kwargs
+            )
+
+        return await self.call(create, endpoint="transcription")
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
@@ -0,0 +1,158 @@
+import os
+import json
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+from pypdf import PdfReader
+from dotenv import load_dotenv
+from services.metrics import record_cache, timed
+
+load_dotenv()
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Fewest pages parsed per worker task; every task reopens the file, so small PDFs stay whole
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+# Tasks kept in flight per worker; bounds how much parsed text waits in memory
+PDF_PREFETCH = 2
+
+# (path, sha256, future of the page texts or None if cached, last range of the file)
+_Range = Tuple[str, str, Optional[Future], bool]
+
+
+def extract_range(path: str, start: int, stop: int) -> List[str]:
+    """Text of pages ``start``..``stop - 1``; runs in a worker process."""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _failed(error: Exception) -> Future:
+    future = Future()
+    future.set_exception(error)
+    return future
+
+
+class PdfExtractor:
+    """Page-level PDF text extraction over a process pool, cached per file hash.
+
+    ``extract`` walks a sequence of files in order while page ranges of the
+    current and following files are parsed in the background. Only
+    ``workers * PDF_PREFETCH`` ranges are in flight at once, so memory stays
+    flat however large the library is. Extracted text is kept as
+    ``<sha256>.jsonl`` (one page per line) in ``cache_dir``; a file seen
+    before is read back without parsing it again.
+    """
+
+    def __init__(self, cache_dir: str, workers: int = PDF_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK):
+        self.cache_dir = cache_dir
+        self.workers = max(1, workers)
+        self.pages_per_task = max(1, pages_per_task)
+        self._pool = None
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def cache_path(self, sha: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha}.jsonl")
+
+    def extract(self, files: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str, Iterator[str]]]:
+        """Yield ``(path, sha256, pages)`` for each ``(path, sha256)``; ``pages`` yields page texts in order.
+
+        Consume each file's pages before moving on to the next file; pages
+        left unread are discarded.
+        """
+        window: Deque[_Range] = deque()
+        ranges = self._ranges(files)
+
+        def fill():
+            while len(window) < self.workers * PDF_PREFETCH:
+                entry = next(ranges, None)
+                if entry is None:
+                    return
+                window.append(entry)
+
+        fill()
+        try:
+            while window:
+                path = window[0][0]
+                yield path, window[0][1], self._pages(window, fill)
+                while window and window[0][0] == path:
+                    future = window.popleft()[2]
+                    if future is not None:
+                        future.cancel()
+                fill()
+        finally:
+            for _, _, future, _ in window:
+                if future is not None:
+                    future.cancel()
+
+    def pages(self, path: str, sha: str) -> Iterator[str]:
+        """Page texts of a single file."""
+        for _, _, pages in self.extract([(path, sha)]):
+            yield from pages
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def _ranges(self, files: Iterable[Tuple[str, str]]) -> Iterator[_Range]:
+        # Submitted lazily, as the window makes room
+        for path, sha in files:
+            if os.path.exists(self.cache_path(sha)):
+                yield path, sha, None, True
+                continue
+            try:
+                count = len(PdfReader(path).pages)
+            except Exception as e:
+                # Raised when the consumer reaches this file, not while it is still reading an earlier one
+                yield path, sha, _failed(e), True
+                continue
+            if not count:
+                done = Future()
+                done.set_result([])
+                yield path, sha, done, True
+                continue
+            # Large files are split once per worker, so each worker opens a file at most once
+            size = max(self.pages_per_task, -(-count // self.workers))
+            for start in range(0, count, size):
+                stop = min(count, start + size)
+                yield path, sha, self.pool.submit(extract_range, path, start, stop), stop == count
+
+    def _pages(self, window: Deque[_Range], fill) -> Iterator[str]:
+        path, sha, future, _ = window[0]
+        cache_path = self.cache_path(sha)
+        record_cache("pdf_text", future is None)
+        if future is None:
+            window.popleft()
+            fill()
+            with open(cache_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+            return
+
+        # Written alongside the consumer and renamed once complete, so a partial file is never reused
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as out:
+                last = False
+                while not last:
+                    _, _, future, last = window.popleft()
+                    fill()
+                    with timed("pdf_extract"):
+                        texts = future.result()
+                    for text in texts:
+                        out.write(json.dumps(text) + "\n")
+                        yield text
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
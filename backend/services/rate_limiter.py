@@ -0,0 +1,126 @@
+import time
+import random
+import asyncio
+from typing import Optional
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """An async token bucket that adapts its rate to 429 responses.
+
+    ``per_minute`` is the ceiling, e.g. the account's RPM or TPM quota. On
+    ``throttle`` the refill rate is halved and refilling pauses for the
+    server's Retry-After; every success adds back a twentieth of the ceiling,
+    so throughput settles just under whatever quota the server actually
+    enforces instead of oscillating between bursts and 429 storms. A
+    ``per_minute`` of 0 disables the bucket.
+    """
+
+    def __init__(self, per_minute: float, min_fraction: float = 0.05):
+        self.ceiling = per_minute / 60.0
+        self.rate = self.ceiling
+        self.min_rate = self.ceiling * min_fraction
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        if not self.ceiling:
+            return
+        # A request larger than the whole bucket could never be served otherwise
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                # ``updated`` may lie in the future while a Retry-After pause is in effect
+                wait = max(0.0, self.updated - time.monotonic()) + (amount - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def throttle(self, retry_after: Optional[float] = None):
+        if not self.ceiling:
+            return
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + (retry_after or 0))
+
+    def success(self):
+        self.rate = min(self.ceiling, self.rate + self.ceiling / 20)
+
+
+class CircuitBreaker:
+    """Stops calling a failing API for a while instead of piling up retries.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    ``check`` raises ``CircuitOpenError`` for ``reset_timeout`` seconds. Then a
+    single trial call is let through and the breaker re-arms: success closes
+    it, failure keeps it open for another ``reset_timeout``.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def check(self):
+        state = self.state
+        if state == "open":
+            raise CircuitOpenError("OpenAI API circuit breaker is open")
+        if state == "half-open":
+            # Let this call through as the trial; everyone else waits out another timeout
+            self.opened_at = time.monotonic()
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, base: float, maximum: float, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, but never sooner than the server's Retry-After."""
+    delay = random.uniform(0, min(maximum, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read ``retry-after-ms`` or ``retry-after`` (seconds) from an API error's response, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # An HTTP date instead of seconds; fall back to plain backoff
+        return None
+    return None
@@ -1,58 +1,102 @@
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
 from langchain.chat_models import ChatOpenAI
-from langchain.document_loaders import PyPDFLoader
+from langchain.schema import Document
 import os
-from typing import List, Optional
+import asyncio
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
+from services.openai_client import OpenAIClient
+from services.case_index import CaseIndex
+from services.case_retriever import CaseRetriever
+from services.embedding_cache import BatchedEmbeddings, EmbeddingCache, create_embeddings
+from services.llm_cache import LLMCache, cache_key
+from services.metrics import SPECULATION, timed
 
 load_dotenv()
 
+REPORT_TIMEOUT = float(os.getenv("REPORT_TIMEOUT", "120"))
+REPORT_MODEL = "gpt-4"
+# Bump when the report prompt changes so cached reports are not reused
+REPORT_PROMPT_VERSION = "report-v2"
+# Characters of transcript used as the query when retrieving before the summary exists
+SPECULATIVE_QUERY_CHARS = int(os.getenv("SPECULATIVE_QUERY_CHARS", "6000"))
+# Share of case chunks the guessed context must have in common with the summary's own retrieval
+# for a report drafted on it to be kept; 1.0 keeps it only when both found the same chunks
+SPECULATION_MIN_OVERLAP = float(os.getenv("SPECULATION_MIN_OVERLAP", "1.0"))
+
+
+def context_overlap(documents: List[Document], guess: List[Document]) -> float:
+    """Share of the case chunks in either list that are in both (1.0: the same case text).
+
+    Order is ignored: queries that find the same chunks often rank them differently.
+    """
+    found = {document.page_content for document in documents}
+    guessed = {document.page_content for document in guess}
+    if not found and not guessed:
+        return 1.0
+    return len(found & guessed) / len(found | guessed)
+
+
 class ReportService:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
-        self.llm = ChatOpenAI(model_name="gpt-4")
+    def __init__(self, openai_client: Optional[OpenAIClient] = None, embeddings=None, llm_cache: Optional[LLMCache] = None):
+        self.openai_client = openai_client or OpenAIClient()
+        self.llm_cache = llm_cache or LLMCache()
+        # Chunks and summaries are deduplicated, batched and cached before they reach the model
+        self.embeddings = BatchedEmbeddings(embeddings or create_embeddings(), EmbeddingCache())
+        # LangChain's async path goes through the shared client, its connection pool and rate limits
+        self.llm = ChatOpenAI(
+            model_name=REPORT_MODEL,
+            async_client=self.openai_client.chat_completions(timeout=REPORT_TIMEOUT)
+        )
+        # Built once; each report only supplies its retrieved documents and question
+        self.qa_chain = load_qa_chain(self.llm, chain_type="stuff")
+        # Filled in by initialize_vector_store, which the app runs during warm-up
         self.vector_store = None
-        self.initialize_vector_store()
     
-    def initialize_vector_store(self):
-        # Load medical cases from PDF files in the cases directory
-        cases_dir = "backend/data/cases"
-        if not os.path.exists(cases_dir):
-            os.makedirs(cases_dir)
-            return
-        
-        documents = []
-        for file in os.listdir(cases_dir):
-            if file.endswith(".pdf"):
-                loader = PyPDFLoader(os.path.join(cases_dir, file))
-                documents.extend(loader.load())
-        
-        if documents:
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            texts = text_splitter.split_documents(documents)
-            self.vector_store = Chroma.from_documents(
-                texts,
-                self.embeddings,
-                collection_name="medical_cases"
-            )
-    
-    async def generate_report(self, conversation_summary: str) -> Optional[str]:
+    def initialize_vector_store(self, progress: Optional[Callable[[int, int], None]] = None):
+        # Only new or changed case PDFs are embedded; the index persists between runs
+        self.case_index = CaseIndex(self.embeddings)
+        with timed("index_sync"):
+            stats = self.case_index.sync(progress)
+        print(f"Case index synced: {stats}")
+        self.vector_store = self.case_index.vector_store if self.case_index.count() else None
+        self.retriever = CaseRetriever(self.case_index, self.embeddings)
+
+    async def retrieve_speculatively(self, transcript: str) -> List[Dict]:
+        """Case context retrieved with the transcript, before there is a summary to retrieve with.
+
+        Returned JSON-safe so it can be stored with the job. ``generate_report``
+        starts on it and keeps the result only if the summary retrieves the
+        same case text (``SPECULATION_MIN_OVERLAP``); otherwise it is discarded.
+        """
+        if not self.vector_store:
+            return []
+        try:
+            documents = await self.retriever.retrieve(transcript[:SPECULATIVE_QUERY_CHARS])
+        except Exception as e:
+            # Only a guess: the report retrieves for itself without one
+            print(f"Error retrieving speculatively: {str(e)}")
+            return []
+        return [{"page_content": document.page_content, "metadata": document.metadata} for document in documents]
+
+    async def generate_report(self, conversation_summary: str, bypass_cache: bool = False,
+                              speculative_documents: Optional[List[Dict]] = None) -> Optional[str]:
         if not self.vector_store:
             return "No medical cases available for reference."
-        
+
+        # The case corpus feeds the prompt too, so a changed corpus must miss
+        key = cache_key(
+            REPORT_MODEL,
+            f"{REPORT_PROMPT_VERSION}:{self.case_index.fingerprint()}:{self.retriever.settings_key()}",
+            conversation_summary
+        )
+        if not bypass_cache:
+            cached = self.llm_cache.get(key)
+            if cached is not None:
+                return cached
+
+        answer = None
         try:
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.vector_store.as_retriever()
-            )
-            
             prompt = f"""
             Based on the following conversation summary and similar medical cases, 
             generate a comprehensive medical report. Include:
@@ -65,9 +109,34 @@ class ReportService:
             Conversation Summary:
             {conversation_summary}
             """
-            
-            response = qa_chain.run(prompt)
+
+            if speculative_documents:
+                # The model starts on the guessed context while the summary's own retrieval runs
+                guess = [Document(**document) for document in speculative_documents]
+                answer = asyncio.create_task(self._answer(guess, prompt))
+            # Cases are retrieved for the summary itself, not the instructions around it
+            documents = await self.retriever.retrieve(conversation_summary)
+            if answer is not None and context_overlap(documents, guess) >= SPECULATION_MIN_OVERLAP:
+                SPECULATION.inc(stage="report", outcome="hit")
+                response = await answer
+            else:
+                if answer is not None:
+                    # The summary found other cases: the draft is discarded, not reused
+                    SPECULATION.inc(stage="report", outcome="miss")
+                    answer.cancel()
+                response = await self._answer(documents, prompt)
+            self.llm_cache.set(key, response)
             return response
         except Exception as e:
             print(f"Error generating report: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
+        finally:
+            if answer is not None and not answer.done():
+                answer.cancel()
+
+    async def _answer(self, documents: List[Document], prompt: str) -> str:
+        with timed("report"):
+            return await self.qa_chain.arun(input_documents=documents, question=prompt)
+
+    def close(self):
+        self.embeddings.close() 
\ No newline at end of file
@@ -0,0 +1,78 @@
+import os
+import asyncio
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from services.conversation_store import ConversationStore
+from services.vector_index import VectorIndex
+from services.metrics import timed
+
+load_dotenv()
+
+SESSION_INDEX_DIR = os.getenv("SESSION_INDEX_DIR", "backend/data/session_index")
+DEFAULT_SIMILAR_K = 5
+# Summaries embedded per request while backfilling
+BACKFILL_BATCH_SIZE = 256
+
+
+class SimilarSessions:
+    """Finds past conversations whose summaries are closest to a given one.
+
+    Every summary is embedded when it is saved and stored in a persistent
+    VectorIndex under the conversation id. Lookups reuse the stored vector,
+    so they cost no embedding call.
+    """
+
+    def __init__(self, embeddings, index: Optional[VectorIndex] = None):
+        self.embeddings = embeddings
+        self.index = index or VectorIndex(SESSION_INDEX_DIR)
+
+    async def add(self, conversation_id, summary: str) -> bool:
+        """Embed and index a summary, replacing any earlier one; failures are logged, not raised."""
+        try:
+            with timed("embed_summary"):
+                vector = (await self.embeddings.aembed_documents([summary]))[0]
+            await asyncio.to_thread(self.index.add, int(conversation_id), vector)
+            return True
+        except Exception as e:
+            print(f"Error indexing conversation summary: {str(e)}")
+            return False
+
+    def remove(self, conversation_id) -> bool:
+        return self.index.remove(int(conversation_id))
+
+    async def similar(self, conversation_id, summary: str, k: int = DEFAULT_SIMILAR_K) -> Optional[List[Tuple[int, float]]]:
+        """Return up to ``k`` (conversation id, cosine similarity) pairs, most similar first."""
+        conversation_id = int(conversation_id)
+        if conversation_id not in self.index and not await self.add(conversation_id, summary):
+            return None
+        vector = self.index.get(conversation_id)
+        with timed("similar_search"):
+            return await asyncio.to_thread(self.index.search, vector, k, [conversation_id])
+
+    async def backfill(self, store: ConversationStore) -> int:
+        """Index summaries saved before they were embedded on save; returns how many were added."""
+        added = 0
+        batch: List[Tuple[int, str]] = []
+        try:
+            for conversation_id, summary in store.iter_summaries():
+                if conversation_id in self.index:
+                    continue
+                batch.append((conversation_id, summary))
+                if len(batch) >= BACKFILL_BATCH_SIZE:
+                    added += await self._add_batch(batch)
+                    batch = []
+            if batch:
+                added += await self._add_batch(batch)
+        except Exception as e:
+            print(f"Error backfilling the session index: {str(e)}")
+        if added:
+            print(f"Session index backfilled: {added} summaries")
+        return added
+
+    async def _add_batch(self, batch: List[Tuple[int, str]]) -> int:
+        vectors = await self.embeddings.aembed_documents([summary for _, summary in batch])
+        await asyncio.to_thread(self.index.add_many, [conversation_id for conversation_id, _ in batch], vectors)
+        return len(batch)
+
+    def close(self):
+        self.index.close()
@@ -0,0 +1,101 @@
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+# A stage receives the shared context (the job payload plus the output of the stages
+# it needs) and returns a dict that is merged back into it.
+Stage = Callable[[Dict], Awaitable[Dict]]
+# (name, stage) runs after the entry before it; (name, stage, needs) after the named stages
+StageEntry = Union[Tuple[str, Stage], Tuple[str, Stage, Sequence[str]]]
+
+
+def critical_path(timings: Dict[str, Tuple[float, float]], needs: Dict[str, Tuple[str, ...]]) -> Tuple[List[str], float]:
+    """The chain of stages that decided when the run finished, and its length in seconds.
+
+    ``timings`` maps each stage that ran to its (start, end) offset. Starting
+    from the stage that ended last, each step goes back to the needed stage
+    that ended last, the one the stage was actually waiting for.
+    """
+    if not timings:
+        return [], 0.0
+    name = max(timings, key=lambda stage: timings[stage][1])
+    path = [name]
+    while True:
+        waited_on = [dep for dep in needs.get(name, ()) if dep in timings]
+        if not waited_on:
+            break
+        name = max(waited_on, key=lambda stage: timings[stage][1])
+        path.append(name)
+    path.reverse()
+    return path, timings[path[-1]][1] - timings[path[0]][0]
+
+
+class StageGraph:
+    """Runs stages as a dependency graph, each one as soon as the stages it needs are done.
+
+    Independent stages run concurrently on the event loop. The first stage
+    to raise cancels the ones still running and the error propagates.
+    """
+
+    def __init__(self, stages: Iterable[StageEntry]):
+        self.stages: Dict[str, Stage] = {}
+        self.needs: Dict[str, Tuple[str, ...]] = {}
+        previous = None
+        for entry in stages:
+            name, stage = entry[0], entry[1]
+            needs = tuple(entry[2]) if len(entry) > 2 else ((previous,) if previous else ())
+            if name in self.stages:
+                raise ValueError(f"Duplicate stage: {name}")
+            self.stages[name] = stage
+            self.needs[name] = needs
+            previous = name
+        for name, needs in self.needs.items():
+            unknown = [dep for dep in needs if dep not in self.stages]
+            if unknown:
+                raise ValueError(f"Stage {name} needs unknown stages: {', '.join(unknown)}")
+        self.order = self._topological_order()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.order)
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        placed = set()
+        while len(order) < len(self.stages):
+            ready = [name for name in self.stages if name not in placed and all(dep in placed for dep in self.needs[name])]
+            if not ready:
+                raise ValueError("Stage dependencies form a cycle")
+            order.extend(ready)
+            placed.update(ready)
+        return order
+
+    async def run(self, run_stage: Callable[[str, Stage], Awaitable[None]],
+                  completed: Iterable[str] = ()) -> Dict[str, Tuple[float, float]]:
+        """Run every stage not in ``completed`` through ``run_stage(name, stage)``.
+
+        Returns the (start, end) offset in seconds of each stage that ran.
+        """
+        done = set(completed)
+        pending = [name for name in self.order if name not in done]
+        running: Dict[asyncio.Task, str] = {}
+        timings: Dict[str, Tuple[float, float]] = {}
+        started: Dict[str, float] = {}
+        clock = time.monotonic()
+        try:
+            while pending or running:
+                for name in [name for name in pending if all(dep in done for dep in self.needs[name])]:
+                    pending.remove(name)
+                    started[name] = time.monotonic() - clock
+                    running[asyncio.create_task(run_stage(name, self.stages[name]))] = name
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    name = running.pop(task)
+                    task.result()
+                    timings[name] = (started[name], time.monotonic() - clock)
+                    done.add(name)
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        return timings
@@ -0,0 +1,124 @@
+import os
+import asyncio
+from functools import lru_cache
+from typing import List, Optional
+from dotenv import load_dotenv
+from services.openai_client import OpenAIClient
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character-based estimate
+    tiktoken = None
+
+load_dotenv()
+
+# gpt-4 has an 8k context; leave room for the prompt and the answer
+SUMMARY_SINGLE_SHOT_TOKENS = int(os.getenv("SUMMARY_SINGLE_SHOT_TOKENS", "6000"))
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_CHUNK_OVERLAP_TOKENS = int(os.getenv("SUMMARY_CHUNK_OVERLAP_TOKENS", "200"))
+SUMMARY_FAN_OUT = int(os.getenv("SUMMARY_FAN_OUT", "4"))
+
+MAP_PROMPT = "You are a medical assistant. The following is part {part} of {parts} of a doctor-patient conversation. Write concise notes that keep every symptom, history item, medication, test, diagnosis and treatment discussed. Do not add anything that is not in the text."
+REDUCE_PROMPT = "You are a medical assistant. The following are notes on consecutive parts of one doctor-patient conversation. Merge them into a single set of notes, removing repetition but keeping every clinical detail."
+CONDENSED_PREFIX = "Notes on consecutive parts of the conversation:\n\n"
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model: str):
+    """The model's tiktoken encoding, or None to estimate instead; looked up once per model."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # tiktoken downloads its vocabulary on first use; offline, estimate instead
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    encoding = _encoding_for(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class Summarizer:
+    """Map-reduce condensing of transcripts that do not fit in one prompt.
+
+    ``condense`` returns a transcript unchanged when it fits within
+    ``single_shot_tokens``. Otherwise the transcript is split into overlapping
+    token-bounded chunks, each chunk is summarized in parallel (at most
+    ``fan_out`` calls at once), and the notes are merged level by level until
+    they fit. The caller then runs its usual final prompt over the result.
+    """
+
+    def __init__(self, openai_client: OpenAIClient, model: str = "gpt-4",
+                 single_shot_tokens: Optional[int] = None, chunk_tokens: Optional[int] = None,
+                 overlap_tokens: Optional[int] = None, fan_out: Optional[int] = None):
+        self.openai_client = openai_client
+        self.model = model
+        self.single_shot_tokens = single_shot_tokens or SUMMARY_SINGLE_SHOT_TOKENS
+        self.chunk_tokens = chunk_tokens or SUMMARY_CHUNK_TOKENS
+        self.fan_out = fan_out or SUMMARY_FAN_OUT
+        self.overlap_tokens = SUMMARY_CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.splitter = None
+
+    def _build_splitter(self):
+        # langchain takes seconds to import; only transcripts too long for one prompt need it
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        return RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_tokens,
+            chunk_overlap=self.overlap_tokens,
+            length_function=lambda text: count_tokens(text, self.model),
+            separators=["\n\n", "\n", ". ", "? ", "! ", " ", ""]
+        )
+
+    def fits(self, text: str) -> bool:
+        return count_tokens(text, self.model) <= self.single_shot_tokens
+
+    async def condense(self, transcript: str) -> str:
+        if self.fits(transcript):
+            return transcript
+        if self.splitter is None:
+            self.splitter = await asyncio.to_thread(self._build_splitter)
+        chunks = self.splitter.split_text(transcript)
+        notes = await self._map(
+            [MAP_PROMPT.format(part=i + 1, parts=len(chunks)) for i in range(len(chunks))],
+            chunks
+        )
+        # Merge groups of notes until everything fits in one final prompt
+        while not self.fits("\n\n".join(notes)) and len(notes) > 1:
+            groups = self._group(notes)
+            notes = await self._map([REDUCE_PROMPT] * len(groups), ["\n\n".join(group) for group in groups])
+        return CONDENSED_PREFIX + "\n\n".join(notes)
+
+    def _group(self, notes: List[str]) -> List[List[str]]:
+        groups = [[]]
+        size = 0
+        for note in notes:
+            tokens = count_tokens(note, self.model)
+            if groups[-1] and size + tokens > self.chunk_tokens:
+                groups.append([])
+                size = 0
+            groups[-1].append(note)
+            size += tokens
+        if len(groups) == len(notes):
+            # Every note is chunk-sized already; pair them so each level still halves the count
+            groups = [notes[i:i + 2] for i in range(0, len(notes), 2)]
+        return groups
+
+    async def _map(self, system_prompts: List[str], texts: List[str]) -> List[str]:
+        semaphore = asyncio.Semaphore(self.fan_out)
+
+        async def summarize(system_prompt: str, text: str) -> str:
+            async with semaphore:
+                response = await self.openai_client.chat(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": text}
+                    ]
+                )
+                return response.choices[0].message.content
+
+        return await asyncio.gather(*[summarize(prompt, text) for prompt, text in zip(system_prompts, texts)])
@@ -0,0 +1,146 @@
+import os
+import hashlib
+from dataclasses import dataclass
+from typing import Callable, Optional
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+from multipart.exceptions import MultipartParseError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "500")) * 1024 * 1024
+# Room for the boundaries, part headers and small form fields around the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+@dataclass
+class SpooledUpload:
+    path: str
+    size: int
+    sha256: str
+    filename: str
+
+
+def check_content_length(request: Request, max_bytes: int = MAX_UPLOAD_BYTES):
+    """Raise UploadTooLarge before reading a body whose declared size is already over the limit."""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLarge(f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+
+
+class _FilePart:
+    """python-multipart callbacks that write one file field to disk, hashing as it goes."""
+
+    def __init__(self, field: str, dest_path: Callable[[str], str], max_bytes: int):
+        self.field = field
+        self.dest_path = dest_path
+        self.max_bytes = max_bytes
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.path: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.file = None
+        self.done = False
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self.done or options.get(b"name", b"").decode("latin-1") != self.field or b"filename" not in options:
+            return
+        self.filename = options[b"filename"].decode("utf-8", errors="replace")
+        self.path = self.dest_path(self.filename)
+        self.file = open(self.path, "wb")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.file is None:
+            return
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB")
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def on_part_end(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.done = True
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def spool_multipart_file(request: Request, dest_path: Callable[[str], str], field: str = "file",
+                               max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """Stream the ``field`` file of a multipart/form-data request straight to disk.
+
+    The body is parsed as it arrives, so nothing is spooled to a temporary
+    file first and at most one network chunk is held in memory.
+    ``dest_path`` is called with the uploaded filename and returns where to
+    write it. Raises UploadTooLarge, and removes the partial file, as soon as
+    the declared Content-Length or the bytes received exceed max_bytes;
+    InvalidUpload if the body is not multipart or has no such file.
+    """
+    check_content_length(request, max_bytes)
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidUpload("Expected a multipart/form-data body")
+    part = _FilePart(field, dest_path, max_bytes)
+    parser = MultipartParser(params[b"boundary"], part.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if part.done:
+                # Anything after the file is not needed
+                break
+        parser.finalize()
+    except MultipartParseError as e:
+        part.discard()
+        raise InvalidUpload(f"Malformed multipart body: {str(e)}")
+    except BaseException:
+        part.discard()
+        raise
+    if not part.done:
+        part.discard()
+        raise InvalidUpload(f"No '{field}' file in the upload")
+    return SpooledUpload(part.path, part.size, part.digest.hexdigest(), part.filename)
@@ -0,0 +1,98 @@
+import os
+import wave
+from bisect import bisect_right
+from typing import List, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRIM_SILENCE = os.getenv("TRIM_SILENCE", "true").lower() == "true"
+# Pauses longer than this are shortened to it; Whisper still hears a natural break
+KEEP_SILENCE_MS = int(os.getenv("VAD_KEEP_SILENCE_MS", "400"))
+COPY_BLOCK_MS = 10000
+
+
+class OffsetMap:
+    """Maps times in trimmed audio back to the original recording and vice versa.
+
+    ``pieces`` are (trimmed start, original start, length) in ms, in order;
+    the trimmed audio is those stretches of the original played back to back.
+    """
+
+    def __init__(self, pieces: List[Tuple[int, int, int]], original_ms: int):
+        self.pieces = pieces
+        self.original_ms = original_ms
+        self._trimmed_starts = [piece[0] for piece in pieces]
+        self._original_starts = [piece[1] for piece in pieces]
+
+    @classmethod
+    def identity(cls, total_ms: int) -> "OffsetMap":
+        return cls([(0, 0, total_ms)] if total_ms > 0 else [], total_ms)
+
+    @property
+    def trimmed_ms(self) -> int:
+        if not self.pieces:
+            return 0
+        start, _, length = self.pieces[-1]
+        return start + length
+
+    @property
+    def saved_seconds(self) -> float:
+        return (self.original_ms - self.trimmed_ms) / 1000
+
+    def to_original(self, ms: float) -> float:
+        if not self.pieces:
+            return ms
+        i = max(0, bisect_right(self._trimmed_starts, ms) - 1)
+        trimmed_start, original_start, length = self.pieces[i]
+        return original_start + min(max(ms - trimmed_start, 0), length)
+
+    def to_trimmed(self, ms: float) -> float:
+        """Position of original time ``ms`` in the trimmed audio; times in cut silence map to the cut."""
+        if not self.pieces:
+            return ms
+        i = max(0, bisect_right(self._original_starts, ms) - 1)
+        trimmed_start, original_start, length = self.pieces[i]
+        return trimmed_start + min(max(ms - original_start, 0), length)
+
+
+def keep_spans(speech: List[Tuple[int, int]], total_ms: int, keep_silence_ms: int = KEEP_SILENCE_MS) -> List[Tuple[int, int]]:
+    """Stretches of [0, total_ms) to keep: speech padded by half of ``keep_silence_ms`` on each side.
+
+    Every pause longer than ``keep_silence_ms`` is cut down to it, and
+    leading and trailing silence to half of it.
+    """
+    pad = keep_silence_ms // 2
+    spans: List[List[int]] = []
+    for start, end in speech:
+        start, end = max(0, start - pad), min(total_ms, end + pad)
+        if spans and start <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    return [tuple(span) for span in spans]
+
+
+def trim_silence(src_path: str, dest_path: str, speech: List[Tuple[int, int]], total_ms: int,
+                 keep_silence_ms: int = KEEP_SILENCE_MS) -> OffsetMap:
+    """Copy only the kept stretches of a PCM WAV file to ``dest_path``, a block at a time."""
+    pieces = []
+    trimmed = 0
+    with wave.open(src_path, "rb") as src, wave.open(dest_path, "wb") as dest:
+        rate = src.getframerate()
+        dest.setnchannels(src.getnchannels())
+        dest.setsampwidth(src.getsampwidth())
+        dest.setframerate(rate)
+        block_frames = rate * COPY_BLOCK_MS // 1000
+        for start, end in keep_spans(speech, total_ms, keep_silence_ms):
+            src.setpos(start * rate // 1000)
+            remaining = (end - start) * rate // 1000
+            while remaining > 0:
+                data = src.readframes(min(block_frames, remaining))
+                if not data:
+                    break
+                dest.writeframes(data)
+                remaining -= min(block_frames, remaining)
+            pieces.append((trimmed, start, end - start))
+            trimmed += end - start
+    return OffsetMap(pieces, total_ms)
@@ -0,0 +1,282 @@
+import os
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+LISTS_FILE = "lists.npy"
+CENTROIDS_FILE = "centroids.npy"
+INITIAL_CAPACITY = 1024
+# Below this many vectors a flat scan is already fast, so nothing is clustered
+MIN_TRAIN_SIZE = 2048
+# Clusters are retrained once the index has grown this many times over since the last training
+RETRAIN_GROWTH = 4
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 20000
+# Rows scored per matrix product when (re)assigning every vector to a cluster
+ASSIGN_BATCH = 8192
+DEFAULT_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means: unit centroids that maximize cosine similarity to their members."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        # Per-cluster sums in one pass over the members, grouped by cluster
+        counts = np.bincount(assignment, minlength=clusters)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        sums[nonempty] = np.add.reduceat(vectors[np.argsort(assignment, kind="stable")], starts[nonempty])
+        empty = ~nonempty
+        # Reseed clusters that lost every member rather than letting them die
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = _unit(sums)
+    return centroids.astype(np.float32)
+
+
+class VectorIndex:
+    """Approximate nearest-neighbour index over unit vectors, persisted as memory-mapped arrays.
+
+    Each slot of ``vectors.npy`` holds one vector, with the caller's integer
+    id in ``ids.npy`` (-1 once removed) and its cluster in ``lists.npy``.
+    Once ``MIN_TRAIN_SIZE`` vectors are stored they are clustered with
+    k-means into about sqrt(n) lists (an IVF index) and rewritten sorted by
+    cluster, so a search scores a few contiguous slices: the ``nprobe`` lists
+    whose centroids are closest to the query, plus the slots appended to
+    those lists since. Inserts and removals write a single row; the clusters
+    are retrained, and removed slots compacted away, when the index has grown
+    ``RETRAIN_GROWTH`` times over or half its slots are dead.
+    """
+
+    def __init__(self, directory: str, nprobe: int = DEFAULT_NPROBE):
+        self.directory = directory
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self.dim = None
+        self.size = 0
+        # Slots below trained_size are sorted by cluster; _bounds[c]:_bounds[c + 1] is cluster c
+        self.trained_size = 0
+        self.centroids: Optional[np.ndarray] = None
+        self._bounds = np.zeros(2, dtype=np.int64)
+        # Slots added to each cluster after training
+        self._appended: List[List[int]] = [[]]
+        self._vectors = self._ids = self._lists = None
+        self._slots: Dict[int, int] = {}
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._path(META_FILE)):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, item_id: int) -> bool:
+        return int(item_id) in self._slots
+
+    def get(self, item_id: int) -> Optional[np.ndarray]:
+        with self._lock:
+            slot = self._slots.get(int(item_id))
+            return None if slot is None else np.array(self._vectors[slot])
+
+    def add(self, item_id: int, vector: Sequence[float]):
+        self.add_many([item_id], [vector])
+
+    def add_many(self, ids: Iterable[int], vectors: Iterable[Sequence[float]]):
+        """Insert or replace vectors by id; a replaced vector moves to a new slot."""
+        ids = [int(item_id) for item_id in ids]
+        if not ids:
+            return
+        vectors = _unit(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        with self._lock:
+            if self.dim is None:
+                self._create(vectors.shape[1], INITIAL_CAPACITY)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            clusters = self._assign(vectors)
+            for item_id, vector, cluster in zip(ids, vectors, clusters):
+                old = self._slots.get(item_id)
+                if old is not None:
+                    self._ids[old] = -1
+                if self.size == len(self._ids):
+                    self._grow(2 * len(self._ids))
+                slot = self.size
+                self.size += 1
+                self._slots[item_id] = slot
+                self._vectors[slot] = vector
+                self._ids[slot] = item_id
+                self._lists[slot] = cluster
+                if self.centroids is not None:
+                    self._appended[cluster].append(slot)
+            self._flush()
+            if self._needs_training():
+                self._train()
+
+    def remove(self, item_id: int) -> bool:
+        with self._lock:
+            slot = self._slots.pop(int(item_id), None)
+            if slot is None:
+                return False
+            # Dead slots stay in their cluster until the next compaction; searches skip them
+            self._ids[slot] = -1
+            self._flush()
+            if self._needs_training():
+                self._train()
+            return True
+
+    def search(self, vector: Sequence[float], k: int = 10, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Return up to ``k`` (id, cosine similarity) pairs, most similar first."""
+        query = _unit(np.asarray(vector, dtype=np.float32).reshape(-1))
+        exclude = {int(item_id) for item_id in exclude}
+        with self._lock:
+            if not self._slots:
+                return []
+            if self.centroids is None:
+                ranges, appended = [(0, self.size)], []
+            else:
+                nprobe = min(self.nprobe, len(self.centroids))
+                probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+                ranges = [(self._bounds[c], self._bounds[c + 1]) for c in probe]
+                appended = [slot for c in probe for slot in self._appended[c]]
+            slots = [np.arange(start, stop) for start, stop in ranges if stop > start]
+            scores = [self._vectors[start:stop] @ query for start, stop in ranges if stop > start]
+            if appended:
+                slots.append(np.asarray(appended, dtype=np.int64))
+                scores.append(self._vectors[slots[-1]] @ query)
+            if not slots:
+                return []
+            slots = np.concatenate(slots)
+            scores = np.concatenate(scores)
+            ids = np.asarray(self._ids[slots])
+        # Removed slots score like any other until compaction
+        scores[ids < 0] = -np.inf
+        # A few spare results cover excluded ids
+        want = min(len(slots), k + len(exclude))
+        top = np.argpartition(-scores, want - 1)[:want]
+        top = top[np.argsort(-scores[top])]
+        results = [(int(ids[i]), float(scores[i])) for i in top if ids[i] >= 0 and int(ids[i]) not in exclude]
+        return results[:k]
+
+    def close(self):
+        with self._lock:
+            # Nothing is on disk until the first vector sets the dimension
+            if self._vectors is not None:
+                self._flush()
+            self._vectors = self._ids = self._lists = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        with open(self._path(META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.size = meta["size"]
+        self.trained_size = meta["trained_size"]
+        self._open()
+        if self.trained_size and os.path.exists(self._path(CENTROIDS_FILE)):
+            self.centroids = np.load(self._path(CENTROIDS_FILE))
+            self._index_clusters()
+        ids = np.asarray(self._ids[:self.size])
+        live = np.flatnonzero(ids >= 0)
+        self._slots = dict(zip(ids[live].tolist(), live.tolist()))
+
+    def _open(self):
+        self._vectors = np.load(self._path(VECTORS_FILE), mmap_mode="r+")
+        self._ids = np.load(self._path(IDS_FILE), mmap_mode="r+")
+        self._lists = np.load(self._path(LISTS_FILE), mmap_mode="r+")
+
+    def _create(self, dim: int, capacity: int):
+        self.dim = dim
+        self._write_arrays(capacity, np.arange(0))
+        self._open()
+        self._save_meta()
+
+    def _write_arrays(self, capacity: int, slots: np.ndarray, lists: Optional[np.ndarray] = None):
+        """Rewrite the arrays at ``capacity`` with the rows of ``slots`` first; ``lists`` overrides their clusters."""
+        # New files are written beside the old ones and swapped in, so a crash leaves the old index intact
+        names = ((VECTORS_FILE, np.float32, (capacity, self.dim), 0), (IDS_FILE, np.int64, (capacity,), -1),
+                 (LISTS_FILE, np.int32, (capacity,), -1))
+        sources = {VECTORS_FILE: self._vectors, IDS_FILE: self._ids, LISTS_FILE: self._lists}
+        rows = len(slots)
+        for name, dtype, shape, fill in names:
+            tmp_path = self._path(name + ".tmp")
+            array = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+            array[rows:] = fill
+            # Copied in batches so a large index is never loaded into memory whole
+            for start in range(0, rows, ASSIGN_BATCH):
+                stop = min(rows, start + ASSIGN_BATCH)
+                if name == LISTS_FILE and lists is not None:
+                    array[start:stop] = lists[start:stop]
+                else:
+                    array[start:stop] = sources[name][slots[start:stop]]
+            array.flush()
+            del array
+        self._vectors = self._ids = self._lists = None
+        for name, _, _, _ in names:
+            os.replace(self._path(name + ".tmp"), self._path(name))
+
+    def _grow(self, capacity: int):
+        self._write_arrays(capacity, np.arange(self.size))
+        self._open()
+
+    def _flush(self):
+        for array in (self._vectors, self._ids, self._lists):
+            array.flush()
+        self._save_meta()
+
+    def _save_meta(self):
+        tmp_path = self._path(META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "size": self.size, "trained_size": self.trained_size}, f)
+        os.replace(tmp_path, self._path(META_FILE))
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int32)
+        clusters = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_BATCH):
+            batch = np.asarray(vectors[start:start + ASSIGN_BATCH])
+            clusters[start:start + len(batch)] = np.argmax(batch @ self.centroids.T, axis=1)
+        return clusters
+
+    def _index_clusters(self):
+        # Cluster boundaries of the sorted block, and the slots appended after it by cluster
+        clusters = len(self.centroids)
+        self._bounds = np.searchsorted(np.asarray(self._lists[:self.trained_size]), np.arange(clusters + 1))
+        self._appended = [[] for _ in range(clusters)]
+        extra = np.arange(self.trained_size, self.size)
+        for slot, cluster in zip(extra.tolist(), np.asarray(self._lists[self.trained_size:self.size]).tolist()):
+            self._appended[cluster].append(slot)
+
+    def _needs_training(self) -> bool:
+        live = len(self._slots)
+        if live < MIN_TRAIN_SIZE:
+            return False
+        return (not self.trained_size or live >= RETRAIN_GROWTH * self.trained_size
+                or self.size - live > max(live, INITIAL_CAPACITY))
+
+    def _train(self):
+        # Cluster a sample of the live vectors, then rewrite every live vector sorted by cluster
+        live = np.flatnonzero(np.asarray(self._ids[:self.size]) >= 0)
+        rng = np.random.default_rng(len(live))
+        sample = np.sort(rng.choice(live, min(len(live), KMEANS_SAMPLE), replace=False))
+        self.centroids = kmeans(np.asarray(self._vectors[sample]), max(1, int(np.sqrt(len(live)))))
+        clusters = self._assign(self._vectors[live])
+        order = np.argsort(clusters, kind="stable")
+        self._write_arrays(max(INITIAL_CAPACITY, 2 * len(live)), live[order], clusters[order])
+        self._open()
+        self.size = self.trained_size = len(live)
+        self._slots = dict(zip(np.asarray(self._ids[:self.size]).tolist(), range(self.size)))
+        self._index_clusters()
+        np.save(self._path(CENTROIDS_FILE), self.centroids)
+        self._flush()
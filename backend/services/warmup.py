@@ -0,0 +1,80 @@
+import time
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+
+class WarmUp:
+    """Progress of the slow start-up steps that run after the app starts serving.
+
+    Steps run in order on worker threads, so liveness checks and requests
+    that do not need them are answered meanwhile. ``wait`` blocks until
+    every step has finished or one has failed; ``status`` is what the
+    readiness probe reports.
+    """
+
+    def __init__(self, steps: List[str]):
+        self.steps: Dict[str, Dict[str, Any]] = {name: {"status": "pending"} for name in steps}
+        self.started_at = time.monotonic()
+        self.ready_after: Optional[float] = None
+        self.error: Optional[str] = None
+        self._done = asyncio.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+
+    async def run(self, name: str, func: Callable, *args):
+        """Run one step in a thread; a failure ends the warm-up and is re-raised."""
+        step = self.steps[name]
+        step["status"] = "running"
+        start = time.monotonic()
+        try:
+            result = await asyncio.to_thread(func, *args)
+        except Exception as e:
+            step["status"] = "failed"
+            self.error = f"{name}: {str(e)}"
+            self._done.set()
+            raise
+        step["status"] = "done"
+        step["seconds"] = round(time.monotonic() - start, 3)
+        return result
+
+    def progress(self, name: str, done: int, total: int):
+        """Report ``done`` of ``total`` units of a running step; safe to call from its thread."""
+        self.steps[name]["progress"] = {"done": done, "total": total}
+
+    def detail(self, name: str, **details):
+        """Add details to a step's status, such as the inputs it had to skip."""
+        self.steps[name].update(details)
+
+    def fail(self, error: str):
+        """End the warm-up with an error, unless a failed step already recorded one."""
+        if not self.error:
+            self.error = error
+        self._done.set()
+
+    def finish(self):
+        self.ready_after = time.monotonic() - self.started_at
+        self._done.set()
+
+    async def wait(self):
+        """Wait for the warm-up to end; raises if it failed."""
+        await self._done.wait()
+        if self.error:
+            raise RuntimeError(f"Warm-up failed: {self.error}")
+
+    def status(self) -> Dict[str, Any]:
+        if self.error:
+            state = "failed"
+        elif self.ready:
+            state = "ready"
+        else:
+            state = "warming_up"
+        status: Dict[str, Any] = {"status": state, "steps": self.steps}
+        if self.ready:
+            status["ready_after_seconds"] = round(self.ready_after, 3)
+        else:
+            status["elapsed_seconds"] = round(time.monotonic() - self.started_at, 3)
+        if self.error:
+            status["error"] = self.error
+        return status
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app and its services import each other as ``services.*``, as when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
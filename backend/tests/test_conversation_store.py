@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.conversation_store import ConversationStore, InvalidCursor, encode_cursor
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.db"))
+    yield store
+    store.close()
+
+
+def all_pages(store, **filters):
+    pages, cursor = [], None
+    while True:
+        items, cursor = store.list_page(cursor=cursor, **filters)
+        pages.append([item["id"] for item in items])
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_conversation_once_newest_first(store):
+    start = datetime(2024, 1, 1)
+    # Several conversations share a date, so the id breaks the tie
+    created = []
+    for i in range(10):
+        date = start + timedelta(days=i % 4)
+        created.append((date, store.create("doctor", "patient", date)["id"]))
+
+    pages = all_pages(store, limit=4)
+
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert [conversation_id for page in pages for conversation_id in page] == [
+        conversation_id for _, conversation_id in sorted(created, reverse=True)
+    ]
+
+
+def test_last_full_page_has_no_cursor(store):
+    for _ in range(4):
+        store.create("doctor", "patient")
+    items, cursor = store.list_page(limit=4)
+    assert len(items) == 4
+    assert cursor is None
+
+
+def test_inserts_during_paging_do_not_shift_later_pages(store):
+    start = datetime(2024, 1, 1)
+    ids = [store.create("doctor", "patient", start + timedelta(days=i))["id"] for i in range(6)]
+    first, cursor = store.list_page(limit=3)
+    # A newer conversation arrives between requests; offset paging would repeat a row here
+    store.create("doctor", "patient", start + timedelta(days=30))
+    second, cursor = store.list_page(limit=3, cursor=cursor)
+
+    assert [item["id"] for item in first] == ids[:2:-1]
+    assert [item["id"] for item in second] == ids[2::-1]
+    assert cursor is None
+
+
+def test_filters_apply_across_pages(store):
+    for i in range(7):
+        store.create("doctor-a" if i % 2 else "doctor-b", "patient")
+    pages = all_pages(store, doctor_id="doctor-a", limit=2)
+    ids = [conversation_id for page in pages for conversation_id in page]
+    assert len(ids) == 3
+    assert all(store.get(conversation_id)["doctor_id"] == "doctor-a" for conversation_id in ids)
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor("2024-01-01", 1)[:-4], "WyJ4Il0="])
+def test_invalid_cursor_is_rejected(store, cursor):
+    with pytest.raises(InvalidCursor):
+        store.list_page(cursor=cursor)
+
+
+def test_api_returns_400_for_an_invalid_cursor(store, tmp_path):
+    from fastapi.testclient import TestClient
+    import main
+    from services.language_service import LanguageService
+
+    main.app.state.conversation_store = store
+    main.app.state.language_service = LanguageService(str(tmp_path / "translations"))
+    store.create("doctor", "patient")
+    client = TestClient(main.app)
+
+    response = client.get("/conversations/", params={"limit": 1})
+    assert response.status_code == 200
+    assert response.json()["next_cursor"] is None
+    assert client.get("/conversations/", params={"cursor": "garbage"}).status_code == 400
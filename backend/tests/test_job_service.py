@@ -0,0 +1,112 @@
+import asyncio
+
+from services.job_service import FAILED, SUCCEEDED, JobService
+
+
+async def wait_for(service, job_id, condition):
+    async for job in service.watch(job_id):
+        if condition(job):
+            return job
+    return service.get(job_id)
+
+
+def test_job_resumes_after_restart_without_rerunning_completed_stages(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    calls = []
+
+    async def transcribe(context):
+        calls.append("transcribe")
+        return {"transcript": f"words from {context['audio_path']}"}
+
+    async def summarize_forever(context):
+        calls.append("summarize")
+        # The process "dies" while this stage runs
+        await asyncio.Event().wait()
+
+    async def summarize(context):
+        calls.append("summarize")
+        return {"summary": context["transcript"].upper()}
+
+    async def report(context):
+        calls.append("report")
+        assert context["summary"] == "WORDS FROM A.WAV"
+        return {}
+
+    async def first_run():
+        service = JobService([("transcribe", transcribe, ()), ("summarize", summarize_forever, ("transcribe",)),
+                              ("report", report, ("summarize",))], db_path=db_path, workers=1)
+        await service.start()
+        job = service.enqueue("1", {"audio_path": "a.wav"})
+        job = await wait_for(service, job["id"], lambda job: job["completed_stages"] == ["transcribe"])
+        await service.stop()
+        return job["id"]
+
+    async def second_run(job_id):
+        service = JobService([("transcribe", transcribe, ()), ("summarize", summarize, ("transcribe",)),
+                              ("report", report, ("summarize",))], db_path=db_path, workers=1)
+        await service.start()
+        job = await wait_for(service, job_id, lambda job: job["status"] in (SUCCEEDED, FAILED))
+        await service.stop()
+        return job
+
+    job_id = asyncio.run(first_run())
+    job = asyncio.run(second_run(job_id))
+
+    assert job["status"] == SUCCEEDED
+    assert job["completed_stages"] == ["transcribe", "summarize", "report"]
+    # The transcript came from the stored context; transcription did not run again
+    assert calls == ["transcribe", "summarize", "summarize", "report"]
+    assert job["critical_path"]["stages"] == ["summarize", "report"]
+
+
+def test_stage_is_retried_with_backoff_then_succeeds(tmp_path):
+    attempts = []
+
+    async def flaky(context):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("temporary")
+        return {"done": True}
+
+    async def main():
+        service = JobService([("flaky", flaky, ())], db_path=str(tmp_path / "jobs.db"), workers=1,
+                             max_attempts=3, retry_delay=0.01)
+        await service.start()
+        job = service.enqueue("1", {})
+        job = await wait_for(service, job["id"], lambda job: job["status"] in (SUCCEEDED, FAILED))
+        await service.stop()
+        return job
+
+    job = asyncio.run(main())
+    assert job["status"] == SUCCEEDED
+    assert job["attempts"] == 3
+    assert job["error"] is None
+
+
+def test_job_fails_after_the_last_attempt_and_cancels_other_stages(tmp_path):
+    cancelled = []
+
+    async def broken(context):
+        raise RuntimeError("no audio")
+
+    async def slow(context):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        service = JobService([("broken", broken, ()), ("slow", slow, ())], db_path=str(tmp_path / "jobs.db"),
+                             workers=1, max_attempts=2, retry_delay=0.01)
+        await service.start()
+        job = service.enqueue("1", {})
+        job = await wait_for(service, job["id"], lambda job: job["status"] in (SUCCEEDED, FAILED))
+        await service.stop()
+        return job
+
+    job = asyncio.run(main())
+    assert job["status"] == FAILED
+    assert job["attempts"] == 2
+    assert job["error"] == "broken: no audio"
+    assert cancelled == [True]
@@ -0,0 +1,200 @@
+import io
+import wave
+import array
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.audio_service import TranscriptSegment
+from services.live_transcription import SAMPLE_WIDTH, LiveTranscription, PcmRingBuffer
+
+
+def pcm_counting(start: int, count: int) -> bytes:
+    """16-bit samples whose values are their own sample offsets, so segments can be checked by content."""
+    return array.array("h", [(start + i) % 32768 for i in range(count)]).tobytes()
+
+
+def collect(segment_ms=1000, overlap_ms=200, sample_rate=1000):
+    segments = []
+    buffer = PcmRingBuffer(lambda index, start_ms, pcm: segments.append((index, start_ms, pcm)),
+                           segment_ms, overlap_ms, sample_rate)
+    return buffer, segments
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 333, 800, 5000])
+def test_ring_buffer_cuts_overlapping_segments(chunk):
+    buffer, segments = collect()
+    audio = pcm_counting(0, 5000)
+    for offset in range(0, len(audio), chunk * SAMPLE_WIDTH):
+        buffer.write(audio[offset:offset + chunk * SAMPLE_WIDTH])
+
+    # 1000-sample segments every 800 samples, each exactly that slice of the input
+    assert [(index, start) for index, start, _ in segments] == [(i, i * 800) for i in range(6)]
+    for _, start, pcm in segments:
+        assert pcm == pcm_counting(start, 1000)
+
+
+def test_ring_buffer_flush_emits_only_new_audio():
+    buffer, segments = collect()
+    buffer.write(pcm_counting(0, 2300))
+    assert [start for _, start, _ in segments] == [0, 800]
+    buffer.flush()
+    # The rest after the last full segment, overlap included, as a shorter final segment
+    assert segments[-1][:2] == (2, 1600)
+    assert segments[-1][2] == pcm_counting(1600, 700)
+
+
+def test_ring_buffer_flush_skips_audio_already_sent():
+    buffer, segments = collect()
+    buffer.write(pcm_counting(0, 1000))
+    buffer.flush()
+    # Samples 800-1000 were in the first segment; nothing new is left
+    assert len(segments) == 1
+
+    buffer, segments = collect()
+    buffer.write(pcm_counting(0, 400))
+    buffer.flush()
+    # A recording shorter than one segment is sent whole
+    assert [(index, start, len(pcm)) for index, start, pcm in segments] == [(0, 0, 800)]
+
+
+def test_ring_buffer_rejects_overlap_as_long_as_the_segment():
+    with pytest.raises(ValueError):
+        PcmRingBuffer(lambda *args: None, 1000, 1000)
+
+
+def fake_whisper(delays):
+    """A _transcribe stand-in: one Whisper segment per second of the audio, named by its absolute second.
+
+    ``delays[index]`` is how long the segment's request takes, so workers can finish out of order.
+    """
+    calls = []
+
+    async def transcribe(start_ms, pcm):
+        index = len(calls)
+        calls.append(start_ms)
+        await asyncio.sleep(delays[index % len(delays)])
+        seconds = len(pcm) // SAMPLE_WIDTH // 16000
+        first = start_ms // 1000
+        return [TranscriptSegment(second, second + 1, f"s{second}") for second in range(first, first + seconds)]
+
+    return transcribe, calls
+
+
+def run_live(seconds, delays, workers, segment_seconds=4, overlap_seconds=2):
+    async def main():
+        live = LiveTranscription(None, segment_seconds=segment_seconds, overlap_seconds=overlap_seconds,
+                                 workers=workers)
+        live._transcribe, calls = fake_whisper(delays)
+        batches = []
+
+        async def read():
+            async for segments in live.updates():
+                batches.append([segment.text for segment in segments])
+
+        reader = asyncio.create_task(read())
+        live.feed(b"\x01\x00" * 16000 * seconds)
+        live.finish()
+        transcript = await live.wait()
+        await reader
+        await live.close()
+        return transcript, batches, calls
+
+    return asyncio.run(main())
+
+
+def test_commit_keeps_each_second_once_in_order():
+    transcript, batches, calls = run_live(10, [0], workers=1)
+    # Segments start every 2 s and the last one ends with the audio, so flush adds none;
+    # each overlapped second is kept by exactly one of them
+    assert calls == [0, 2000, 4000, 6000]
+    assert transcript == " ".join(f"s{second}" for second in range(10))
+    assert [text for batch in batches for text in batch] == [f"s{second}" for second in range(10)]
+
+
+def test_commit_orders_results_from_out_of_order_workers():
+    # Later segments come back first
+    transcript, batches, _ = run_live(10, [0.05, 0.04, 0.03, 0.02, 0.01], workers=5)
+    assert transcript == " ".join(f"s{second}" for second in range(10))
+    assert [text for batch in batches for text in batch] == [f"s{second}" for second in range(10)]
+
+
+def test_commit_survives_a_failed_segment():
+    async def main():
+        live = LiveTranscription(None, segment_seconds=4, overlap_seconds=2, workers=2)
+        transcribe, _ = fake_whisper([0])
+
+        async def flaky(start_ms, pcm):
+            if start_ms == 2000:
+                raise RuntimeError("Whisper down")
+            return await transcribe(start_ms, pcm)
+
+        live._transcribe = flaky
+        live.feed(b"\x01\x00" * 16000 * 8)
+        live.finish()
+        transcript = await live.wait()
+        await live.close()
+        return transcript
+
+    # The failed segment's share (s3, s4) is a gap; the rest is still committed in order
+    assert asyncio.run(main()) == "s0 s1 s2 s5 s6 s7"
+
+
+class FakeOpenAI:
+    """Whisper stand-in for the websocket: one segment of text per request, spanning the audio sent."""
+
+    def __init__(self):
+        self.requests = 0
+
+    async def transcribe(self, file, response_format=None, **kwargs):
+        self.requests += 1
+        with wave.open(io.BytesIO(file[1]), "rb") as wav:
+            seconds = wav.getnframes() / wav.getframerate()
+        return SimpleNamespace(text=f"part{self.requests}", segments=[{"start": 0.0, "end": seconds, "text": f" part{self.requests}"}])
+
+
+@pytest.fixture
+def live_app(tmp_path):
+    from fastapi.testclient import TestClient
+    import main
+    from services.conversation_store import ConversationStore
+
+    store = ConversationStore(str(tmp_path / "conversations.db"))
+    main.app.state.conversation_store = store
+    main.app.state.openai_client = FakeOpenAI()
+    # Without the context manager the lifespan (models, indexes, job workers) is not started
+    yield TestClient(main.app), store
+    store.close()
+
+
+def test_websocket_streams_segments_and_saves_the_transcript(live_app):
+    client, store = live_app
+    conversation = store.create("doctor", "patient")
+    tone = array.array("h", [3000, -3000] * 8000).tobytes()  # 1 s at 16 kHz
+
+    with client.websocket_connect(f"/conversations/{conversation['id']}/live") as websocket:
+        for _ in range(25):
+            websocket.send_bytes(tone)
+        websocket.send_text("stop")
+        messages = []
+        while True:
+            message = websocket.receive_json()
+            messages.append(message)
+            if message["type"] == "done":
+                break
+
+    # 10 s segments every 8 s: two full ones and the last 9 s when the recording stops
+    assert messages[-1] == {"type": "done", "transcript": "part1 part2 part3"}
+    texts = [segment["text"] for message in messages if message["type"] == "segments" for segment in message["segments"]]
+    assert sorted(texts) == ["part1", "part2", "part3"]
+    assert store.get(conversation["id"])["transcript"] == "part1 part2 part3"
+
+
+def test_websocket_rejects_unknown_conversation(live_app):
+    from starlette.websockets import WebSocketDisconnect
+    client, _ = live_app
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/conversations/999/live") as websocket:
+            websocket.receive_json()
+    assert closed.value.code == 1008
@@ -0,0 +1,156 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from services import rate_limiter
+from services.openai_client import OpenAIClient
+from services.rate_limiter import CircuitBreaker, CircuitOpenError, backoff_delay, retry_after_seconds
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def api_error(cls, status, headers=None, body=None):
+    return cls("failed", response=httpx.Response(status, headers=headers, request=REQUEST), body=body)
+
+
+class Clock:
+    """Stands in for ``time.monotonic`` so the breaker's timeout can be stepped through."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    # A success in between resets the count
+    breaker.failure()
+    breaker.failure()
+    breaker.check()
+    assert breaker.state == "closed"
+
+    breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_breaker_lets_one_trial_through_after_the_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.failure()
+    clock.now += 30
+    assert breaker.state == "half-open"
+
+    breaker.check()
+    # Only the first caller gets the trial
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.failure()
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    clock.now += 1
+    breaker.check()
+    breaker.success()
+    assert breaker.state == "closed"
+    breaker.check()
+
+
+def test_backoff_delay_stays_within_the_jitter_window():
+    for attempt in range(8):
+        for _ in range(50):
+            assert 0 <= backoff_delay(attempt, 1, 10) <= min(10, 2 ** attempt)
+
+
+def test_backoff_delay_waits_at_least_the_retry_after():
+    assert all(backoff_delay(0, 1, 10, retry_after=5) >= 5 for _ in range(50))
+    # The server's Retry-After wins even over the cap
+    assert backoff_delay(3, 1, 2, retry_after=20) == 20
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "1500", "retry-after": "9"}, 1.5),
+    ({"retry-after": "2"}, 2.0),
+    ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, None),
+    ({}, None),
+])
+def test_retry_after_seconds(headers, expected):
+    assert retry_after_seconds(api_error(openai.RateLimitError, 429, headers)) == expected
+
+
+def test_retry_after_seconds_without_a_response():
+    assert retry_after_seconds(openai.APIConnectionError(request=REQUEST)) is None
+
+
+def make_client(failures, max_retries=3, breaker=None):
+    """An OpenAIClient without rate limits or backoff delays whose requests raise ``failures`` in turn."""
+    client = OpenAIClient(client=object(), rpm=0, tpm=0, max_retries=max_retries, backoff_base=0, backoff_max=0,
+                          breaker=breaker or CircuitBreaker(failure_threshold=100))
+    calls = []
+
+    async def create():
+        calls.append(1)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return SimpleNamespace(model="gpt-4", usage=None)
+
+    return client, create, calls
+
+
+def test_call_retries_server_errors_then_succeeds():
+    client, create, calls = make_client([
+        api_error(openai.InternalServerError, 500),
+        openai.APIConnectionError(request=REQUEST),
+        api_error(openai.RateLimitError, 429),
+    ])
+    result = asyncio.run(client.call(create))
+    assert result.model == "gpt-4"
+    assert len(calls) == 4
+
+
+def test_call_gives_up_after_max_retries():
+    client, create, calls = make_client([api_error(openai.InternalServerError, 500)] * 10, max_retries=2)
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(client.call(create))
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("error", [
+    api_error(openai.RateLimitError, 429, body={"code": "insufficient_quota"}),
+    api_error(openai.BadRequestError, 400),
+])
+def test_call_does_not_retry_errors_that_will_not_recover(error):
+    client, create, calls = make_client([error])
+    with pytest.raises(type(error)):
+        asyncio.run(client.call(create))
+    assert len(calls) == 1
+
+
+def test_open_breaker_fails_fast_without_calling_the_api():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    client, create, calls = make_client([api_error(openai.InternalServerError, 500)] * 10, breaker=breaker)
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.call(create))
+    # The breaker opened on the second failure and stopped the third attempt
+    assert len(calls) == 2
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.call(create))
+    assert len(calls) == 2
@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from services.warmup import WarmUp
+
+
+def run_warm_up(monkeypatch, build_report_service):
+    monkeypatch.setattr(main, "build_report_service", build_report_service)
+    app = SimpleNamespace(state=SimpleNamespace(openai_client=None, llm_cache=None))
+
+    async def run():
+        warmup = WarmUp(main.WARM_UP_STEPS)
+        await main.warm_up(app, warmup)
+        # A report stage waiting on the warm-up must be released, with the error
+        with pytest.raises(RuntimeError, match="Warm-up failed"):
+            await asyncio.wait_for(warmup.wait(), timeout=1)
+        return warmup
+
+    return asyncio.run(run())
+
+
+def test_failed_step_ends_the_warm_up(monkeypatch):
+    def broken(openai_client, llm_cache):
+        raise RuntimeError("no API key")
+
+    warmup = run_warm_up(monkeypatch, broken)
+    status = warmup.status()
+    assert status["status"] == "failed"
+    assert status["error"] == "report_service: no API key"
+    assert status["steps"]["report_service"]["status"] == "failed"
+    assert not warmup.ready
+
+
+def test_failure_between_steps_ends_the_warm_up(monkeypatch):
+    def initialize_vector_store(progress):
+        progress(1, 1)
+
+    # The case index has no ``failed`` attribute, so warm_up fails outside any step
+    service = SimpleNamespace(initialize_vector_store=initialize_vector_store, case_index=None)
+    warmup = run_warm_up(monkeypatch, lambda openai_client, llm_cache: service)
+    status = warmup.status()
+    assert status["status"] == "failed"
+    assert "failed" in status["error"]
+    assert status["steps"]["case_index"]["status"] == "done"
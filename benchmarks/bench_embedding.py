@@ -0,0 +1,90 @@
+"""Embedding a case corpus: one call per file vs. BatchedEmbeddings (dedup, batches, cache).
+
+Builds synthetic case chunks where every file repeats the same header and
+footer boilerplate, then embeds them with the offline LocalEmbeddings, which
+sleeps like an embeddings API round trip on every call:
+
+- per file: one embed_documents call per case file, as Chroma made them
+- batched, cold: BatchedEmbeddings with an empty cache
+- batched, rebuild: the same corpus again, as after wiping the index
+
+    python benchmarks/bench_embedding.py --files 200 --latency 0.2 --concurrency 1 4
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.embedding_cache import BatchedEmbeddings, EmbeddingCache  # noqa: E402
+from services.local_clients import LocalEmbeddings  # noqa: E402
+
+HEADER = ("CONFIDENTIAL - Clinical case record. This document contains protected health information and is "
+          "intended only for licensed practitioners. Do not distribute.")
+FOOTER = "Reviewed by the clinical governance board. Page references follow the hospital records standard."
+SYMPTOMS = ["insomnia", "panic attacks", "low mood", "racing thoughts", "fatigue", "irritability", "poor appetite"]
+
+
+def corpus(files, chunks_per_file, seed=3):
+    rng = random.Random(seed)
+    documents = []
+    for i in range(files):
+        chunks = [HEADER]
+        for j in range(chunks_per_file):
+            symptoms = ", ".join(rng.sample(SYMPTOMS, 3))
+            chunks.append(f"Case {i}, section {j}: the patient described {symptoms} over {rng.randint(2, 30)} weeks.")
+        # Re-flowed whitespace must not defeat deduplication
+        chunks.append(FOOTER.replace(" ", "  ") if i % 2 else FOOTER)
+        documents.append(chunks)
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=20, help="distinct chunks per file")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake embeddings API latency per call, seconds")
+    parser.add_argument("--batch-tokens", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    documents = corpus(args.files, args.chunks)
+    total = sum(len(chunks) for chunks in documents)
+    print(f"{args.files} files, {total} chunks")
+
+    model = LocalEmbeddings(latency=args.latency)
+    start = time.perf_counter()
+    for chunks in documents:
+        model.embed_documents(chunks)
+    elapsed = time.perf_counter() - start
+    print(f"per file:            {elapsed:6.2f} s, {model.embedded_texts} texts embedded")
+
+    for concurrency in args.concurrency:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, "embedding_cache.db")
+            model = LocalEmbeddings(latency=args.latency)
+            embeddings = BatchedEmbeddings(model, EmbeddingCache(cache_path), batch_tokens=args.batch_tokens,
+                                           concurrency=concurrency)
+            texts = [chunk for chunks in documents for chunk in chunks]
+            start = time.perf_counter()
+            embeddings.embed_documents(texts)
+            cold = time.perf_counter() - start
+            cold_texts = model.embedded_texts
+            embeddings.close()
+
+            # A fresh process rebuilding the index finds every vector in the cache
+            embeddings = BatchedEmbeddings(model, EmbeddingCache(cache_path), batch_tokens=args.batch_tokens,
+                                           concurrency=concurrency)
+            start = time.perf_counter()
+            embeddings.embed_documents(texts)
+            warm = time.perf_counter() - start
+            embeddings.close()
+        print(f"batched x{concurrency}, cold:   {cold:6.2f} s, {cold_texts} texts embedded; "
+              f"rebuild {warm:6.2f} s, {model.embedded_texts - cold_texts} texts embedded")
+
+
+if __name__ == "__main__":
+    main()
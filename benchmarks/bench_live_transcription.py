@@ -0,0 +1,197 @@
+"""Live transcription: how far the running transcript trails the recording, and what it costs.
+
+Synthesizes a session in which every "word" is a short tone whose pitch
+encodes its id, and replays it through the backend's WebSocket endpoint with
+the file-replay source standing in for the microphone. A fake Whisper decodes
+the tones back into words, with a latency of ``--latency`` plus
+``--per-second`` per second of audio, so the merged transcript can be checked
+word for word: a word lost or doubled at a segment overlap shows up as dropped
+or duplicated.
+
+Reports how long after being spoken each segment reaches the client, how
+long after the recording stops the full transcript is there (against one
+upload of the whole file after it stops), and the extra audio sent to Whisper
+because of the overlaps. ``--speed`` replays faster than real time; every time
+is reported in recording seconds:
+
+    python benchmarks/bench_live_transcription.py --minutes 3 --speed 4
+"""
+import os
+import sys
+import io
+import time
+import wave
+import asyncio
+import argparse
+import difflib
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+RATE = 16000
+BASE_HZ, STEP_HZ, WORD_IDS = 300, 40, 30
+
+
+def session(minutes, seed=11):
+    """16-bit samples plus the (id, start s, end s) of every word."""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * RATE)
+    samples = rng.standard_normal(total) * 30
+    words, position, word = [], int(0.5 * RATE), 0
+    while True:
+        length = int(rng.uniform(0.25, 0.6) * RATE)
+        if position + length >= total:
+            break
+        t = np.arange(length) / RATE
+        samples[position:position + length] += 8000 * np.sin(2 * np.pi * (BASE_HZ + STEP_HZ * (word % WORD_IDS)) * t)
+        words.append((word % WORD_IDS, position / RATE, (position + length) / RATE))
+        # Mostly short gaps, now and then a pause of a few seconds
+        pause = rng.uniform(2, 5) if rng.random() < 0.08 else rng.uniform(0.1, 0.7)
+        position += length + int(pause * RATE)
+        word += 1
+    return np.clip(samples, -32768, 32767).astype(np.int16), words
+
+
+def decode_words(samples, frame=160):
+    """Find the tone bursts in 16-bit samples: (id, start s, end s) each."""
+    count = len(samples) // frame
+    frames = samples[:count * frame].reshape(count, frame).astype(np.float64)
+    active = np.sqrt(np.mean(frames * frames, axis=1)) > 1000
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], active.astype(np.int8), [0]))))
+    words = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        burst = samples[start * frame:end * frame].astype(np.float64)
+        hz = np.argmax(np.abs(np.fft.rfft(burst))) * RATE / len(burst)
+        words.append((int(round((hz - BASE_HZ) / STEP_HZ)), start * frame / RATE, end * frame / RATE))
+    return words
+
+
+class ToneWhisper:
+    """Stands in for ``openai.AsyncOpenAI`` transcriptions: tones in, word ids and segment times out."""
+
+    def __init__(self, latency, per_second, speed):
+        self.latency = latency
+        self.per_second = per_second
+        self.speed = speed
+        self.calls = 0
+        self.seconds = 0.0
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **kwargs):
+        return self
+
+    async def _create(self, model, file, **kwargs):
+        with wave.open(io.BytesIO(file[1]), "rb") as wav:
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        seconds = len(samples) / RATE
+        self.calls += 1
+        self.seconds += seconds
+        await asyncio.sleep((self.latency + self.per_second * seconds) / self.speed)
+        segments = [SimpleNamespace(start=start, end=end, text=f"w{word}") for word, start, end in decode_words(samples)]
+        return SimpleNamespace(text=" ".join(segment.text for segment in segments), segments=segments)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def run(args, tmp):
+    for name, value in (("CASES_DIR", "cases"), ("INDEX_DIR", "index"), ("CONVERSATIONS_DB_PATH", "conversations.db"),
+                        ("EMBEDDING_CACHE_PATH", "embedding_cache.db"), ("JOBS_DB_PATH", "jobs.db"),
+                        ("LLM_CACHE_PATH", "llm_cache.db"), ("SESSION_INDEX_DIR", "session_index"),
+                        ("TRANSLATIONS_DIR", "translations")):
+        os.environ[name] = os.path.join(tmp, value)
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ["EMBEDDINGS_BACKEND"] = "local"
+    os.environ["LIVE_SEGMENT_SECONDS"] = str(args.segment)
+    os.environ["LIVE_OVERLAP_SECONDS"] = str(args.overlap)
+    os.makedirs(os.environ["CASES_DIR"])
+
+    import main  # noqa: E402
+    from fastapi.testclient import TestClient  # noqa: E402
+    from services.openai_client import OpenAIClient  # noqa: E402
+    from services.live_transcription import WavReplaySource  # noqa: E402
+
+    samples, truth = session(args.minutes)
+    path = os.path.join(tmp, "session.wav")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(samples.tobytes())
+    duration = len(samples) / RATE
+
+    whisper = ToneWhisper(args.latency, args.per_second, args.speed)
+    with TestClient(main.app) as client:
+        main.app.state.openai_client = OpenAIClient(client=whisper)
+        conversation = client.post("/conversations/", json={"doctor_id": "d", "patient_id": "p"}).json()
+        with client.websocket_connect(f"/conversations/{conversation['id']}/live?sample_rate={RATE}") as ws:
+            messages = []
+
+            def receive():
+                while True:
+                    message = ws.receive_json()
+                    messages.append((time.monotonic(), message))
+                    if message["type"] == "done":
+                        return
+
+            receiver = threading.Thread(target=receive)
+            receiver.start()
+
+            async def replay():
+                async for chunk in WavReplaySource(path, chunk_ms=100, speed=args.speed).chunks():
+                    ws.send_bytes(chunk)
+
+            start = time.monotonic()
+            asyncio.run(replay())
+            stopped = time.monotonic()
+            ws.send_text("stop")
+            receiver.join()
+        saved = client.get(f"/conversations/{conversation['id']}").json()["transcript"]
+
+    # How long after its audio was "recorded" each segment reached the client
+    lags = [
+        (arrival - start) * args.speed - segment["end"]
+        for arrival, message in messages if message["type"] == "segments"
+        for segment in message["segments"]
+    ]
+    final = (messages[-1][0] - stopped) * args.speed
+    upload = args.latency + args.per_second * duration
+
+    expected = [f"w{word}" for word, _, _ in truth]
+    got = saved.split()
+    dropped = duplicated = 0
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(a=expected, b=got, autojunk=False).get_opcodes():
+        dropped += (i2 - i1) if tag in ("delete", "replace") else 0
+        duplicated += (j2 - j1) if tag in ("insert", "replace") else 0
+
+    print(f"{duration / 60:.1f} min session, {len(truth)} words, {args.segment:g} s segments with "
+          f"{args.overlap:g} s overlap, replayed at {args.speed:g}x")
+    print(f"segment lag     p50 {percentile(lags, 50):5.1f} s, p95 {percentile(lags, 95):5.1f} s, "
+          f"max {max(lags):5.1f} s after the words were spoken")
+    print(f"after stop      full transcript in {final:5.1f} s (one upload after stop: {upload:5.1f} s)")
+    print(f"whisper audio   {whisper.seconds:7.1f} s in {whisper.calls} calls for {duration:.1f} s recorded "
+          f"(+{whisper.seconds / duration - 1:.0%} for overlaps)")
+    print(f"transcript      {len(got)} words, {dropped} dropped, {duplicated} duplicated or wrong")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=3)
+    parser.add_argument("--speed", type=float, default=4, help="replay speed, times real time")
+    parser.add_argument("--segment", type=float, default=10, help="segment length, seconds")
+    parser.add_argument("--overlap", type=float, default=2, help="overlap between segments, seconds")
+    parser.add_argument("--latency", type=float, default=0.8, help="fake Whisper latency per call, seconds")
+    parser.add_argument("--per-second", type=float, default=0.05, help="fake Whisper latency per second of audio")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        run(args, tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Case PDF ingestion: serial PyPDFLoader vs. CaseIndex's pooled, streaming extraction.
+
+Writes synthetic multi-page case PDFs with ReportLab. Times text extraction
+alone (serial pypdf vs. PdfExtractor, cold and cached), then full indexing
+with the offline LocalEmbeddings: the old serial loader (load every page,
+split, embed), a cold CaseIndex.sync, and a sync that re-adds the same files
+with their extracted text already cached:
+
+    python benchmarks/bench_pdf_ingest.py --files 40 --pages 30 --workers 1 2 4
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from reportlab.lib.styles import getSampleStyleSheet  # noqa: E402
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate  # noqa: E402
+
+SENTENCE = "Case {i}, page {page}: the patient reported insomnia and low mood, improving on sertraline. "
+
+
+def write_cases(cases_dir, files, pages):
+    styles = getSampleStyleSheet()
+    for i in range(files):
+        story = []
+        for page in range(pages):
+            story.append(Paragraph(SENTENCE.format(i=i, page=page) * 30, styles["BodyText"]))
+            story.append(PageBreak())
+        SimpleDocTemplate(os.path.join(cases_dir, f"case-{i}.pdf")).build(story)
+
+
+def peak_mb():
+    # Python allocations in this process since the last reset; worker processes are not included
+    if not tracemalloc.is_tracing():
+        return float("nan")
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.reset_peak()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--memory", action="store_true", help="trace peak Python memory (slows every run down)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases_dir = os.path.join(tmp, "cases")
+        os.makedirs(cases_dir)
+        write_cases(cases_dir, args.files, args.pages)
+        paths = [os.path.join(cases_dir, file) for file in sorted(os.listdir(cases_dir))]
+        pages = args.files * args.pages
+        print(f"{args.files} PDFs x {args.pages} pages")
+
+        from pypdf import PdfReader
+        from langchain.document_loaders import PyPDFLoader
+        from services.case_index import CaseIndex, file_sha256
+        from services.local_clients import LocalEmbeddings
+        from services.pdf_extractor import PdfExtractor
+
+        if args.memory:
+            tracemalloc.start()
+
+        print("text extraction only:")
+        start = time.perf_counter()
+        for path in paths:
+            "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+        elapsed = time.perf_counter() - start
+        print(f"  serial:          {pages / elapsed:7.1f} pages/s")
+        sources = [(path, file_sha256(path)) for path in paths]
+        for workers in args.workers:
+            extractor = PdfExtractor(os.path.join(tmp, f"text-{workers}"), workers=workers)
+            # Start the worker processes before timing
+            extractor.pool.submit(int).result()
+            start = time.perf_counter()
+            for _, _, texts in extractor.extract(sources):
+                for _ in texts:
+                    pass
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            for _, _, texts in extractor.extract(sources):
+                for _ in texts:
+                    pass
+            warm = time.perf_counter() - start
+            extractor.shutdown()
+            print(f"  {workers:2d} worker(s):    {pages / cold:7.1f} pages/s, text cached {pages / warm:8.1f} pages/s")
+
+        print("extract, split and embed:")
+        index = CaseIndex(LocalEmbeddings(), cases_dir=cases_dir, index_dir=os.path.join(tmp, "serial"))
+        peak_mb()
+        start = time.perf_counter()
+        for path, sha in sources:
+            # What CaseIndex._add_file did before: load every page, split, embed in one call
+            texts = index.text_splitter.split_documents(PyPDFLoader(path).load())
+            for text in texts:
+                text.metadata["sha256"] = sha
+            file = os.path.basename(path)
+            index.vector_store.add_documents(texts, ids=[f"{file}:{sha[:16]}:{i}" for i in range(len(texts))])
+        elapsed = time.perf_counter() - start
+        print(f"  serial PyPDFLoader: {elapsed:6.2f} s, peak {peak_mb():5.1f} MB")
+
+        for workers in args.workers:
+            index_dir = os.path.join(tmp, f"pooled-{workers}")
+            index = CaseIndex(LocalEmbeddings(), cases_dir=cases_dir, index_dir=index_dir)
+            index.extractor.workers = workers
+            peak_mb()
+            start = time.perf_counter()
+            index.sync()
+            cold = time.perf_counter() - start
+            cold_peak = peak_mb()
+
+            # Drop the index but keep the text cache, as when a wiped collection is rebuilt
+            index.vector_store.delete(ids=[i for entry in index._load_manifest().values() for i in entry["ids"]])
+            os.remove(index.manifest_path)
+            start = time.perf_counter()
+            index.sync()
+            warm = time.perf_counter() - start
+            shutil.rmtree(index_dir)
+            print(f"  {workers:2d} worker(s): cold {cold:6.2f} s, peak {cold_peak:5.1f} MB; text cached {warm:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Goodput of OpenAIClient's rate limiting vs. the bare SDK against a 429ing server.
+
+Starts a local fake OpenAI server that admits ``--quota`` requests per second
+and rejects the rest with 429 + Retry-After, then fires ``--requests`` chat
+calls ``--concurrency`` at a time, first through the bare SDK (its own
+retries) and then through OpenAIClient configured with ``--rpm``
+deliberately above the real quota, so the adaptive buckets have to find it:
+
+    python benchmarks/bench_rate_limit.py --quota 20 --requests 200 --rpm 3000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import openai
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from fake_openai import create_app, serve  # noqa: E402
+from services.openai_client import OpenAIClient  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Summarize the session."}]
+
+
+async def fire(call, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            try:
+                await call()
+            except Exception:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    return time.perf_counter() - start, failures
+
+
+def report(name, app, requests, elapsed, failures):
+    quota = app.state.quota
+    print(f"{name:12s} {requests - failures:4d}/{requests} succeeded in {elapsed:6.2f}s "
+          f"({(requests - failures) / elapsed:6.1f} req/s), {quota.rejected:5d} 429s from the server")
+
+
+async def run(args):
+    for name in ("bare SDK", "OpenAIClient"):
+        app = create_app(quota_rps=args.quota, latency=args.latency)
+        base_url = serve(app)
+        sdk = openai.AsyncOpenAI(api_key="local", base_url=base_url, max_retries=0 if name == "OpenAIClient" else 2)
+        if name == "bare SDK":
+            call = lambda: sdk.chat.completions.create(model="gpt-4", messages=MESSAGES)  # noqa: E731
+        else:
+            client = OpenAIClient(client=sdk, max_concurrency=args.concurrency, rpm=args.rpm, tpm=0,
+                                  max_retries=8, backoff_base=0.1, backoff_max=5)
+            call = lambda: client.chat(MESSAGES)  # noqa: E731
+        elapsed, failures = await fire(call, args.requests, args.concurrency)
+        report(name, app, args.requests, elapsed, failures)
+    print(f"quota ceiling: {args.quota:.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quota", type=float, default=20, help="requests per second the fake server admits")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rpm", type=float, default=3000, help="OpenAIClient's configured RPM ceiling")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake server latency per request, seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
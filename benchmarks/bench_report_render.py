@@ -0,0 +1,65 @@
+"""Throughput of session PDF rendering in-process vs. across a process pool.
+
+Renders synthetic sessions with Version3's ReportRenderer into a throwaway
+cache directory, then repeats the first batch to show cache hits:
+
+    python benchmarks/bench_report_render.py --reports 64 --workers 1 2 4 8
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Version3"))
+
+from report_renderer import ReportRenderer, build_report  # noqa: E402
+
+TRANSCRIPT = "\n".join(["Doctor: How have you been sleeping? Patient: Poorly, I wake up at 3am most nights."] * 200)
+SUMMARY = "\n".join(["- Insomnia with early waking", "- Possible generalized anxiety disorder"] * 20)
+
+
+def sessions(count, offset=0):
+    return [
+        (f"Doctor: Lee; Patient: P{i}; Date: 2024-01-01", TRANSCRIPT, SUMMARY, i)
+        for i in range(offset, offset + count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for session in sessions(args.reports):
+        build_report(BytesIO(), *session)
+    elapsed = time.perf_counter() - start
+    print(f"in-process, serial:   {args.reports / elapsed:7.1f} reports/s")
+
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            renderer = ReportRenderer(cache_dir=tmp, workers=workers)
+            # Start the worker processes before timing
+            renderer.pool.submit(int).result()
+
+            batch = sessions(args.reports, offset=workers * args.reports)
+            start = time.perf_counter()
+            futures = [renderer.submit(*session) for session in batch]
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for session in batch:
+                renderer.render(*session)
+            cached = time.perf_counter() - start
+            renderer.shutdown()
+        print(f"{workers:2d} worker process(es): {args.reports / elapsed:7.1f} reports/s, "
+              f"cached repeat {args.reports / cached:9.1f} reports/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Context tokens and retrieval time per report: per-call RetrievalQA retrieval vs. CaseRetriever.
+
+Indexes synthetic case notes with the offline LocalEmbeddings. Each case
+dwells on a few symptoms for several paragraphs, so relevant text spans
+neighbouring chunks the way real notes do. It then retrieves context for a
+mix of new, repeated and lightly edited summaries, first the way
+ReportService used to (``as_retriever()`` queried with the whole prompt) and
+then through CaseRetriever (MMR, overlap merging, token budget, embedding
+cache):
+
+    python benchmarks/bench_report_retrieval.py --cases 100 --summaries 40 --embed-latency 0.05
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+SYMPTOMS = ["insomnia", "panic attacks", "low mood", "racing thoughts", "fatigue", "irritability", "poor appetite",
+            "intrusive memories", "social withdrawal", "headaches", "palpitations", "nightmares"]
+TREATMENTS = ["CBT", "sertraline", "sleep hygiene", "exposure therapy", "mindfulness", "bupropion", "EMDR", "lithium"]
+PROMPT = ("Based on the following conversation summary and similar medical cases, generate a comprehensive "
+          "medical report.\n\nConversation Summary:\n{summary}")
+
+
+def case_text(rng: random.Random, i: int) -> str:
+    paragraphs = []
+    for symptom in rng.sample(SYMPTOMS, 3):
+        paragraphs.append(" ".join(
+            f"Case {i}: the {symptom} was discussed again, with {rng.choice(TREATMENTS)} tried for {rng.randint(2, 12)} weeks."
+            for _ in range(15)
+        ))
+    return "\n\n".join(paragraphs)
+
+
+def summary_text(rng: random.Random) -> str:
+    first, second = rng.sample(SYMPTOMS, 2)
+    return f"Patient presents with {first} and {second}. Previously tried {rng.choice(TREATMENTS)}."
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CASES_DIR"] = os.path.join(tmp, "cases")
+        os.environ["INDEX_DIR"] = os.path.join(tmp, "index")
+        os.environ.pop("CHROMA_HOST", None)
+
+        from services.case_index import CaseIndex
+        from services.case_retriever import CaseRetriever
+        from services.local_clients import LocalEmbeddings
+        from services.summarizer import count_tokens
+
+        rng = random.Random(7)
+        case_index = CaseIndex(LocalEmbeddings())
+        texts, metadatas = [], []
+        for i in range(args.cases):
+            for chunk in case_index.text_splitter.split_text(case_text(rng, i)):
+                texts.append(chunk)
+                metadatas.append({"source": f"case-{i}.pdf"})
+        case_index.vector_store.add_texts(texts, metadatas=metadatas)
+        # Queries pay an embeddings API round trip from here on
+        embeddings = case_index.vector_store._embedding_function
+        embeddings.latency = args.embed_latency
+
+        # Half new summaries, a quarter repeats, a quarter repeats with a small edit
+        summaries = [summary_text(rng) for _ in range(args.summaries // 2)]
+        summaries += [rng.choice(summaries) for _ in range(args.summaries // 4)]
+        summaries += [rng.choice(summaries) + " Sleeping a little better." for _ in range(args.summaries - len(summaries))]
+        rng.shuffle(summaries)
+
+        retriever = case_index.vector_store.as_retriever()
+        before_tokens = 0
+        start = time.perf_counter()
+        for summary in summaries:
+            documents = await retriever.aget_relevant_documents(PROMPT.format(summary=summary))
+            before_tokens += sum(count_tokens(document.page_content) for document in documents)
+        before_time = time.perf_counter() - start
+
+        case_retriever = CaseRetriever(case_index, embeddings, cache_similarity=args.cache_similarity)
+        after_tokens = 0
+        start = time.perf_counter()
+        for summary in summaries:
+            documents = await case_retriever.retrieve(summary)
+            after_tokens += sum(count_tokens(document.page_content) for document in documents)
+        after_time = time.perf_counter() - start
+
+    n = len(summaries)
+    print(f"{len(texts)} chunks indexed, {n} summaries ({len(set(summaries))} distinct)")
+    print(f"as_retriever():  {before_tokens / n:7.1f} context tokens/report, {before_time / n * 1000:6.2f} ms retrieval/report")
+    print(f"CaseRetriever:   {after_tokens / n:7.1f} context tokens/report, {after_time / n * 1000:6.2f} ms retrieval/report")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=100)
+    parser.add_argument("--summaries", type=int, default=40)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embeddings API latency per call, seconds")
+    parser.add_argument("--cache-similarity", type=float, default=None,
+                        help="cosine similarity at which queries share cached results (default: RETRIEVAL_CACHE_SIMILARITY)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
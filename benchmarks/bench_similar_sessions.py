@@ -0,0 +1,101 @@
+"""Similar-session lookup: VectorIndex (IVF over memory-mapped vectors) vs. an exact scan.
+
+Fills an index with synthetic summary embeddings (sessions scattered around a
+few hundred topics), timing bulk loading and single inserts, then measures
+query latency and recall@k against exact brute-force search, before and
+after reopening the index from disk:
+
+    python benchmarks/bench_similar_sessions.py --sessions 100000 --dim 256 --nprobe 8 16 32
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.vector_index import VectorIndex  # noqa: E402
+
+
+def embeddings(count, dim, topics, spread, seed=11):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, topics, count)] + spread * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def measure(index, vectors, queries, k):
+    latencies, hits = [], 0
+    for i in queries:
+        start = time.perf_counter()
+        found = index.search(vectors[i], k, exclude=[i])
+        latencies.append(time.perf_counter() - start)
+        scores = vectors @ vectors[i]
+        scores[i] = -np.inf
+        exact = set(np.argpartition(-scores, k)[:k].tolist())
+        hits += len(exact & {item_id for item_id, _ in found})
+    return latencies, hits / (len(queries) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--topics", type=int, default=300)
+    parser.add_argument("--spread", type=float, default=1.0, help="noise around each topic; higher is harder")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    args = parser.parse_args()
+
+    vectors = embeddings(args.sessions, args.dim, args.topics, args.spread)
+    queries = np.random.default_rng(5).choice(args.sessions, args.queries, replace=False)
+    bulk = args.sessions - 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex(tmp)
+        start = time.perf_counter()
+        for offset in range(0, bulk, 5000):
+            stop = min(bulk, offset + 5000)
+            index.add_many(range(offset, stop), vectors[offset:stop])
+        loaded = time.perf_counter() - start
+        inserts = []
+        for i in range(bulk, args.sessions):
+            start = time.perf_counter()
+            index.add(i, vectors[i])
+            inserts.append(time.perf_counter() - start)
+        print(f"{args.sessions} sessions, dim {args.dim}: bulk load {loaded:.1f} s, "
+              f"single insert p50 {percentile_ms(inserts, 50):.2f} ms, p99 {percentile_ms(inserts, 99):.2f} ms")
+
+        start = time.perf_counter()
+        for i in queries:
+            scores = vectors @ vectors[i]
+            np.argpartition(-scores, args.k)[:args.k]
+        exact = (time.perf_counter() - start) / len(queries)
+        print(f"exact scan (in memory):  {exact * 1000:6.2f} ms/query")
+
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            latencies, recall = measure(index, vectors, queries, args.k)
+            print(f"nprobe {nprobe:3d}: p50 {percentile_ms(latencies, 50):6.2f} ms, "
+                  f"p99 {percentile_ms(latencies, 99):6.2f} ms, recall@{args.k} {recall:.3f}")
+        index.close()
+
+        start = time.perf_counter()
+        reopened = VectorIndex(tmp, nprobe=args.nprobe[0])
+        opened = time.perf_counter() - start
+        latencies, recall = measure(reopened, vectors, queries, args.k)
+        print(f"reopened from disk in {opened * 1000:.0f} ms: p50 {percentile_ms(latencies, 50):6.2f} ms, "
+              f"recall@{args.k} {recall:.3f}")
+        reopened.close()
+
+
+if __name__ == "__main__":
+    main()
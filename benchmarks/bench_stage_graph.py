@@ -0,0 +1,225 @@
+"""End-to-end latency of a recorded session: stages one after another vs. the stage graph.
+
+Runs the backend's real stage functions through JobService against the
+LocalOpenAI and LocalEmbeddings stand-ins, with case notes already indexed.
+Transcription is stubbed with a fixed ``--transcribe`` delay since decoding
+needs ffmpeg. Sessions are processed one at a time, three ways:
+
+* sequential: transcribe -> summarize -> index summary -> report, as before
+* graph: the same stages as a graph, the summary indexed beside the report
+* speculative: the graph with REPORT_SPECULATION, case context retrieved
+  from the transcript while the summary is written
+
+Each job reports its critical path; the benchmark prints end-to-end and
+critical-path percentiles and how often the guessed context was kept
+(``--min-overlap`` sets SPECULATION_MIN_OVERLAP). It then times Version3's
+new-session graph with every stage stubbed by a delay:
+
+    python benchmarks/bench_stage_graph.py --sessions 10 --embed-latency 0.3
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import Future
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+SYMPTOMS = ["insomnia", "panic attacks", "low mood", "racing thoughts", "fatigue", "irritability", "poor appetite",
+            "intrusive memories", "social withdrawal", "headaches", "palpitations", "nightmares"]
+TREATMENTS = ["CBT", "sertraline", "sleep hygiene", "exposure therapy", "mindfulness", "bupropion", "EMDR", "lithium"]
+
+
+def case_text(rng: random.Random, i: int) -> str:
+    return "\n\n".join(
+        " ".join(f"Case {i}: the {symptom} was discussed again, with {rng.choice(TREATMENTS)} tried for "
+                 f"{rng.randint(2, 12)} weeks." for _ in range(15))
+        for symptom in rng.sample(SYMPTOMS, 3)
+    )
+
+
+def transcript_text(rng: random.Random, i: int) -> str:
+    symptoms = rng.sample(SYMPTOMS, 2)
+    lines = [f"Session {i}. Patient describes {rng.choice(symptoms)} most days since {rng.choice(TREATMENTS)} "
+             f"was stopped {rng.randint(1, 9)} weeks ago." for _ in range(60)]
+    return " ".join(lines)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+async def backend(args, tmp):
+    import main
+    from services.audio_service import AudioService
+    from services.conversation_store import ConversationStore
+    from services.job_service import JobService
+    from services.llm_cache import LLMCache
+    from services.local_clients import LocalOpenAI
+    from services.metrics import SPECULATION
+    from services.openai_client import OpenAIClient
+    from services.warmup import WarmUp
+    from services import report_service as report_module
+
+    report_module.SPECULATION_MIN_OVERLAP = args.min_overlap
+    state = main.app.state
+    state.openai_client = OpenAIClient(client=LocalOpenAI(chat_latency=args.first_token, token_latency=args.per_token))
+    state.conversation_store = ConversationStore()
+    state.llm_cache = LLMCache()
+    state.audio_service = AudioService(state.openai_client, llm_cache=state.llm_cache)
+    transcripts = {}
+
+    async def process_audio(audio_path):
+        # Whisper (and the ffmpeg decode before it) stubbed with a fixed delay
+        await asyncio.sleep(args.transcribe)
+        return transcripts[audio_path]
+
+    state.audio_service.process_audio = process_audio
+    state.warmup = WarmUp(main.WARM_UP_STEPS)
+    await main.warm_up(main.app, state.warmup)
+
+    rng = random.Random(7)
+    service = state.report_service
+    texts, metadatas = [], []
+    for i in range(args.cases):
+        for chunk in service.case_index.text_splitter.split_text(case_text(rng, i)):
+            texts.append(chunk)
+            metadatas.append({"source": f"case-{i}.pdf"})
+    service.case_index.vector_store.add_texts(texts, metadatas=metadatas)
+    service.vector_store = service.case_index.vector_store
+    # Queries pay an embeddings API round trip from here on
+    service.embeddings.model.latency = args.embed_latency
+
+    modes = {
+        "sequential": [
+            ("transcribe", main.transcribe_stage),
+            ("summarize", main.summarize_stage),
+            ("index_summary", main.index_summary_stage),
+            ("report", main.report_stage),
+        ],
+        "graph": main.record_stages(False),
+        "speculative": main.record_stages(True),
+    }
+
+    print(f"backend: {args.sessions} sessions per mode, transcribe {args.transcribe:g} s, first token "
+          f"{args.first_token:g} s + {args.per_token:g} s/token, embeddings {args.embed_latency:g} s/call")
+    for index, (mode, stages) in enumerate(modes.items()):
+        jobs = JobService(stages, db_path=os.path.join(tmp, f"jobs-{mode}.db"), workers=1)
+        await jobs.start()
+        hits = SPECULATION.value(stage="report", outcome="hit")
+        misses = SPECULATION.value(stage="report", outcome="miss")
+        totals, paths = [], []
+        for i in range(args.sessions):
+            conversation = state.conversation_store.create("doctor", "patient")
+            # A different seed per mode, so no mode is served from another's embedding cache
+            audio_path = f"session-{mode}-{i}.wav"
+            transcripts[audio_path] = transcript_text(random.Random(index * 1000 + i), i)
+            start = time.perf_counter()
+            job = jobs.enqueue(str(conversation["id"]), {
+                "conversation_id": str(conversation["id"]),
+                "audio_path": audio_path,
+                "bypass_cache": True
+            })
+            async for job in jobs.watch(job["id"]):
+                pass
+            totals.append(time.perf_counter() - start)
+            if job["status"] != "succeeded":
+                raise RuntimeError(f"{mode} job failed: {job['error']}")
+            paths.append(job["critical_path"])
+        await jobs.stop()
+        critical = [path["seconds"] for path in paths]
+        stage_sum = [path["sequential_seconds"] for path in paths]
+        print(f"  {mode:<11} end to end p50 {percentile(totals, 50):6.2f} s, p95 {percentile(totals, 95):6.2f} s; "
+              f"critical path p50 {percentile(critical, 50):6.2f} s of {percentile(stage_sum, 50):6.2f} s of stages "
+              f"({' -> '.join(paths[-1]['stages'])})")
+        if mode == "speculative":
+            hit = SPECULATION.value(stage="report", outcome="hit") - hits
+            miss = SPECULATION.value(stage="report", outcome="miss") - misses
+            print(f"  {'':<11} guessed context kept for {hit:.0f} of {hit + miss:.0f} reports "
+                  f"(min overlap {args.min_overlap:g})")
+    await state.openai_client.aclose()
+    service.close()
+    state.similar_sessions.close()
+
+
+def version3(args, tmp):
+    sys.path.insert(0, os.path.join(ROOT, "Version3"))
+    import app
+
+    def delay(seconds, value=None):
+        time.sleep(seconds)
+        return value
+
+    def summarize(transcript, info):
+        for i in range(10):
+            yield delay(args.v3_summary / 10, f"summary part {i}")
+
+    app.transcribe_audio = lambda audio_path, file_upload: delay(args.transcribe, "transcript")
+    app.summarize_and_extract_stream = summarize
+    app.index_session = lambda session_id, summary: delay(args.v3_index, True)
+    app.db = app.HistoryDB(os.path.join(tmp, "history.db"))
+    class Renderer:
+        # The transcript pages take --v3-skeleton of the --v3-pdf seconds; a skeleton leaves the rest
+        def skeleton_path(self, session_id):
+            return os.path.join(tmp, f"skeleton-{session_id}.pdf")
+
+        def submit_skeleton(self, info, transcript, session_id):
+            future = Future()
+            future.set_result(delay(args.v3_skeleton, self.skeleton_path(session_id)))
+            return future
+
+        def render(self, info, transcript, summary, session_id, knowledge=(), skeleton=None):
+            return delay(args.v3_pdf - (args.v3_skeleton if skeleton else 0), "report.pdf")
+
+    renderer = Renderer()
+    app.get_report_renderer = lambda: renderer
+
+    sequential = args.transcribe + args.v3_summary + args.v3_index + args.v3_pdf
+    walls = []
+    for i in range(args.v3_sessions):
+        start = time.perf_counter()
+        app.run_new_session("doctor", "patient", "2024-01-01", "session.wav", None, "")
+        walls.append(time.perf_counter() - start)
+    print(f"Version3: stages of {args.transcribe:g} + {args.v3_summary:g} + {args.v3_index:g} (index) + "
+          f"{args.v3_pdf:g} (PDF, {args.v3_skeleton:g} of it transcript pages) s, {sequential:.2f} s one after another")
+    print(f"  graph       p50 {percentile(walls, 50):6.2f} s per session")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10, help="sessions per mode")
+    parser.add_argument("--cases", type=int, default=60, help="case notes in the index")
+    parser.add_argument("--transcribe", type=float, default=1.0, help="stubbed transcription time, seconds")
+    parser.add_argument("--first-token", type=float, default=0.8, help="fake model latency to first token, seconds")
+    parser.add_argument("--per-token", type=float, default=0.02, help="fake model latency per further token, seconds")
+    parser.add_argument("--embed-latency", type=float, default=0.3, help="fake embeddings latency per call, seconds")
+    parser.add_argument("--min-overlap", type=float, default=1.0,
+                        help="share of case chunks the guessed context must share to be kept")
+    parser.add_argument("--v3-sessions", type=int, default=3)
+    parser.add_argument("--v3-summary", type=float, default=2.0, help="Version3 summary time, seconds")
+    parser.add_argument("--v3-index", type=float, default=0.4, help="Version3 summary embedding time, seconds")
+    parser.add_argument("--v3-pdf", type=float, default=0.6, help="Version3 PDF render time, seconds")
+    parser.add_argument("--v3-skeleton", type=float, default=0.5,
+                        help="part of the PDF render spent on the transcript pages, seconds")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, value in (("CASES_DIR", "cases"), ("INDEX_DIR", "index"),
+                            ("CONVERSATIONS_DB_PATH", "conversations.db"),
+                            ("EMBEDDING_CACHE_PATH", "embedding_cache.db"), ("LLM_CACHE_PATH", "llm_cache.db"),
+                            ("SESSION_INDEX_DIR", "session_index"), ("TRANSLATIONS_DIR", "translations")):
+            os.environ[name] = os.path.join(tmp, value)
+        os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+        os.environ["EMBEDDINGS_BACKEND"] = "local"
+        os.makedirs(os.environ["CASES_DIR"])
+        asyncio.run(backend(args, tmp))
+        version3(args, tmp)
+
+
+if __name__ == "__main__":
+    main()
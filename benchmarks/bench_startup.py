@@ -0,0 +1,110 @@
+"""Cold start: import time, time until the backend serves, and time until it is ready.
+
+Every measurement runs in a fresh interpreter with empty data directories, the
+offline embedding stand-in and a small generated case corpus:
+
+- backend import: ``import main``
+- backend serving: lifespan startup finished, first /health answered
+- backend ready: /ready returns 200 (trees without /ready: serving)
+- first request: GET /conversations/ right after startup
+- Version3 import: ``import app`` (needs gradio for trees that import it eagerly)
+
+``--tree`` points at another checkout, e.g. one made with ``git worktree add``,
+to compare against an earlier revision:
+
+    python benchmarks/bench_startup.py --runs 5 --cases 20
+    python benchmarks/bench_startup.py --runs 5 --cases 20 --tree /tmp/baseline
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+BACKEND_PROBE = r"""
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, os.path.join(sys.argv[1], "backend"))
+import main
+imported = time.perf_counter() - start
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    serving = time.perf_counter() - start
+    client.get("/health")
+    request_start = time.perf_counter()
+    client.get("/conversations/")
+    first_request = time.perf_counter() - request_start
+    ready = serving
+    if client.get("/ready").status_code != 404:
+        while client.get("/ready").status_code != 200:
+            time.sleep(0.02)
+        ready = time.perf_counter() - start
+print(json.dumps({"backend import": imported, "backend serving": serving, "backend ready": ready,
+                  "first request": first_request}))
+"""
+
+VERSION3_PROBE = r"""
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, os.path.join(sys.argv[1], "Version3"))
+import app
+print(json.dumps({"Version3 import": time.perf_counter() - start}))
+"""
+
+
+def make_cases(directory, count):
+    from reportlab.pdfgen import canvas
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        pdf = canvas.Canvas(os.path.join(directory, f"case-{i}.pdf"))
+        for page in range(3):
+            pdf.drawString(72, 720, f"Case {i}, page {page}: the patient reported insomnia and low mood.")
+            pdf.showPage()
+        pdf.save()
+
+
+def probe(script, tree, cases, env_overrides):
+    with tempfile.TemporaryDirectory() as tmp:
+        cases_dir = os.path.join(tmp, "cases")
+        make_cases(cases_dir, cases)
+        env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-bench"), EMBEDDINGS_BACKEND="local",
+                   CASES_DIR=cases_dir, INDEX_DIR=os.path.join(tmp, "index"),
+                   CONVERSATIONS_DB_PATH=os.path.join(tmp, "conversations.db"),
+                   EMBEDDING_CACHE_PATH=os.path.join(tmp, "embedding_cache.db"),
+                   JOBS_DB_PATH=os.path.join(tmp, "jobs.db"), LLM_CACHE_PATH=os.path.join(tmp, "llm_cache.db"),
+                   SESSION_INDEX_DIR=os.path.join(tmp, "session_index"), **env_overrides)
+        result = subprocess.run([sys.executable, "-c", script, os.path.abspath(tree)], cwd=tmp, env=env,
+                                capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1]
+    return json.loads(result.stdout.strip().splitlines()[-1]), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--cases", type=int, default=20, help="case PDFs in the corpus to index")
+    parser.add_argument("--tree", default=ROOT, help="checkout to measure (default: this one)")
+    args = parser.parse_args()
+
+    samples = {}
+    for name, script in (("backend", BACKEND_PROBE), ("Version3", VERSION3_PROBE)):
+        for _ in range(args.runs):
+            result, error = probe(script, args.tree, args.cases, {})
+            if result is None:
+                print(f"{name}: failed: {error}")
+                break
+            for metric, value in result.items():
+                samples.setdefault(metric, []).append(value)
+
+    print(f"{args.runs} cold starts, {args.cases} case PDFs, tree {os.path.abspath(args.tree)}")
+    for metric, values in samples.items():
+        print(f"{metric:16s} median {statistics.median(values) * 1000:7.0f} ms, max {max(values) * 1000:7.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Time-to-first-token of streamed summaries vs. waiting for the full completion.
+
+Runs AudioService against the LocalOpenAI stand-in, so no network or API key
+is needed:
+
+    python benchmarks/bench_summary_ttft.py --first-token 0.5 --per-token 0.02
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.audio_service import AudioService  # noqa: E402
+from services.llm_cache import LLMCache  # noqa: E402
+from services.local_clients import LocalOpenAI  # noqa: E402
+from services.openai_client import OpenAIClient  # noqa: E402
+
+TRANSCRIPT = " ".join(["Patient reports poor sleep and racing thoughts before work."] * 40)
+
+
+async def run(first_token: float, per_token: float, runs: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        client = OpenAIClient(client=LocalOpenAI(chat_latency=first_token, token_latency=per_token))
+        service = AudioService(client, llm_cache=LLMCache(os.path.join(tmp, "cache.db")))
+
+        blocking = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            await service.generate_summary(TRANSCRIPT, bypass_cache=True)
+            blocking.append(time.perf_counter() - start)
+
+        first_tokens = []
+        totals = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            first = None
+            async for _ in service.stream_summary(TRANSCRIPT, bypass_cache=True):
+                if first is None:
+                    first = time.perf_counter() - start
+            first_tokens.append(first)
+            totals.append(time.perf_counter() - start)
+
+    print(f"blocking summary:      {sum(blocking) / runs * 1000:8.1f} ms until anything is shown")
+    print(f"streamed first token:  {sum(first_tokens) / runs * 1000:8.1f} ms")
+    print(f"streamed full summary: {sum(totals) / runs * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--first-token", type=float, default=0.5, help="fake model latency to first token, seconds")
+    parser.add_argument("--per-token", type=float, default=0.02, help="fake model latency per further token, seconds")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.first_token, args.per_token, args.runs))
+
+
+if __name__ == "__main__":
+    main()
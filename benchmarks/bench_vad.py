@@ -0,0 +1,124 @@
+"""Silence trimming before transcription: seconds of audio sent to Whisper, with and without VAD.
+
+Synthesizes a therapy-style session (bursts of syllable-modulated noise
+separated by pauses of up to several seconds, over a faint noise floor) and
+runs both preprocessing paths on it:
+
+- backend: the 16 kHz WAV that ffmpeg would produce, through
+  detect_speech_ranges and vad.trim_silence
+- Version3: the 44.1 kHz float32 WAV that utils.record_audio writes, through
+  vad.trim_silence (the ffmpeg decode to 16 kHz included, so ffmpeg must be on PATH)
+
+For each it reports the seconds saved, the share of true speech kept, and
+how far utterance onsets found in the trimmed audio land from the true ones
+once mapped back through the offset map (as Whisper's timestamps would be):
+
+    python benchmarks/bench_vad.py --minutes 30 --pause-max 8
+"""
+import os
+import sys
+import time
+import wave
+import argparse
+import importlib.util
+import tempfile
+
+import numpy as np
+import scipy.io.wavfile as wav
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from services.audio_service import detect_speech_ranges  # noqa: E402
+from services import vad as backend_vad  # noqa: E402
+
+# Whisper is billed per minute of uploaded audio
+WHISPER_USD_PER_MINUTE = 0.006
+
+
+def load_version3_vad():
+    # Version3 modules import each other by bare name (metrics, ...)
+    sys.path.insert(0, os.path.join(ROOT, "Version3"))
+    spec = importlib.util.spec_from_file_location("version3_vad", os.path.join(ROOT, "Version3", "vad.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def session(minutes, rate, pause_max, seed=7):
+    """Samples plus the true (start ms, end ms) of every utterance."""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * rate)
+    samples = rng.standard_normal(total).astype(np.float32) * 0.001
+    utterances = []
+    position = int(rng.uniform(0.5, 2) * rate)
+    while True:
+        length = int(rng.uniform(1, 12) * rate)
+        if position + length >= total:
+            break
+        t = np.arange(length) / rate
+        syllables = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3, 5) * t)
+        samples[position:position + length] += rng.standard_normal(length).astype(np.float32) * 0.1 * syllables
+        utterances.append((position * 1000 // rate, (position + length) * 1000 // rate))
+        position += length + int(rng.uniform(0.2, pause_max) * rate)
+    return samples, utterances
+
+
+def speech_kept(utterances, offsets):
+    kept = 0
+    for start, end in utterances:
+        for _, original_start, length in offsets.pieces:
+            kept += max(0, min(end, original_start + length) - max(start, original_start))
+    return kept / sum(end - start for start, end in utterances)
+
+
+def onset_error_ms(utterances, offsets, detected):
+    truth = np.array([start for start, _ in utterances])
+    errors = [np.abs(truth - offsets.to_original(start)).min() for start, _ in detected]
+    return float(np.percentile(errors, 50)), float(np.max(errors))
+
+
+def report(name, offsets, elapsed, utterances, detected):
+    median, worst = onset_error_ms(utterances, offsets, detected)
+    original, trimmed = offsets.original_ms / 60000, offsets.trimmed_ms / 60000
+    print(f"{name:9s} {original:6.1f} min -> {trimmed:6.1f} min, saved {offsets.saved_seconds:7.1f} s "
+          f"({offsets.saved_seconds / (offsets.original_ms / 1000):.0%}), ${original * WHISPER_USD_PER_MINUTE:.3f} -> "
+          f"${trimmed * WHISPER_USD_PER_MINUTE:.3f}; speech kept {speech_kept(utterances, offsets):.1%}, "
+          f"onset error p50 {median:.0f} ms, max {worst:.0f} ms; {elapsed * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--pause-max", type=float, default=8, help="longest pause between utterances, seconds")
+    parser.add_argument("--keep-silence-ms", type=int, default=400)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        samples, utterances = session(args.minutes, 16000, args.pause_max)
+        src, dest = os.path.join(tmp, "decoded.wav"), os.path.join(tmp, "trimmed.wav")
+        with wave.open(src, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(16000)
+            out.writeframes((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+        start = time.perf_counter()
+        speech, total_ms = detect_speech_ranges(src)
+        offsets = backend_vad.trim_silence(src, dest, speech, total_ms, args.keep_silence_ms)
+        elapsed = time.perf_counter() - start
+        report("backend", offsets, elapsed, utterances, detect_speech_ranges(dest)[0])
+
+        version3_vad = load_version3_vad()
+        samples, utterances = session(args.minutes, 44100, args.pause_max)
+        recording = os.path.join(tmp, "recording.wav")
+        wav.write(recording, 44100, samples)
+        start = time.perf_counter()
+        trimmed_path, offsets = version3_vad.trim_silence(recording, args.keep_silence_ms)
+        elapsed = time.perf_counter() - start
+        trimmed, rate = version3_vad.load_audio(trimmed_path)
+        report("Version3", offsets, elapsed, utterances, version3_vad.detect_speech(trimmed, rate))
+        os.remove(trimmed_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""A local stand-in for the OpenAI HTTP API: chat, Whisper and embeddings.
+
+Every request waits ``latency`` (a network round trip) plus a cost per unit
+of work: ``chat_latency`` to the first token and ``token_latency`` per
+further token, ``audio_latency`` per second of uploaded audio. A share
+``error_rate`` of requests is answered with a 500 and, when ``quota_rps``
+is set, requests beyond it get a 429 with a Retry-After header, the way the
+real API answers once a rate limit is hit. Responses are deterministic, so
+runs can be compared. Point an SDK client at ``serve(...)``'s base URL, or
+run the server on its own and set ``OPENAI_BASE_URL`` for an app:
+
+    python benchmarks/fake_openai.py --port 8100 --latency 0.1 --error-rate 0.02
+"""
+import io
+import re
+import json
+import time
+import wave
+import base64
+import random
+import socket
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+WORDS = ("patient reports poor sleep and racing thoughts before work, low mood most days since the move, "
+         "appetite is down, no thoughts of self harm, tried sleep hygiene and mindfulness with little change").split()
+
+
+class Quota:
+    """Server-side token bucket: ``rps`` requests per second, bursts of up to one second's worth."""
+
+    def __init__(self, rps: float):
+        self.rps = rps
+        self.tokens = rps
+        self.updated = time.monotonic()
+        self.accepted = 0
+        self.rejected = 0
+
+    def take(self) -> float:
+        """Return 0 if the request is admitted, else the seconds until it would be."""
+        now = time.monotonic()
+        self.tokens = min(self.rps, self.tokens + (now - self.updated) * self.rps)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.accepted += 1
+            return 0
+        self.rejected += 1
+        return (1 - self.tokens) / self.rps
+
+
+def embed(item, dimensions: int) -> np.ndarray:
+    """Hashed bag of words (or of token ids): texts sharing words get similar vectors."""
+    tokens = re.findall(r"\w+", item.lower()) if isinstance(item, str) else [str(token) for token in item]
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in tokens:
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        vector[int.from_bytes(digest[:4], "little") % dimensions] += 1 if digest[4] & 1 else -1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def audio_seconds(data: bytes) -> float:
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError):
+        # Compressed audio: assume 32 kB per second
+        return len(data) / 32000
+
+
+def spoken_text(seconds: float, seed: bytes) -> str:
+    # About 2.5 words per second of audio, picked by the audio's hash so a file always reads the same
+    rng = random.Random(hashlib.sha256(seed).digest())
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, int(seconds * 2.5))))
+
+
+def create_app(quota_rps: Optional[float] = 10, latency: float = 0.05, error_rate: float = 0.0,
+               chat_latency: float = 0.0, token_latency: float = 0.0, audio_latency: float = 0.0,
+               completion_tokens: int = 80, dimensions: int = 256, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.quota = Quota(quota_rps) if quota_rps else None
+    # Requests and injected failures per endpoint, served at /stats
+    app.state.requests = Counter()
+    app.state.errors = Counter()
+    rng = random.Random(seed)
+
+    @app.middleware("http")
+    async def inject_failures(request: Request, call_next):
+        if not request.url.path.startswith("/v1/"):
+            return await call_next(request)
+        endpoint = request.url.path[len("/v1/"):]
+        app.state.requests[endpoint] += 1
+        wait = app.state.quota.take() if app.state.quota else 0
+        if wait:
+            app.state.errors[endpoint] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after-ms": str(int(wait * 1000) + 1)},
+                content={"error": {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}}
+            )
+        await asyncio.sleep(latency)
+        if rng.random() < error_rate:
+            app.state.errors[endpoint] += 1
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "The server had an error while processing your request", "type": "server_error"}}
+            )
+        return await call_next(request)
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": dict(app.state.requests), "errors": dict(app.state.errors)}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-4")
+        prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+        words = re.findall(r"\w+", prompt)
+        # A summary-like answer: bounded in length, drawn from the prompt, naming a possible diagnosis
+        tokens = (f"Summary of {len(words)} words:".split() + words[-completion_tokens:])[:completion_tokens - 4]
+        content = " ".join(tokens) + "\nPossible diagnosis: insomnia."
+        usage = {"prompt_tokens": len(words), "completion_tokens": completion_tokens,
+                 "total_tokens": len(words) + completion_tokens}
+        if body.get("stream"):
+            async def chunks():
+                await asyncio.sleep(chat_latency)
+                for i, token in enumerate(content.split(" ")):
+                    if i:
+                        await asyncio.sleep(token_latency)
+                    delta = {"content": token if i == 0 else " " + token}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    yield "data: " + json.dumps({
+                        "id": "chatcmpl-local", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+                    }) + "\n\n"
+                yield "data: " + json.dumps({
+                    "id": "chatcmpl-local", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                }) + "\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+        await asyncio.sleep(chat_latency + token_latency * (completion_tokens - 1))
+        return {
+            "id": "chatcmpl-local",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        form = await request.form()
+        upload = form.get("file")
+        data = await upload.read() if upload is not None and hasattr(upload, "read") else b""
+        seconds = audio_seconds(data)
+        await asyncio.sleep(audio_latency * seconds)
+        text = spoken_text(seconds, data)
+        response_format = form.get("response_format", "json")
+        if response_format == "text":
+            return PlainTextResponse(text)
+        if response_format == "verbose_json":
+            words = text.split()
+            # One segment per ten words, spread evenly over the audio
+            per_segment = 10 * seconds / len(words)
+            segments = [
+                {"id": i, "start": round(i * per_segment, 2), "end": round(min((i + 1) * per_segment, seconds), 2),
+                 "text": " " + " ".join(words[i * 10:(i + 1) * 10])}
+                for i in range((len(words) + 9) // 10)
+            ]
+            return {"task": "transcribe", "language": "english", "duration": seconds, "text": text, "segments": segments}
+        return {"text": text}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        items = body["input"]
+        # A string, a list of strings, one list of token ids or a list of them
+        if isinstance(items, str) or (items and isinstance(items[0], int)):
+            items = [items]
+        data = []
+        for i, item in enumerate(items):
+            vector = embed(item, dimensions)
+            encoded = base64.b64encode(vector.tobytes()).decode() if body.get("encoding_format") == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": encoded})
+        tokens = sum(len(item.split()) if isinstance(item, str) else len(item) for item in items)
+        return {"object": "list", "data": data, "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(app: FastAPI) -> str:
+    """Run the app on a free local port in a daemon thread and return its base URL."""
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--quota", type=float, default=0, help="requests per second before 429s; 0 for none")
+    parser.add_argument("--latency", type=float, default=0.05, help="round trip per request, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="time to the first chat token, seconds")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="time per further chat token, seconds")
+    parser.add_argument("--audio-latency", type=float, default=0.02, help="Whisper time per second of audio")
+    parser.add_argument("--completion-tokens", type=int, default=80)
+    parser.add_argument("--dimensions", type=int, default=256, help="embedding size")
+    parser.add_argument("--seed", type=int, default=0, help="seeds which requests fail")
+    args = parser.parse_args()
+    app = create_app(args.quota, args.latency, args.error_rate, args.chat_latency, args.token_latency,
+                     args.audio_latency, args.completion_tokens, args.dimensions, args.seed)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
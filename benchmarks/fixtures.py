@@ -0,0 +1,77 @@
+"""Synthetic, seeded inputs for the benchmarks: session recordings, case PDFs and transcripts.
+
+Nothing is stored in the repo; every fixture is generated on demand from a
+seed, so the same seed always gives the same bytes.
+"""
+import random
+import wave
+
+import numpy as np
+
+SYMPTOMS = ["insomnia", "panic attacks", "low mood", "racing thoughts", "fatigue", "irritability", "poor appetite",
+            "intrusive memories", "social withdrawal", "headaches", "palpitations", "nightmares"]
+TREATMENTS = ["CBT", "sertraline", "sleep hygiene", "exposure therapy", "mindfulness", "bupropion", "EMDR", "lithium"]
+
+
+def session_samples(seconds, rate=16000, pause_max=4.0, seed=0):
+    """Float32 samples of a therapy-style session: syllable-modulated noise bursts between pauses."""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * rate)
+    samples = rng.standard_normal(total).astype(np.float32) * 0.001
+    position = int(rng.uniform(0.2, 1) * rate)
+    while True:
+        length = int(rng.uniform(1, 8) * rate)
+        if position + length >= total:
+            break
+        t = np.arange(length) / rate
+        syllables = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3, 5) * t)
+        samples[position:position + length] += rng.standard_normal(length).astype(np.float32) * 0.1 * syllables
+        position += length + int(rng.uniform(0.2, pause_max) * rate)
+    return samples
+
+
+def write_session_wav(path, seconds, rate=16000, seed=0):
+    """A 16-bit mono WAV of ``session_samples``."""
+    samples = np.clip(session_samples(seconds, rate, seed=seed) * 32767, -32768, 32767).astype(np.int16)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+    return path
+
+
+def case_text(seed, paragraphs=3, sentences=15):
+    """Case notes that dwell on a few symptoms for several sentences each, like real notes."""
+    rng = random.Random(seed)
+    return "\n\n".join(
+        " ".join(f"Case {seed}: the {symptom} was discussed again, with {rng.choice(TREATMENTS)} tried for "
+                 f"{rng.randint(2, 12)} weeks." for _ in range(sentences))
+        for symptom in rng.sample(SYMPTOMS, paragraphs)
+    )
+
+
+def transcript_text(seed, lines=60):
+    """A session transcript alternating doctor and patient lines about two symptoms."""
+    rng = random.Random(seed)
+    symptoms = rng.sample(SYMPTOMS, 2)
+    return "\n".join(
+        f"Doctor: How has the {rng.choice(symptoms)} been this week?" if i % 2 == 0 else
+        f"Patient: Worse most days since {rng.choice(TREATMENTS)} was stopped {rng.randint(1, 9)} weeks ago."
+        for i in range(lines)
+    )
+
+
+def write_case_pdf(path, pages, seed=0):
+    """A ReportLab PDF with one page of case notes per page."""
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate
+
+    styles = getSampleStyleSheet()
+    story = []
+    for page in range(pages):
+        for paragraph in case_text(seed * 1000 + page).split("\n\n"):
+            story.append(Paragraph(paragraph, styles["BodyText"]))
+        story.append(PageBreak())
+    SimpleDocTemplate(path).build(story)
+    return path
@@ -0,0 +1,28 @@
+"""LangChain embeddings that send plain text to an OpenAI-compatible ``/v1/embeddings`` endpoint.
+
+LangChain's OpenAIEmbeddings sends tiktoken token ids, and tiktoken downloads
+its vocabulary on first use, so it cannot run offline. The benchmark suite
+starts the backend with ``EMBEDDINGS_BACKEND=http_embeddings:HttpEmbeddings``
+and this directory on ``PYTHONPATH``, so embedding calls still make HTTP
+round trips to the fake server at ``OPENAI_BASE_URL``.
+"""
+from typing import List
+
+import openai
+from langchain.embeddings.base import Embeddings
+
+
+class HttpEmbeddings(Embeddings):
+    def __init__(self, model: str = "text-embedding-3-small"):
+        self.model = model
+        # Retries of 5xx and 429 are left to the SDK, as OpenAIEmbeddings does
+        self.client = openai.OpenAI()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,529 @@
+"""End-to-end benchmark suite: the backend API and Version3 against a fake OpenAI server.
+
+Starts ``fake_openai.py`` (chat, Whisper and embeddings with configurable
+latency and error rate) and points the apps at it, then runs each scenario on
+synthetic fixtures (``fixtures.py``) and prints latency percentiles and
+throughput per scenario:
+
+- conversations: ``POST /conversations/`` and ``GET /conversations/`` under
+  concurrent load, against the backend running under uvicorn
+- index_build: backend start with case PDFs in ``CASES_DIR``, until ``/ready``
+  (``initialize_vector_store``: PDF parsing and embedding over HTTP)
+- record_pipeline: WAV uploads through ``/conversations/{id}/record`` until
+  their jobs finish (needs ffmpeg, on the PATH or from the imageio-ffmpeg
+  package; skipped without either)
+- v3_session: Version3's ``run_new_session`` on a WAV recording, from
+  transcription to the PDF
+- v3_report_pdf: Version3's ``generate_report``
+- v3_upload_parse: Version3's ``handle_uploaded_file`` on PDFs, cold and cached
+
+Scenarios whose optional modules (``benchmarks/requirements.txt``) are not
+installed are reported as skipped.
+
+Results are compared with ``benchmarks/baseline.json`` when it was recorded
+with the same settings: a p50/p95 more than ``--tolerance`` slower, or a
+throughput that much lower, is a regression and the exit status is 1.
+Baselines are only comparable on the machine they were recorded on; record
+one before a change and compare after it:
+
+    python benchmarks/suite.py --save-baseline
+    python benchmarks/suite.py
+    python benchmarks/suite.py --only conversations v3_report_pdf --error-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import importlib.util
+import platform
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+BASELINE_PATH = os.path.join(BENCHMARKS, "baseline.json")
+sys.path.insert(0, BENCHMARKS)
+
+import fixtures  # noqa: E402
+from fake_openai import free_port  # noqa: E402
+
+# (metric, higher is better) compared against the baseline
+COMPARED = (("p50_ms", False), ("p95_ms", False), ("throughput", True))
+# Latency differences smaller than this are noise, whatever the ratio
+NOISE_MS = 5
+# Arguments that change what is measured; a baseline recorded with others is not compared
+SETTINGS = ("latency", "error_rate", "chat_latency", "token_latency", "audio_latency", "concurrency",
+            "conversations", "requests", "case_files", "case_pages", "recordings", "audio_seconds", "sessions",
+            "reports", "uploads", "upload_pages")
+
+
+def summarize(latencies, elapsed, errors=0, work=None, unit="requests"):
+    """Latency percentiles in ms, and ``work`` (by default one per latency) per second of ``elapsed``."""
+    ms = np.asarray(latencies, dtype=float) * 1000
+    result = {"count": len(latencies), "errors": errors}
+    for q in (50, 90, 95, 99):
+        result[f"p{q}_ms"] = round(float(np.percentile(ms, q)), 2) if len(ms) else None
+    result["throughput"] = round((len(latencies) if work is None else work) / elapsed, 3) if elapsed else None
+    result["unit"] = f"{unit}/s"
+    return result
+
+
+async def load(call, count, concurrency):
+    """Run ``call(i)`` for i in range(count), ``concurrency`` at a time.
+
+    Returns the latencies of the calls that succeeded, the wall time and
+    the number of calls that raised, in ``summarize``'s argument order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(i)
+            except Exception as e:
+                errors.append(e)
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    if errors:
+        print(f"  {len(errors)} failed, first: {errors[0]!r}")
+    return latencies, time.perf_counter() - start, len(errors)
+
+
+class Server:
+    """A server in a child process, logging to a file, up once ``health_url`` answers 200."""
+
+    def __init__(self, command, log_path, health_url, env=None, cwd=None, timeout=120):
+        self.log_path = log_path
+        self._log = open(log_path, "ab")
+        self.process = subprocess.Popen(command, stdout=self._log, stderr=subprocess.STDOUT, env=env, cwd=cwd)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if httpx.get(health_url, timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"{command[-1]} did not come up; see {log_path}")
+            time.sleep(0.05)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self._log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def start_fake_openai(args, workspace):
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCHMARKS, "fake_openai.py"), "--port", str(port),
+               "--latency", str(args.latency), "--error-rate", str(args.error_rate),
+               "--chat-latency", str(args.chat_latency), "--token-latency", str(args.token_latency),
+               "--audio-latency", str(args.audio_latency)]
+    server = Server(command, os.path.join(workspace, "fake_openai.log"), f"http://127.0.0.1:{port}/stats")
+    server.base_url = f"http://127.0.0.1:{port}/v1"
+    return server
+
+
+def start_backend(workspace, name, fake, cases_dir=None, search_path=None):
+    """The backend under uvicorn with its data in ``workspace/name``; returns once it serves."""
+    data = os.path.join(workspace, name)
+    os.makedirs(data, exist_ok=True)
+    env = dict(os.environ)
+    for variable, path in (("INDEX_DIR", "index"), ("CONVERSATIONS_DB_PATH", "conversations.db"),
+                           ("EMBEDDING_CACHE_PATH", "embedding_cache.db"), ("JOBS_DB_PATH", "jobs.db"),
+                           ("LLM_CACHE_PATH", "llm_cache.db"), ("SESSION_INDEX_DIR", "session_index"),
+                           ("TRANSLATIONS_DIR", "translations"), ("RECORDINGS_DIR", "recordings")):
+        env[variable] = os.path.join(data, path)
+    env["CASES_DIR"] = cases_dir or os.path.join(data, "cases")
+    os.makedirs(env["CASES_DIR"], exist_ok=True)
+    env.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": fake.base_url,
+        "OPENAI_API_BASE": fake.base_url,
+        "EMBEDDINGS_BACKEND": "http_embeddings:HttpEmbeddings",
+        "PYTHONPATH": os.pathsep.join(filter(None, [BENCHMARKS, env.get("PYTHONPATH")])),
+    })
+    if search_path:
+        env["PATH"] = search_path
+    port = free_port()
+    # uvicorn's keep-alive timer, left running from an earlier response on a reused connection,
+    # closes a job's event stream after 5 quiet seconds
+    command = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", str(port),
+               "--timeout-keep-alive", "600", "main:app"]
+    server = Server(command, os.path.join(data, "backend.log"), f"http://127.0.0.1:{port}/health",
+                    env=env, cwd=os.path.join(ROOT, "backend"))
+    server.url = f"http://127.0.0.1:{port}"
+    return server
+
+
+def wait_ready(url, timeout=600):
+    """Poll ``/ready`` until it answers 200; returns its body."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = httpx.get(f"{url}/ready", timeout=5)
+        if response.status_code == 200:
+            return response.json()
+        if response.json().get("status") == "failed":
+            raise RuntimeError(f"Warm-up failed: {response.json().get('error')}")
+        time.sleep(0.05)
+    raise RuntimeError("Backend was not ready in time")
+
+
+def write_cases(directory, files, pages):
+    os.makedirs(directory, exist_ok=True)
+    for i in range(files):
+        fixtures.write_case_pdf(os.path.join(directory, f"case-{i}.pdf"), pages, seed=i)
+    return directory
+
+
+def conversations(args, workspace, fake):
+    with start_backend(workspace, "conversations", fake) as backend:
+        async def run():
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=backend.url, timeout=60, limits=limits) as client:
+                async def create(i):
+                    response = await client.post("/conversations/",
+                                                 json={"doctor_id": f"doctor-{i % 20}", "patient_id": f"patient-{i % 500}"})
+                    response.raise_for_status()
+
+                async def list_page(i):
+                    # Every other request filters by doctor, as the doctor's own view does
+                    params = {"limit": 50, **({"doctor_id": f"doctor-{i % 20}"} if i % 2 else {})}
+                    response = await client.get("/conversations/", params=params)
+                    response.raise_for_status()
+
+                created = await load(create, args.conversations, args.concurrency)
+                listed = await load(list_page, args.requests, args.concurrency)
+                return created, listed
+
+        created, listed = asyncio.run(run())
+    return {"conversations_create": summarize(*created), "conversations_list": summarize(*listed)}
+
+
+def index_build(args, workspace, fake):
+    cases_dir = write_cases(os.path.join(workspace, "index_cases"), args.case_files, args.case_pages)
+    ready, steps = [], []
+    for run in range(args.index_runs):
+        # A fresh index, embedding cache and text cache every run: a cold build
+        start = time.perf_counter()
+        with start_backend(workspace, f"index_build_{run}", fake, cases_dir) as backend:
+            status = wait_ready(backend.url)
+        ready.append(time.perf_counter() - start)
+        steps.append(status["steps"]["case_index"]["seconds"])
+    pages = args.case_files * args.case_pages * args.index_runs
+    return {
+        "index_build": summarize(steps, sum(steps), work=pages, unit="pages"),
+        "index_build_ready": summarize(ready, sum(ready), unit="starts"),
+    }
+
+
+def ffmpeg_path(workspace):
+    """A PATH on which pydub finds ffmpeg: the system's, else imageio-ffmpeg's binary; None without either."""
+    if shutil.which("ffmpeg"):
+        return os.environ["PATH"]
+    try:
+        import imageio_ffmpeg
+    except ImportError:
+        return None
+    # pydub runs whatever is called ffmpeg on the PATH
+    bin_dir = os.path.join(workspace, "bin")
+    if not os.path.exists(os.path.join(bin_dir, "ffmpeg")):
+        os.makedirs(bin_dir, exist_ok=True)
+        os.symlink(imageio_ffmpeg.get_ffmpeg_exe(), os.path.join(bin_dir, "ffmpeg"))
+    return bin_dir + os.pathsep + os.environ["PATH"]
+
+
+def record_pipeline(args, workspace, fake):
+    search_path = ffmpeg_path(workspace)
+    if search_path is None:
+        return {"record_pipeline": {"skipped": "ffmpeg not found (install it or imageio-ffmpeg)"}}
+    cases_dir = write_cases(os.path.join(workspace, "pipeline_cases"), 5, 2)
+    recordings = os.path.join(workspace, "recordings")
+    os.makedirs(recordings, exist_ok=True)
+    paths = [fixtures.write_session_wav(os.path.join(recordings, f"session-{i}.wav"), args.audio_seconds, seed=i)
+             for i in range(args.recordings)]
+    with start_backend(workspace, "record_pipeline", fake, cases_dir, search_path) as backend:
+        wait_ready(backend.url)
+
+        async def run():
+            critical = []
+            async with httpx.AsyncClient(base_url=backend.url, timeout=600) as client:
+                async def record(i):
+                    conversation = (await client.post("/conversations/", json={"doctor_id": "d", "patient_id": f"p{i}"})).json()
+                    with open(paths[i], "rb") as f:
+                        response = await client.post(f"/conversations/{conversation['id']}/record",
+                                                     files={"file": (os.path.basename(paths[i]), f, "audio/wav")})
+                    response.raise_for_status()
+                    job = response.json()
+                    # The job's event stream ends when it succeeds or fails
+                    async with client.stream("GET", f"/jobs/{job['id']}/events") as events:
+                        async for line in events.aiter_lines():
+                            if line.startswith("data: "):
+                                job = json.loads(line[len("data: "):])
+                    if job["status"] != "succeeded":
+                        raise RuntimeError(f"Job {job['id']} {job['status']}: {job['error']}")
+                    critical.append(job["critical_path"]["seconds"])
+
+                result = await load(record, args.recordings, args.concurrency)
+            return result, critical
+
+        (latencies, elapsed, errors), critical = asyncio.run(run())
+    result = summarize(latencies, elapsed, errors, work=len(latencies) * args.audio_seconds / 60, unit="audio min")
+    result["critical_path_p50_ms"] = round(float(np.median(critical)) * 1000, 2) if critical else None
+    return {"record_pipeline": result}
+
+
+def version3(workspace, fake):
+    """Version3's app module, with its data, caches and OpenAI client pointed into the workspace."""
+    if "app" not in sys.modules:
+        data = os.path.join(workspace, "version3")
+        os.makedirs(data, exist_ok=True)
+        os.environ.update({
+            "OPENAI_API_KEY": "sk-bench",
+            "OPENAI_BASE_URL": fake.base_url,
+            "LLM_CACHE_PATH": os.path.join(data, "llm_cache.db"),
+            "SESSION_INDEX_DIR": os.path.join(data, "session_index"),
+            "REPORT_CACHE_DIR": os.path.join(data, "report_cache"),
+            "PDF_TEXT_CACHE_DIR": os.path.join(data, "pdf_text_cache"),
+        })
+        # The history database is opened relative to the working directory
+        os.chdir(data)
+        sys.path.insert(0, os.path.join(ROOT, "Version3"))
+    import app
+    return app
+
+
+def v3_session(args, workspace, fake):
+    search_path = ffmpeg_path(workspace)
+    if search_path is None:
+        return {"v3_session": {"skipped": "ffmpeg not found (install it or imageio-ffmpeg)"}}
+    # Recordings are decoded and their MP3 chunks encoded by ffmpeg
+    os.environ["PATH"] = search_path
+    app = version3(workspace, fake)
+    recordings = os.path.join(workspace, "v3_recordings")
+    os.makedirs(recordings, exist_ok=True)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for i in range(args.sessions):
+        # Sessions one after another, as one clinician would run them
+        path = fixtures.write_session_wav(os.path.join(recordings, f"session-{i}.wav"), args.audio_seconds, seed=100 + i)
+        session_start = time.perf_counter()
+        try:
+            app.run_new_session("Dr. Lee", f"Patient {i}", "2024-01-01", path, None, "")
+        except Exception as e:
+            print(f"  session {i} failed: {e!r}")
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - session_start)
+    elapsed = time.perf_counter() - start
+    return {"v3_session": summarize(latencies, elapsed, errors, work=len(latencies) * args.audio_seconds / 60,
+                                    unit="audio min")}
+
+
+def v3_report_pdf(args, workspace, fake):
+    app = version3(workspace, fake)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.reports):
+        transcript = fixtures.transcript_text(i, lines=200)
+        summary = "\n".join(["- Insomnia with early waking", "- Possible generalized anxiety disorder"] * 20)
+        report_start = time.perf_counter()
+        app.generate_report(f"Doctor: Lee; Patient: P{i}; Date: 2024-01-01", transcript, summary, i)
+        latencies.append(time.perf_counter() - report_start)
+    return {"v3_report_pdf": summarize(latencies, time.perf_counter() - start, unit="reports")}
+
+
+def v3_upload_parse(args, workspace, fake):
+    app = version3(workspace, fake)
+    uploads = write_cases(os.path.join(workspace, "v3_uploads"), args.uploads, args.upload_pages)
+    files = [SimpleNamespace(name=os.path.join(uploads, name)) for name in sorted(os.listdir(uploads))]
+    results = {}
+    # The second pass finds every file's text in the extraction cache
+    for name in ("v3_upload_parse", "v3_upload_parse_cached"):
+        latencies = []
+        start = time.perf_counter()
+        for file in files:
+            file_start = time.perf_counter()
+            app.handle_uploaded_file(file)
+            latencies.append(time.perf_counter() - file_start)
+        elapsed = time.perf_counter() - start
+        results[name] = summarize(latencies, elapsed, work=len(files) * args.upload_pages, unit="pages")
+    return results
+
+
+SCENARIOS = {
+    "conversations": conversations,
+    "index_build": index_build,
+    "record_pipeline": record_pipeline,
+    "v3_session": v3_session,
+    "v3_report_pdf": v3_report_pdf,
+    "v3_upload_parse": v3_upload_parse,
+}
+# Optional modules a scenario's fixtures or app code needs (benchmarks/requirements.txt); without
+# them the scenario is skipped rather than failing the run
+REQUIRES = {
+    "index_build": ("reportlab", "pypdf"),
+    "record_pipeline": ("reportlab", "pypdf", "pydub"),
+    "v3_session": ("scipy", "reportlab", "pydub"),
+    "v3_report_pdf": ("reportlab",),
+    "v3_upload_parse": ("reportlab", "PyPDF2"),
+}
+
+
+def print_results(results):
+    print(f"{'scenario':<26}{'count':>6}{'err':>5}{'p50 ms':>10}{'p90 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'throughput':>13}")
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:<26}  skipped: {result['skipped']}")
+            continue
+        cells = "".join(f"{result[key]:>10.1f}" if result[key] is not None else f"{'-':>10}"
+                        for key in ("p50_ms", "p90_ms", "p95_ms", "p99_ms"))
+        throughput = f"{result['throughput']:.2f}" if result["throughput"] is not None else "-"
+        print(f"{name:<26}{result['count']:>6}{result['errors']:>5}{cells}{throughput:>13} {result['unit']}")
+
+
+def compare(results, baseline, tolerance):
+    """Print changes beyond ``tolerance`` against the baseline; returns the regressions."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if "skipped" in result or not base or "skipped" in base:
+            continue
+        for metric, higher_is_better in COMPARED:
+            new, old = result.get(metric), base.get(metric)
+            if not new or not old:
+                continue
+            change = new / old - 1
+            worse = -change if higher_is_better else change
+            if abs(change) <= tolerance or (metric.endswith("_ms") and abs(new - old) < NOISE_MS):
+                continue
+            line = f"{name} {metric}: {old:g} -> {new:g} ({change:+.0%})"
+            if worse > 0:
+                regressions.append(line)
+                print(f"  REGRESSION {line}")
+            else:
+                print(f"  improved   {line}")
+    if not regressions:
+        print(f"  no regressions beyond {tolerance:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS), help="scenarios to run (default: all)")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight in the API scenarios")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API round trip per request, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake API requests answered with a 500")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="fake time to the first chat token, seconds")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="fake time per further chat token, seconds")
+    parser.add_argument("--audio-latency", type=float, default=0.01, help="fake Whisper time per second of audio")
+    parser.add_argument("--conversations", type=int, default=500, help="conversations created")
+    parser.add_argument("--requests", type=int, default=500, help="conversation list requests")
+    parser.add_argument("--case-files", type=int, default=10)
+    parser.add_argument("--case-pages", type=int, default=5)
+    parser.add_argument("--index-runs", type=int, default=2)
+    parser.add_argument("--recordings", type=int, default=6)
+    parser.add_argument("--audio-seconds", type=float, default=60, help="length of each synthetic recording")
+    parser.add_argument("--sessions", type=int, default=4, help="Version3 sessions")
+    parser.add_argument("--reports", type=int, default=20, help="Version3 PDF reports")
+    parser.add_argument("--uploads", type=int, default=10, help="Version3 uploaded PDFs")
+    parser.add_argument("--upload-pages", type=int, default=10)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="relative change that counts as a regression")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="keep the workspace (data, logs) for inspection")
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix="bench-suite-")
+    settings = {key: getattr(args, key) for key in SETTINGS}
+    results = {}
+    cwd = os.getcwd()
+    try:
+        with start_fake_openai(args, workspace) as fake:
+            for name in args.only or SCENARIOS:
+                print(f"{name} ...", flush=True)
+                missing = [module for module in REQUIRES.get(name, ()) if importlib.util.find_spec(module) is None]
+                if missing:
+                    results[name] = {"skipped": f"{', '.join(missing)} not installed"}
+                    continue
+                try:
+                    results.update(SCENARIOS[name](args, workspace, fake))
+                except ImportError as e:
+                    results[name] = {"skipped": f"{e.name or e} not installed"}
+            stats = httpx.get(f"{fake.base_url[:-len('/v1')]}/stats").json()
+        if "app" in sys.modules:
+            # Only the worker pools the scenarios started
+            for get in (sys.modules["app"].get_report_renderer, sys.modules["app"].get_pdf_extractor):
+                if get.cache_info().currsize:
+                    get().shutdown()
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"workspace: {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    print()
+    print_results(results)
+    print(f"fake API requests {stats['requests']}, injected errors {stats['errors']}")
+
+    report = {"settings": settings, "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                                                  "cpus": os.cpu_count()}, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    different = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        different = {key: (baseline["settings"].get(key), value) for key, value in settings.items()
+                     if baseline["settings"].get(key) != value}
+        print()
+        if different:
+            print(f"not compared with {os.path.relpath(args.baseline, ROOT)}: recorded with other settings {different}")
+        else:
+            print(f"against {os.path.relpath(args.baseline, ROOT)} (recorded on {baseline['machine']['platform']}, "
+                  f"{baseline['machine']['cpus']} CPUs):")
+            regressions = compare(results, baseline, args.tolerance)
+    if args.save_baseline:
+        if os.path.exists(args.baseline) and not different:
+            # Scenarios not run this time keep their previous numbers
+            report["results"] = {**baseline["results"], **results}
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {os.path.relpath(args.baseline, ROOT)}")
+    sys.exit(1 if regressions and not args.save_baseline else 0)
+
+
+if __name__ == "__main__":
+    main()